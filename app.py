@@ -9,13 +9,16 @@ import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 import sqlite3
 import os
-import re
 from typing import Optional, List, Dict
 
+from fault_index import MATCH_CLEANED, MATCH_EXACT, MATCH_MULTIPLE, MATCH_PARTIAL, MATCH_SIMILAR
+from fault_lookup import FaultCodeIndex, normalize_fault_code
+
 class FaultCodeApp:
     def __init__(self, root):
         self.root = root
         self.db_path = "fault_codes.db"
+        self.index = FaultCodeIndex(self.db_path)
         self.setup_ui()
         self.check_database()
     
@@ -86,6 +89,9 @@ class FaultCodeApp:
         self.results_text.tag_configure('section', font=('Arial', 11, 'bold'), foreground='#A23B72')
         self.results_text.tag_configure('content', font=('Arial', 10), foreground='#2D3436')
         self.results_text.tag_configure('not_found', font=('Arial', 12, 'bold'), foreground='#E17055')
+        self.results_text.tag_configure('link', foreground='#2E86AB', underline=True)
+        self.results_text.tag_bind('link', '<Enter>', lambda event: self.results_text.config(cursor='hand2'))
+        self.results_text.tag_bind('link', '<Leave>', lambda event: self.results_text.config(cursor=''))
         
         # Status bar
         self.status_var = tk.StringVar()
@@ -108,11 +114,8 @@ class FaultCodeApp:
             return
         
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM fault_codes")
-            count = cursor.fetchone()[0]
-            conn.close()
+            count = self.index.count()
+            self.index.ensure_indexes()
             
             if count == 0:
                 self.status_var.set("Database is empty. Please run crawler.py to populate it.")
@@ -133,7 +136,7 @@ class FaultCodeApp:
         search_text = self.search_var.get().strip()
         
         # Enable/disable search button based on input
-        if search_text and re.match(r'^\d{1,5}$', search_text):
+        if search_text and not normalize_fault_code(search_text)[1]:
             self.search_button.config(state='normal')
         else:
             self.search_button.config(state='disabled')
@@ -146,41 +149,24 @@ class FaultCodeApp:
             self.status_var.set("Please enter a fault code")
             return
         
-        # Validate input (should be 1-5 digits)
-        if not re.match(r'^\d{1,5}$', search_text):
-            self.status_var.set("Please enter a valid fault code (1-5 digits)")
+        # Same validation and lookup tiers as the web app: VAG codes with
+        # or without leading zeros, P-codes and pasted VCDS lines
+        fault_code, error = normalize_fault_code(search_text)
+        if error:
+            self.status_var.set(error)
             return
         
-        # Pad with zeros to 5 digits if needed
-        fault_code = search_text.zfill(5)
-        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            match_type, result = self.index.lookup(fault_code)
             
-            # Search for exact match first
-            cursor.execute(
-                "SELECT code, title, full_content, symptoms, causes, solutions, special_notes, technical_info FROM fault_codes WHERE code = ?",
-                (fault_code,)
-            )
-            result = cursor.fetchone()
-            
-            # If no exact match, search for partial matches
-            if not result:
-                cursor.execute(
-                    "SELECT code, title, full_content, symptoms, causes, solutions, special_notes, technical_info FROM fault_codes WHERE code LIKE ?",
-                    (f"%{fault_code}%",)
-                )
-                results = cursor.fetchall()
-                
-                if results:
-                    self.display_multiple_results(results, search_text)
-                else:
-                    self.display_no_results(search_text)
-            else:
+            if match_type in (MATCH_EXACT, MATCH_CLEANED):
                 self.display_single_result(result)
-            
-            conn.close()
+                if match_type == MATCH_CLEANED:
+                    self.status_var.set(f"Showing fault code {result[0]} for '{search_text}'")
+            elif match_type in (MATCH_MULTIPLE, MATCH_PARTIAL, MATCH_SIMILAR):
+                self.display_multiple_results(result, search_text, match_type)
+            else:
+                self.display_no_results(search_text)
             
         except sqlite3.Error as e:
             self.status_var.set("Database error occurred")
@@ -188,7 +174,7 @@ class FaultCodeApp:
     
     def display_single_result(self, result):
         """Display a single fault code result."""
-        code, title, full_content, symptoms, causes, solutions, special_notes, technical_info = result
+        code, title, full_content, symptoms, causes, solutions, special_notes, technical_info = result[:8]
         
         self.results_text.config(state=tk.NORMAL)
         self.results_text.delete(1.0, tk.END)
@@ -235,41 +221,41 @@ class FaultCodeApp:
         self.results_text.config(state=tk.DISABLED)
         self.status_var.set(f"Found fault code: {code}")
     
-    def display_multiple_results(self, results, search_text):
-        """Display multiple fault code results."""
+    def display_multiple_results(self, results, search_text, match_type=MATCH_PARTIAL):
+        """Display a list of fault codes; clicking one opens its record."""
         self.results_text.config(state=tk.NORMAL)
         self.results_text.delete(1.0, tk.END)
         
-        self.results_text.insert(tk.END, f"Multiple results found for '{search_text}':\n\n", 'section')
+        if match_type == MATCH_MULTIPLE:
+            heading = f"Several pages list fault code '{search_text}':"
+        elif match_type == MATCH_SIMILAR:
+            heading = f"No exact match for '{search_text}'. Did you mean one of these similar codes?"
+        else:
+            heading = f"Fault codes containing '{search_text}':"
+        self.results_text.insert(tk.END, f"{heading}\n\n", 'section')
         
-        for i, (code, title, full_content, symptoms, causes, solutions, special_notes, technical_info) in enumerate(results, 1):
-            self.results_text.insert(tk.END, f"{i}. Fault Code: {code}\n", 'title')
+        for i, (code, title, page, record_id) in enumerate(results, 1):
+            tag = f"record-{record_id}"
+            self.results_text.insert(tk.END, f"{i}. Fault Code: {code}", ('link', tag))
+            self.results_text.tag_bind(tag, '<Button-1>', lambda event, record_id=record_id: self.open_record(record_id))
             if title:
-                self.results_text.insert(tk.END, f"   {title}\n", 'title')
-            
-            # Show a preview of available information
-            info_preview = []
-            if symptoms:
-                info_preview.append("Symptoms")
-            if causes:
-                info_preview.append("Causes")
-            if solutions:
-                info_preview.append("Solutions")
-            if special_notes:
-                info_preview.append("Special Notes")
-            if technical_info:
-                info_preview.append("Technical Info")
-            if full_content:
-                info_preview.append("Full Content")
-            
-            if info_preview:
-                self.results_text.insert(tk.END, f"   Available: {', '.join(info_preview)}\n", 'content')
-            
+                self.results_text.insert(tk.END, f" - {title}", 'content')
             self.results_text.insert(tk.END, "\n", 'content')
         
         self.results_text.config(state=tk.DISABLED)
         self.status_var.set(f"Found {len(results)} results for '{search_text}'")
     
+    def open_record(self, record_id):
+        """Display the record of a row id picked from a list of results."""
+        try:
+            found = self.index.record(record_id=record_id)
+        except sqlite3.Error as e:
+            self.status_var.set("Database error occurred")
+            messagebox.showerror("Database Error", f"Error searching database: {e}")
+            return
+        if found:
+            self.display_single_result(found[1])
+    
     def display_no_results(self, search_text):
         """Display no results message."""
         self.results_text.config(state=tk.NORMAL)
@@ -277,7 +263,8 @@ class FaultCodeApp:
         
         self.results_text.insert(tk.END, f"No results found for fault code '{search_text}'\n\n", 'not_found')
         self.results_text.insert(tk.END, "Please check the fault code and try again.\n", 'content')
-        self.results_text.insert(tk.END, "Fault codes are typically 5-digit numbers (e.g., 00532).\n", 'content')
+        self.results_text.insert(tk.END, "Try the other form of the code: the 5-digit VAG code (e.g., 00532) "
+                                         "instead of the P-code, or the other way round.\n", 'content')
         
         self.results_text.config(state=tk.DISABLED)
         self.status_var.set(f"No results found for '{search_text}'")
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Ross-Tech VCDS Fault Codes Web Application - Async (ASGI) Server
+
+Serves the same routes as app_flask.py from an asyncio event loop, for
+kiosk screens and slow mobile clients that hold connections open. Reading
+requests and writing responses happens on the event loop, so an idle or
+slow connection costs a coroutine rather than a thread; only the Flask
+handlers (and with them every SQLite call) run in a small thread pool.
+
+When the pool and its queue are full, new requests get 503 with
+Retry-After right away instead of piling up.
+
+Run with `python app_asgi.py` (needs `pip install uvicorn`) or point any
+ASGI server at `app_asgi:app`.
+"""
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import app_flask
+
+# Threads running Flask handlers, and how many more requests may wait for one
+POOL_SIZE = min(8, (os.cpu_count() or 1) * 2)
+MAX_QUEUED = POOL_SIZE * 4
+RETRY_AFTER_SECONDS = 1
+
+# Request bodies are read into memory before the handler runs; scan
+# reports are the largest legitimate bodies
+MAX_BODY_BYTES = app_flask.MAX_SCAN_REPORT_CHARS * 4
+
+executor = None
+in_flight = 0
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope and body into a WSGI environ."""
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+            continue
+        if name == "CONTENT_LENGTH":
+            continue
+        key = f"HTTP_{name}"
+        if key in environ:
+            separator = "; " if key == "HTTP_COOKIE" else ", "
+            value = environ[key] + separator + value
+        environ[key] = value
+    return environ
+
+
+def call_wsgi(environ):
+    """Run the Flask app for one request. Returns (status, headers, body)."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+    chunks = app_flask.app(environ, start_response)
+    try:
+        body = b"".join(chunks)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    return response["status"], response["headers"], body
+
+
+async def read_body(receive):
+    """Read the request body. Returns None if it is larger than MAX_BODY_BYTES."""
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return bytes(body)
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            return None
+        if not message.get("more_body", False):
+            return bytes(body)
+
+
+async def send_response(send, status, headers, body):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_error(send, status, message, headers=()):
+    body = message.encode("utf-8")
+    await send_response(send, status, [
+        (b"content-type", b"text/plain; charset=utf-8"),
+        (b"content-length", str(len(body)).encode("ascii")),
+        *headers,
+    ], body)
+
+
+def startup():
+    """Create the handler pool, bring the database indexes up to date and warm the caches."""
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="lookup")
+    if os.path.exists(app_flask.DB_PATH):
+        app_flask.fault_code_index().ensure_indexes()
+        app_flask.start_background_tasks()
+
+
+def shutdown():
+    global executor
+    if executor is not None:
+        executor.shutdown(wait=True)
+        executor = None
+    app_flask.stop_background_tasks()
+
+
+async def lifespan(receive, send):
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await loop.run_in_executor(None, startup)
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await loop.run_in_executor(None, shutdown)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point."""
+    global executor, in_flight
+
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    body = await read_body(receive)
+    if body is None:
+        await send_error(send, 413, "Request body too large")
+        return
+
+    # Shed load before queueing: a request that would wait behind a full
+    # queue is better retried than left hanging
+    if in_flight >= POOL_SIZE + MAX_QUEUED:
+        await send_error(send, 503, "Server busy, please retry",
+                         [(b"retry-after", str(RETRY_AFTER_SECONDS).encode("ascii"))])
+        return
+
+    # Servers without lifespan support never call startup()
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="lookup")
+
+    in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        status, headers, response_body = await loop.run_in_executor(
+            executor, call_wsgi, build_environ(scope, body))
+    finally:
+        in_flight -= 1
+
+    await send_response(send, status, headers, response_body)
+
+
+def main():
+    try:
+        import uvicorn
+    except ImportError:
+        print("The async server needs uvicorn: pip install uvicorn")
+        print("Alternatively run 'python app_flask.py' for the built-in server.")
+        return 1
+
+    print("Starting VCDS Fault Code Lookup Server (async)...")
+    print("=" * 40)
+    uvicorn.run(app, host="0.0.0.0", port=5000, timeout_keep_alive=75)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,712 +6,1980 @@ A Flask-based application for searching fault codes offline,
 works on Android via Termux with mobile-friendly UI.
 """
 
-from flask import Flask, request, render_template_string
+from flask import (
+    Flask, abort, g, has_request_context, jsonify, make_response, request, render_template, send_from_directory,
+)
+from markupsafe import Markup, escape
+import atexit
+import gzip
+import hashlib
 import sqlite3
 import os
-import re
+import threading
+from urllib.parse import urlencode
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from fault_index import (
+    FACET_COMPONENT, FACET_KEYS, FACET_SYSTEM, MATCH_CLEANED, MATCH_EXACT, MATCH_MISS, MATCH_MULTIPLE,
+    MATCH_ORDER, MATCH_PARTIAL, MATCH_SIMILAR, has_fts_index, page_cursor, record_to_dict, search_text,
+    summary_to_dict,
+)
+from fault_lookup import CACHE_TTL, FaultCodeIndex, normalize_fault_code
+from lookup_cache import MISSING, LRUCache, SingleFlight, database_version
+import metrics
+from metrics import stage
+from offline_snapshot import SHELL_DIR, build_manifest, database_info_version, shard_body, shard_records
+from miss_queue import MissFetcher, queue_counts
+from popularity import WARM_CODES, PopularityCounter, top_codes
+from scan_report import fault_lookup_keys, parse_scan_report
 
 DB_PATH = "fault_codes.db"
+SEARCH_PAGE_SIZE = 20
+MAX_BATCH_CODES = 500
+MAX_SCAN_REPORT_CHARS = 1024 * 1024
+SCAN_CANDIDATES = 5
 
-app = Flask(__name__)
+# Rendered pages, keyed by normalized query and the database version so
+# they go stale as soon as the database changes (lookup results are cached
+# by the FaultCodeIndex, see fault_lookup.py)
+PAGE_CACHE_SIZE = 256
 
-def query_fault_code(search_text):
-    """Search for a fault code in the database."""
-    if not search_text or not re.match(r'^[A-Za-z0-9]{1,8}$', search_text):
-        return None, "Please enter a valid fault code (1-8 alphanumeric characters)"
+# Response compression for HTML and JSON bodies
+COMPRESS_MIN_BYTES = 512
+COMPRESSIBLE_TYPES = ("text/html", "application/json")
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
 
-    fault_code = search_text.upper().strip()
+# Batch entries that fail input validation are reported with this match type
+MATCH_INVALID = "invalid"
 
-    if not os.path.exists(DB_PATH):
-        return None, "Database not found. Please run crawler.py first."
+# Set FAULT_FETCH_MISSES=0 to only queue missing codes, never fetch them
+FETCH_MISSES = os.environ.get("FAULT_FETCH_MISSES", "1") != "0"
 
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # Exact match
-        cursor.execute(
-            """SELECT code, title, full_content, symptoms, causes, solutions,
-                      special_notes, technical_info
-               FROM fault_codes WHERE code = ?""",
-            (fault_code,)
-        )
-        result = cursor.fetchone()
-
-        # If no exact match, look for partial matches
-        if not result:
-            # First try exact match with cleaned code (remove spaces, brackets, etc.)
-            cleaned_code = re.sub(r'[\[\]\s]+', '', fault_code)
-            cursor.execute(
-                """SELECT code, title FROM fault_codes WHERE code = ?""",
-                (cleaned_code,)
-            )
-            exact_cleaned = cursor.fetchone()
-            
-            if exact_cleaned:
-                conn.close()
-                return exact_cleaned, None
-            
-            # Try partial matches
-            cursor.execute(
-                """SELECT code, title FROM fault_codes WHERE code LIKE ?""",
-                (f"%{fault_code}%",)
-            )
-            results = cursor.fetchall()
-            
-            # Also try with cleaned code
-            if cleaned_code != fault_code:
-                cursor.execute(
-                    """SELECT code, title FROM fault_codes WHERE code LIKE ?""",
-                    (f"%{cleaned_code}%",)
-                )
-                cleaned_results = cursor.fetchall()
-                results.extend(cleaned_results)
-            
-            # Also check for similar codes (last 3-4 characters)
-            if len(fault_code) >= 3:
-                last_chars = fault_code[-3:]
-                cursor.execute(
-                    """SELECT code, title FROM fault_codes WHERE code LIKE ? ORDER BY code LIMIT 10""",
-                    (f"%{last_chars}",)
-                )
-                similar_results = cursor.fetchall()
-            else:
-                similar_results = []
-            
-            conn.close()
-            
-            if results:
-                return results, None
-            elif similar_results:
-                return similar_results, f"No exact match for '{search_text}', but found similar codes ending in '{last_chars}':"
-            else:
-                return None, f"No results found for '{search_text}'. Try searching for just the code number (e.g., 'P1757' instead of 'P1757 00 [237]')."
+# Record sections of the code page in display order (tabs, then the panels
+# below them). Only the first non-empty one is sent with the page; the
+# others are fetched from /section/ when opened.
+PAGE_SECTIONS = ("symptoms", "causes", "solutions", "special_notes", "full_content", "technical_info")
 
-        conn.close()
-        return result, None
+app = Flask(__name__)
 
-    except sqlite3.Error as e:
-        return None, f"Database error: {e}"
+page_cache = LRUCache(PAGE_CACHE_SIZE, CACHE_TTL)
+compressed_cache = LRUCache(PAGE_CACHE_SIZE * 2, CACHE_TTL)
 
-@app.route("/", methods=["GET"])
-def home():
-    code = request.args.get("code", "").strip()
-    result, error = (None, None)
-
-    if code:
-        result, error = query_fault_code(code)
-
-    return render_template_string("""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>VCDS Fault Code Lookup</title>
-        <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">
-        <meta name="theme-color" content="#4A90E2">
-        <meta name="apple-mobile-web-app-capable" content="yes">
-        <meta name="apple-mobile-web-app-status-bar-style" content="default">
-        <style>
-            * {
-                box-sizing: border-box;
-                margin: 0;
-                padding: 0;
-            }
-            
-            body { 
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
-                line-height: 1.5;
-                color: #2C3E50;
-                background: linear-gradient(135deg, #E6F3FF 0%, #F0F8FF 100%);
-                min-height: 100vh;
-                padding: 0;
-                -webkit-font-smoothing: antialiased;
-                -moz-osx-font-smoothing: grayscale;
-            }
-            
-            .container {
-                max-width: 100%;
-                margin: 0;
-                background: #FFFFFF;
-                min-height: 100vh;
-                box-shadow: 0 0 20px rgba(0,0,0,0.1);
-            }
-            
+# Identical requests arriving together (a code shared in the shop chat)
+# wait for the first one's render instead of repeating it; lookups are
+# coalesced the same way by the FaultCodeIndex
+page_flight = SingleFlight()
+page_template = None
+
+# Lookup engine of DB_PATH (see fault_code_index)
+index = None
+index_lock = threading.Lock()
+
+# Lookups per code, flushed to fault_codes_popularity.db in the background
+# and used to warm the caches at startup (see start_background_tasks)
+popularity = PopularityCounter()
+background_started = False
+
+# Codes looked up but not in the database, fetched from the wiki in the
+# background (see miss_queue.py)
+miss_fetcher = MissFetcher()
+
+PAGE_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>VCDS Fault Code Lookup</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">
+    <meta name="theme-color" content="#4A90E2">
+    <meta name="apple-mobile-web-app-capable" content="yes">
+    <meta name="apple-mobile-web-app-status-bar-style" content="default">
+    <style>
+        * {
+            box-sizing: border-box;
+            margin: 0;
+            padding: 0;
+        }
+        
+        body { 
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
+            line-height: 1.5;
+            color: #2C3E50;
+            background: linear-gradient(135deg, #E6F3FF 0%, #F0F8FF 100%);
+            min-height: 100vh;
+            padding: 0;
+            -webkit-font-smoothing: antialiased;
+            -moz-osx-font-smoothing: grayscale;
+        }
+        
+        .container {
+            max-width: 100%;
+            margin: 0;
+            background: #FFFFFF;
+            min-height: 100vh;
+            box-shadow: 0 0 20px rgba(0,0,0,0.1);
+        }
+        
+        .header {
+            background: linear-gradient(135deg, #4A90E2 0%, #357ABD 100%);
+            color: #FFFFFF;
+            padding: 20px 15px;
+            text-align: center;
+            position: sticky;
+            top: 0;
+            z-index: 100;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+        }
+        
+        h1 { 
+            font-size: 1.5rem;
+            font-weight: 700;
+            margin-bottom: 5px;
+            letter-spacing: 0.5px;
+        }
+        
+        .subtitle {
+            font-size: 0.85rem;
+            color: #E6F3FF;
+            font-weight: 400;
+        }
+        
+        .search-section {
+            padding: 20px 15px;
+            background: #F8FAFC;
+            border-bottom: 1px solid #E0E6ED;
+        }
+        
+        .diagnostic-info {
+            background: #E8F4FD;
+            border: 1px solid #B0C4DE;
+            padding: 12px 15px;
+            margin-bottom: 20px;
+            font-size: 0.8rem;
+            color: #2C3E50;
+            border-left: 4px solid #4A90E2;
+            border-radius: 0 4px 4px 0;
+        }
+        
+        .search-form {
+            display: flex;
+            flex-direction: column;
+            gap: 15px;
+        }
+        
+        .search-label {
+            color: #2C3E50;
+            font-weight: 600;
+            font-size: 0.9rem;
+            text-transform: uppercase;
+            letter-spacing: 0.5px;
+        }
+        
+        .input-group {
+            display: flex;
+            gap: 10px;
+            align-items: stretch;
+        }
+        
+        input[type=text] { 
+            flex: 1;
+            padding: 15px 12px;
+            border: 2px solid #E0E6ED;
+            border-radius: 8px;
+            font-size: 16px;
+            font-family: inherit;
+            background: #FFFFFF;
+            color: #2C3E50;
+            outline: none;
+            transition: all 0.3s ease;
+            -webkit-appearance: none;
+        }
+        
+        input[type=text]:focus {
+            border-color: #4A90E2;
+            box-shadow: 0 0 0 3px rgba(74, 144, 226, 0.1);
+            transform: translateY(-1px);
+        }
+        
+        button { 
+            padding: 15px 25px;
+            background: linear-gradient(135deg, #4A90E2 0%, #357ABD 100%);
+            color: #FFFFFF;
+            border: none;
+            border-radius: 8px;
+            font-size: 16px;
+            font-weight: 600;
+            cursor: pointer;
+            font-family: inherit;
+            text-transform: uppercase;
+            letter-spacing: 0.5px;
+            transition: all 0.3s ease;
+            min-width: 80px;
+            -webkit-tap-highlight-color: transparent;
+        }
+        
+        button:hover, button:active {
+            background: linear-gradient(135deg, #357ABD 0%, #2C5F8A 100%);
+            transform: translateY(-1px);
+            box-shadow: 0 4px 12px rgba(74, 144, 226, 0.3);
+        }
+        
+        .error { 
+            color: #D32F2F; 
+            font-weight: 600;
+            background: #FFEBEE;
+            padding: 15px;
+            border-radius: 8px;
+            border-left: 4px solid #D32F2F;
+            margin: 15px 0;
+            font-size: 0.9rem;
+            line-height: 1.4;
+        }
+        
+        .result { 
+            background: #FFFFFF; 
+            margin: 0;
+            overflow: hidden;
+        }
+        
+        .result-header {
+            background: linear-gradient(135deg, #4A90E2 0%, #357ABD 100%);
+            color: #FFFFFF;
+            padding: 20px 15px;
+        }
+        
+        .result-title {
+            font-size: 1.1rem;
+            font-weight: 700;
+            margin-bottom: 8px;
+            line-height: 1.3;
+        }
+        
+        .code-badge {
+            background: rgba(255, 255, 255, 0.2);
+            color: #FFFFFF;
+            padding: 4px 8px;
+            font-weight: 700;
+            font-size: 0.9rem;
+            margin-right: 8px;
+            border-radius: 4px;
+            display: inline-block;
+        }
+        
+        .fault-code-bold {
+            font-weight: 700;
+            background: rgba(255, 255, 255, 0.2);
+            color: #FFFFFF;
+            padding: 2px 6px;
+            border-radius: 3px;
+            font-size: 1em;
+        }
+        
+        .result-content {
+            padding: 0;
+            background: #FFFFFF;
+        }
+        
+        .tab-container {
+            background: #F8FAFC;
+            border-bottom: 1px solid #E0E6ED;
+            padding: 0;
+            margin: 0;
+            overflow-x: auto;
+            -webkit-overflow-scrolling: touch;
+        }
+        
+        .tab-wrapper {
+            display: flex;
+            min-width: max-content;
+        }
+        
+        .tab {
+            display: inline-block;
+            padding: 15px 20px;
+            background: #E0E6ED;
+            color: #2C3E50;
+            border: none;
+            border-right: 1px solid #B0C4DE;
+            cursor: pointer;
+            font-weight: 600;
+            font-size: 0.85rem;
+            text-transform: uppercase;
+            letter-spacing: 0.5px;
+            transition: all 0.3s ease;
+            white-space: nowrap;
+            -webkit-tap-highlight-color: transparent;
+            min-width: 80px;
+            text-align: center;
+        }
+        
+        .tab:hover, .tab:active {
+            background: #D0D6DD;
+        }
+        
+        .tab.active {
+            background: #FFFFFF;
+            color: #4A90E2;
+            border-bottom: 3px solid #4A90E2;
+        }
+        
+        .tab-content {
+            display: none;
+            padding: 20px 15px;
+            background: #FFFFFF;
+            min-height: 120px;
+        }
+        
+        .tab-content.active {
+            display: block;
+        }
+        
+        .section {
+            margin-bottom: 25px;
+            padding-bottom: 20px;
+            border-bottom: 1px solid #F0F0F0;
+        }
+        
+        .section:last-child {
+            border-bottom: none;
+            margin-bottom: 0;
+        }
+        
+        .section-title {
+            font-size: 0.95rem;
+            font-weight: 700;
+            color: #2C3E50;
+            margin-bottom: 12px;
+            text-transform: uppercase;
+            letter-spacing: 0.5px;
+            background: #F8FAFC;
+            padding: 12px 15px;
+            border: 1px solid #E0E6ED;
+            border-left: 4px solid #4A90E2;
+            border-radius: 0 6px 6px 0;
+        }
+        
+        .section-content {
+            color: #2C3E50;
+            line-height: 1.6;
+            font-size: 0.9rem;
+            padding: 0;
+            white-space: pre-wrap;
+            word-wrap: break-word;
+        }
+        
+        .multiple-results {
+            background: #F8FAFC;
+            padding: 20px 15px;
+            border: 1px solid #E0E6ED;
+            margin: 15px;
+            border-radius: 8px;
+        }
+        
+        .multiple-results h3 {
+            color: #2C3E50;
+            margin-bottom: 15px;
+            font-size: 1rem;
+            text-transform: uppercase;
+            letter-spacing: 0.5px;
+        }
+        
+        .multiple-results ul {
+            list-style: none;
+        }
+        
+        .multiple-results li {
+            background: #FFFFFF;
+            padding: 12px 15px;
+            margin-bottom: 8px;
+            border: 1px solid #E0E6ED;
+            border-left: 4px solid #4A90E2;
+            border-radius: 0 6px 6px 0;
+            font-size: 0.9rem;
+            transition: all 0.2s ease;
+        }
+        
+        .multiple-results li:hover {
+            background: #F8FAFC;
+            transform: translateX(2px);
+        }
+        
+        .multiple-results li:last-child {
+            margin-bottom: 0;
+        }
+        
+        .facets {
+            display: flex;
+            flex-direction: column;
+            gap: 8px;
+            font-size: 0.8rem;
+            color: #2C3E50;
+        }
+        
+        .facet-group {
+            display: flex;
+            flex-wrap: wrap;
+            gap: 6px 14px;
+        }
+        
+        .facet-group .search-label {
+            flex-basis: 100%;
+            font-size: 0.75rem;
+        }
+        
+        .facet-count {
+            color: #8896A6;
+        }
+        
+        .mode-toggle {
+            display: flex;
+            gap: 20px;
+            font-size: 0.85rem;
+            font-weight: 600;
+            color: #2C3E50;
+        }
+        
+        .mode-toggle a {
+            color: #4A90E2;
+            text-decoration: none;
+            margin-left: auto;
+        }
+        
+        .mode-toggle a + a {
+            margin-left: 0;
+        }
+        
+        textarea {
+            width: 100%;
+            padding: 12px;
+            border: 2px solid #E0E6ED;
+            border-radius: 8px;
+            font-family: monospace;
+            font-size: 0.8rem;
+            color: #2C3E50;
+            outline: none;
+            resize: vertical;
+        }
+        
+        textarea:focus {
+            border-color: #4A90E2;
+        }
+        
+        .fault-detail {
+            color: #5A6C7D;
+            font-size: 0.8rem;
+            margin-top: 4px;
+        }
+        
+        .prefix-hint {
+            padding: 10px 20px;
+            color: #5A6C7D;
+            font-size: 0.85rem;
+        }
+        
+        .prefix-hint a {
+            color: #4A90E2;
+        }
+        
+        .match-tag {
+            float: right;
+            font-size: 0.7rem;
+            font-weight: 700;
+            text-transform: uppercase;
+            color: #FFFFFF;
+            background: #4A90E2;
+            padding: 2px 6px;
+            border-radius: 3px;
+        }
+        
+        .match-tag.miss {
+            background: #D32F2F;
+        }
+        
+        .hit-link {
+            color: #2C3E50;
+            text-decoration: none;
+            display: block;
+        }
+        
+        .hit-code {
+            font-weight: 700;
+            color: #4A90E2;
+        }
+        
+        .suggestions {
+            list-style: none;
+            margin-top: -10px;
+            border: 2px solid #E0E6ED;
+            border-radius: 8px;
+            background: #FFFFFF;
+            overflow: hidden;
+        }
+        
+        .suggestions a {
+            display: block;
+            padding: 10px 12px;
+            color: #2C3E50;
+            text-decoration: none;
+            font-size: 0.9rem;
+            border-bottom: 1px solid #F0F3F6;
+        }
+        
+        .suggestions li:last-child a {
+            border-bottom: none;
+        }
+        
+        .suggestions a:hover, .suggestions a:focus {
+            background: #E6F3FF;
+        }
+        
+        .snippet {
+            color: #5A6C7D;
+            font-size: 0.85rem;
+            margin-top: 6px;
+            word-wrap: break-word;
+        }
+        
+        .snippet mark {
+            background: #FFF3B0;
+            color: inherit;
+            padding: 0 2px;
+        }
+        
+        .pager {
+            display: flex;
+            justify-content: space-between;
+            margin-top: 15px;
+            font-size: 0.9rem;
+            font-weight: 600;
+        }
+        
+        .pager a {
+            color: #4A90E2;
+            text-decoration: none;
+        }
+        
+        .status-bar {
+            background: #F8FAFC;
+            color: #2C3E50;
+            padding: 12px 15px;
+            border-top: 1px solid #E0E6ED;
+            font-size: 0.8rem;
+            text-align: center;
+            font-weight: 600;
+        }
+        
+        /* Mobile-specific optimizations */
+        @media (max-width: 768px) {
             .header {
-                background: linear-gradient(135deg, #4A90E2 0%, #357ABD 100%);
-                color: #FFFFFF;
-                padding: 20px 15px;
-                text-align: center;
-                position: sticky;
-                top: 0;
-                z-index: 100;
-                box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+                padding: 15px 10px;
             }
             
-            h1 { 
-                font-size: 1.5rem;
-                font-weight: 700;
-                margin-bottom: 5px;
-                letter-spacing: 0.5px;
+            h1 {
+                font-size: 1.3rem;
             }
             
             .subtitle {
-                font-size: 0.85rem;
-                color: #E6F3FF;
-                font-weight: 400;
+                font-size: 0.8rem;
             }
             
             .search-section {
-                padding: 20px 15px;
-                background: #F8FAFC;
-                border-bottom: 1px solid #E0E6ED;
+                padding: 15px 10px;
             }
             
             .diagnostic-info {
-                background: #E8F4FD;
-                border: 1px solid #B0C4DE;
-                padding: 12px 15px;
-                margin-bottom: 20px;
-                font-size: 0.8rem;
-                color: #2C3E50;
-                border-left: 4px solid #4A90E2;
-                border-radius: 0 4px 4px 0;
-            }
-            
-            .search-form {
-                display: flex;
-                flex-direction: column;
-                gap: 15px;
-            }
-            
-            .search-label {
-                color: #2C3E50;
-                font-weight: 600;
-                font-size: 0.9rem;
-                text-transform: uppercase;
-                letter-spacing: 0.5px;
+                font-size: 0.75rem;
+                padding: 10px 12px;
             }
             
             .input-group {
-                display: flex;
-                gap: 10px;
-                align-items: stretch;
-            }
-            
-            input[type=text] { 
-                flex: 1;
-                padding: 15px 12px;
-                border: 2px solid #E0E6ED;
-                border-radius: 8px;
-                font-size: 16px;
-                font-family: inherit;
-                background: #FFFFFF;
-                color: #2C3E50;
-                outline: none;
-                transition: all 0.3s ease;
-                -webkit-appearance: none;
-            }
-            
-            input[type=text]:focus {
-                border-color: #4A90E2;
-                box-shadow: 0 0 0 3px rgba(74, 144, 226, 0.1);
-                transform: translateY(-1px);
-            }
-            
-            button { 
-                padding: 15px 25px;
-                background: linear-gradient(135deg, #4A90E2 0%, #357ABD 100%);
-                color: #FFFFFF;
-                border: none;
-                border-radius: 8px;
-                font-size: 16px;
-                font-weight: 600;
-                cursor: pointer;
-                font-family: inherit;
-                text-transform: uppercase;
-                letter-spacing: 0.5px;
-                transition: all 0.3s ease;
-                min-width: 80px;
-                -webkit-tap-highlight-color: transparent;
-            }
-            
-            button:hover, button:active {
-                background: linear-gradient(135deg, #357ABD 0%, #2C5F8A 100%);
-                transform: translateY(-1px);
-                box-shadow: 0 4px 12px rgba(74, 144, 226, 0.3);
+                flex-direction: column;
             }
             
-            .error { 
-                color: #D32F2F; 
-                font-weight: 600;
-                background: #FFEBEE;
+            button {
                 padding: 15px;
-                border-radius: 8px;
-                border-left: 4px solid #D32F2F;
-                margin: 15px 0;
-                font-size: 0.9rem;
-                line-height: 1.4;
-            }
-            
-            .result { 
-                background: #FFFFFF; 
-                margin: 0;
-                overflow: hidden;
+                font-size: 16px;
             }
             
             .result-header {
-                background: linear-gradient(135deg, #4A90E2 0%, #357ABD 100%);
-                color: #FFFFFF;
-                padding: 20px 15px;
+                padding: 15px 10px;
             }
             
             .result-title {
-                font-size: 1.1rem;
-                font-weight: 700;
-                margin-bottom: 8px;
-                line-height: 1.3;
-            }
-            
-            .code-badge {
-                background: rgba(255, 255, 255, 0.2);
-                color: #FFFFFF;
-                padding: 4px 8px;
-                font-weight: 700;
-                font-size: 0.9rem;
-                margin-right: 8px;
-                border-radius: 4px;
-                display: inline-block;
-            }
-            
-            .fault-code-bold {
-                font-weight: 700;
-                background: rgba(255, 255, 255, 0.2);
-                color: #FFFFFF;
-                padding: 2px 6px;
-                border-radius: 3px;
-                font-size: 1em;
+                font-size: 1rem;
             }
             
-            .result-content {
-                padding: 0;
-                background: #FFFFFF;
+            .tab {
+                padding: 12px 15px;
+                font-size: 0.8rem;
+                min-width: 70px;
             }
             
-            .tab-container {
-                background: #F8FAFC;
-                border-bottom: 1px solid #E0E6ED;
-                padding: 0;
-                margin: 0;
-                overflow-x: auto;
-                -webkit-overflow-scrolling: touch;
+            .tab-content {
+                padding: 15px 10px;
             }
             
-            .tab-wrapper {
-                display: flex;
-                min-width: max-content;
+            .section-title {
+                font-size: 0.85rem;
+                padding: 10px 12px;
             }
             
-            .tab {
-                display: inline-block;
-                padding: 15px 20px;
-                background: #E0E6ED;
-                color: #2C3E50;
-                border: none;
-                border-right: 1px solid #B0C4DE;
-                cursor: pointer;
-                font-weight: 600;
+            .section-content {
                 font-size: 0.85rem;
-                text-transform: uppercase;
-                letter-spacing: 0.5px;
-                transition: all 0.3s ease;
-                white-space: nowrap;
-                -webkit-tap-highlight-color: transparent;
-                min-width: 80px;
-                text-align: center;
             }
             
-            .tab:hover, .tab:active {
-                background: #D0D6DD;
+            .multiple-results {
+                margin: 10px;
+                padding: 15px 10px;
             }
             
-            .tab.active {
-                background: #FFFFFF;
-                color: #4A90E2;
-                border-bottom: 3px solid #4A90E2;
+            .multiple-results li {
+                padding: 10px 12px;
+                font-size: 0.85rem;
             }
-            
-            .tab-content {
-                display: none;
-                padding: 20px 15px;
-                background: #FFFFFF;
-                min-height: 120px;
+        }
+        
+        /* Very small screens */
+        @media (max-width: 480px) {
+            .header {
+                padding: 12px 8px;
             }
             
-            .tab-content.active {
-                display: block;
+            h1 {
+                font-size: 1.2rem;
             }
             
-            .section {
-                margin-bottom: 25px;
-                padding-bottom: 20px;
-                border-bottom: 1px solid #F0F0F0;
+            .search-section {
+                padding: 12px 8px;
             }
             
-            .section:last-child {
-                border-bottom: none;
-                margin-bottom: 0;
+            .tab {
+                padding: 10px 12px;
+                font-size: 0.75rem;
+                min-width: 60px;
             }
             
-            .section-title {
-                font-size: 0.95rem;
-                font-weight: 700;
-                color: #2C3E50;
-                margin-bottom: 12px;
-                text-transform: uppercase;
-                letter-spacing: 0.5px;
-                background: #F8FAFC;
-                padding: 12px 15px;
-                border: 1px solid #E0E6ED;
-                border-left: 4px solid #4A90E2;
-                border-radius: 0 6px 6px 0;
+            .tab-content {
+                padding: 12px 8px;
             }
-            
-            .section-content {
-                color: #2C3E50;
-                line-height: 1.6;
-                font-size: 0.9rem;
-                padding: 0;
-                white-space: pre-wrap;
-                word-wrap: break-word;
+        }
+        
+        /* Touch-friendly improvements */
+        @media (hover: none) and (pointer: coarse) {
+            button, .tab {
+                min-height: 44px;
             }
             
-            .multiple-results {
-                background: #F8FAFC;
-                padding: 20px 15px;
-                border: 1px solid #E0E6ED;
-                margin: 15px;
-                border-radius: 8px;
+            input[type=text] {
+                min-height: 44px;
             }
-            
-            .multiple-results h3 {
-                color: #2C3E50;
-                margin-bottom: 15px;
-                font-size: 1rem;
-                text-transform: uppercase;
-                letter-spacing: 0.5px;
+        }
+    </style>
+    <script>
+        function showTab(tabName) {
+            // Hide all tab contents
+            var tabContents = document.getElementsByClassName('tab-content');
+            for (var i = 0; i < tabContents.length; i++) {
+                tabContents[i].classList.remove('active');
             }
             
-            .multiple-results ul {
-                list-style: none;
+            // Remove active class from all tabs
+            var tabs = document.getElementsByClassName('tab');
+            for (var i = 0; i < tabs.length; i++) {
+                tabs[i].classList.remove('active');
             }
             
-            .multiple-results li {
-                background: #FFFFFF;
-                padding: 12px 15px;
-                margin-bottom: 8px;
-                border: 1px solid #E0E6ED;
-                border-left: 4px solid #4A90E2;
-                border-radius: 0 6px 6px 0;
-                font-size: 0.9rem;
-                transition: all 0.2s ease;
-            }
+            // Show selected tab content
+            document.getElementById(tabName).classList.add('active');
             
-            .multiple-results li:hover {
-                background: #F8FAFC;
-                transform: translateX(2px);
+            // Add active class to clicked tab
+            event.target.classList.add('active');
+
+            loadSection(document.querySelector('#' + tabName + ' .lazy-section'));
+        }
+
+        // Only the first section of a code is in the page; the others are
+        // fetched when their tab is opened or they scroll into view, and
+        // kept for the session (the URL carries the record's content hash)
+        function loadSection(placeholder) {
+            if (!placeholder || placeholder.getAttribute('data-loaded')) {
+                return;
             }
-            
-            .multiple-results li:last-child {
-                margin-bottom: 0;
+            placeholder.setAttribute('data-loaded', '1');
+            var record = placeholder.closest('.result-content');
+            var url = '/section/' + encodeURIComponent(record.getAttribute('data-code')) + '/' +
+                      placeholder.getAttribute('data-section') + '?v=' + record.getAttribute('data-version');
+            if (record.getAttribute('data-record')) {
+                url += '&id=' + record.getAttribute('data-record');
             }
-            
-            .status-bar {
-                background: #F8FAFC;
-                color: #2C3E50;
-                padding: 12px 15px;
-                border-top: 1px solid #E0E6ED;
-                font-size: 0.8rem;
-                text-align: center;
-                font-weight: 600;
+            var cached = null;
+            try {
+                cached = sessionStorage.getItem(url);
+            } catch (e) {}
+            if (cached !== null) {
+                placeholder.innerHTML = cached;
+                return;
             }
-            
-            /* Mobile-specific optimizations */
-            @media (max-width: 768px) {
-                .header {
-                    padding: 15px 10px;
-                }
-                
-                h1 {
-                    font-size: 1.3rem;
-                }
-                
-                .subtitle {
-                    font-size: 0.8rem;
-                }
-                
-                .search-section {
-                    padding: 15px 10px;
-                }
-                
-                .diagnostic-info {
-                    font-size: 0.75rem;
-                    padding: 10px 12px;
-                }
-                
-                .input-group {
-                    flex-direction: column;
-                }
-                
-                button {
-                    padding: 15px;
-                    font-size: 16px;
-                }
-                
-                .result-header {
-                    padding: 15px 10px;
-                }
-                
-                .result-title {
-                    font-size: 1rem;
-                }
-                
-                .tab {
-                    padding: 12px 15px;
-                    font-size: 0.8rem;
-                    min-width: 70px;
+            fetch(url).then(function(response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
                 }
-                
-                .tab-content {
-                    padding: 15px 10px;
-                }
-                
-                .section-title {
-                    font-size: 0.85rem;
-                    padding: 10px 12px;
-                }
-                
-                .section-content {
-                    font-size: 0.85rem;
-                }
-                
-                .multiple-results {
-                    margin: 10px;
-                    padding: 15px 10px;
-                }
-                
-                .multiple-results li {
-                    padding: 10px 12px;
-                    font-size: 0.85rem;
+                return response.text();
+            }).then(function(html) {
+                placeholder.innerHTML = html;
+                try {
+                    sessionStorage.setItem(url, html);
+                } catch (e) {}
+            }).catch(function() {
+                placeholder.removeAttribute('data-loaded');
+                placeholder.textContent = 'COULD NOT LOAD THIS SECTION. TAP TO RETRY.';
+            });
+        }
+
+        document.addEventListener('DOMContentLoaded', function() {
+            var panels = document.querySelectorAll('.section .lazy-section');
+            if (!('IntersectionObserver' in window)) {
+                for (var i = 0; i < panels.length; i++) {
+                    loadSection(panels[i]);
                 }
+                return;
             }
-            
-            /* Very small screens */
-            @media (max-width: 480px) {
-                .header {
-                    padding: 12px 8px;
-                }
-                
-                h1 {
-                    font-size: 1.2rem;
-                }
-                
-                .search-section {
-                    padding: 12px 8px;
-                }
-                
-                .tab {
-                    padding: 10px 12px;
-                    font-size: 0.75rem;
-                    min-width: 60px;
-                }
-                
-                .tab-content {
-                    padding: 12px 8px;
-                }
+            var observer = new IntersectionObserver(function(entries) {
+                entries.forEach(function(entry) {
+                    if (entry.isIntersecting) {
+                        observer.unobserve(entry.target);
+                        loadSection(entry.target);
+                    }
+                });
+            }, {rootMargin: '200px'});
+            for (var i = 0; i < panels.length; i++) {
+                observer.observe(panels[i]);
             }
-            
-            /* Touch-friendly improvements */
-            @media (hover: none) and (pointer: coarse) {
-                button, .tab {
-                    min-height: 44px;
-                }
-                
-                input[type=text] {
-                    min-height: 44px;
+        });
+        
+        // Typeahead for the code box. Suggestions are fetched after a short
+        // pause in typing and kept per prefix; a list that holds every
+        // match of a prefix also answers the longer prefixes typed after it.
+        var SUGGEST_DELAY = 150;
+        var suggestCache = {};
+        var suggestTimer = null;
+        var suggestSeq = 0;
+
+        function cachedSuggestions(query) {
+            for (var length = query.length; length > 0; length--) {
+                var hit = suggestCache[query.slice(0, length)];
+                if (hit && (length === query.length || !hit.more)) {
+                    return hit.codes.filter(function(s) {
+                        return s[0].indexOf(query) === 0;
+                    });
                 }
             }
-        </style>
-        <script>
-            function showTab(tabName) {
-                // Hide all tab contents
-                var tabContents = document.getElementsByClassName('tab-content');
-                for (var i = 0; i < tabContents.length; i++) {
-                    tabContents[i].classList.remove('active');
+            return null;
+        }
+
+        function showSuggestions(list, codes) {
+            list.innerHTML = '';
+            codes.forEach(function(s) {
+                var link = document.createElement('a');
+                link.href = '/?code=' + encodeURIComponent(s[1]);
+                var key = document.createElement('span');
+                key.className = 'hit-code';
+                key.textContent = s[0];
+                link.appendChild(key);
+                // s is [matched key, code, title]; the key is an OBD alias when it differs
+                link.appendChild(document.createTextNode((s[0] !== s[1] ? ' \u2192 ' + s[1] : '') + (s[2] ? ' - ' + s[2] : '')));
+                var item = document.createElement('li');
+                item.appendChild(link);
+                list.appendChild(item);
+            });
+            list.hidden = !codes.length;
+        }
+
+        function suggest(input, list) {
+            var query = input.value.trim().toUpperCase();
+            var textMode = input.form.querySelector('input[name="mode"][value="text"]');
+            if (!/^[A-Z0-9]{1,8}$/.test(query) || (textMode && textMode.checked)) {
+                showSuggestions(list, []);
+                return;
+            }
+            var cached = cachedSuggestions(query);
+            if (cached !== null) {
+                showSuggestions(list, cached);
+                return;
+            }
+            var seq = ++suggestSeq;
+            fetch('/api/complete?q=' + encodeURIComponent(query)).then(function(response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
                 }
-                
-                // Remove active class from all tabs
-                var tabs = document.getElementsByClassName('tab');
-                for (var i = 0; i < tabs.length; i++) {
-                    tabs[i].classList.remove('active');
+                return response.json();
+            }).then(function(data) {
+                suggestCache[query] = data;
+                // Answers to earlier keystrokes that arrive late are not shown
+                if (seq === suggestSeq) {
+                    showSuggestions(list, data.codes);
                 }
-                
-                // Show selected tab content
-                document.getElementById(tabName).classList.add('active');
-                
-                // Add active class to clicked tab
-                event.target.classList.add('active');
+            }).catch(function() {});
+        }
+
+        document.addEventListener('DOMContentLoaded', function() {
+            var list = document.getElementById('suggestions');
+            var input = document.querySelector('input[name="code"]');
+            if (!list || !input) {
+                return;
             }
-            
-            // Auto-focus search input on mobile
-            document.addEventListener('DOMContentLoaded', function() {
-                var searchInput = document.querySelector('input[type="text"]');
-                if (searchInput && window.innerWidth <= 768) {
-                    // Small delay to ensure keyboard doesn't interfere with initial load
-                    setTimeout(function() {
-                        searchInput.focus();
-                    }, 500);
+            input.addEventListener('input', function() {
+                clearTimeout(suggestTimer);
+                suggestTimer = setTimeout(function() {
+                    suggest(input, list);
+                }, SUGGEST_DELAY);
+            });
+            input.addEventListener('keydown', function(event) {
+                if (event.key === 'Escape') {
+                    showSuggestions(list, []);
                 }
             });
-        </script>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>VCDS FAULT CODE LOOKUP</h1>
-                <p class="subtitle">VAG-COM Diagnostic System v1.0</p>
+        });
+
+        // Auto-focus search input on mobile
+        document.addEventListener('DOMContentLoaded', function() {
+            var searchInput = document.querySelector('input[type="text"]');
+            if (searchInput && window.innerWidth <= 768) {
+                // Small delay to ensure keyboard doesn't interfere with initial load
+                setTimeout(function() {
+                    searchInput.focus();
+                }, 500);
+            }
+        });
+    </script>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>VCDS FAULT CODE LOOKUP</h1>
+            <p class="subtitle">VAG-COM Diagnostic System v1.0</p>
+        </div>
+        
+        <div class="search-section">
+            <div class="diagnostic-info">
+                <strong>SYSTEM STATUS:</strong> ONLINE | <strong>CONNECTION:</strong> LOCAL | <strong>DATABASE:</strong> LOADED | <a href="/offline/">INSTALL OFFLINE APP</a>
             </div>
             
-            <div class="search-section">
-                <div class="diagnostic-info">
-                    <strong>SYSTEM STATUS:</strong> ONLINE | <strong>CONNECTION:</strong> LOCAL | <strong>DATABASE:</strong> LOADED
+            {% if mode == 'scan' %}
+            <form method="post" action="/scan" class="search-form">
+                <label class="search-label">VCDS AUTOSCAN REPORT:</label>
+                <textarea name="report" rows="10" placeholder="Paste a full VCDS autoscan (or any text containing fault codes, e.g. P1757 00 [237])" autocomplete="off" autocorrect="off" autocapitalize="off" spellcheck="false">{{report}}</textarea>
+                <button type="submit">SCAN ALL</button>
+                <div class="mode-toggle">
+                    <a href="/">&laquo; SINGLE CODE LOOKUP</a>
+                </div>
+            </form>
+            {% elif mode == 'browse' %}
+            <form method="get" action="/browse" class="search-form">
+                <label class="search-label">CODE RANGE:</label>
+                <div class="input-group">
+                    <input type="text" name="from" placeholder="From (e.g. 00500)" value="{{range_from}}" autocomplete="off" autocorrect="off" autocapitalize="off" spellcheck="false">
+                    <input type="text" name="to" placeholder="To (e.g. 00600)" value="{{range_to}}" autocomplete="off" autocorrect="off" autocapitalize="off" spellcheck="false">
+                    <button type="submit">LIST</button>
                 </div>
-                
-                <form method="get" class="search-form">
-                    <label class="search-label">FAULT CODE:</label>
-                    <div class="input-group">
-                        <input type="text" name="code" placeholder="Enter fault code (e.g. 00532, P0123, B1234)" value="{{code}}" autocomplete="off" autocorrect="off" autocapitalize="off" spellcheck="false">
-                        <button type="submit">SCAN</button>
+                {% if facets %}
+                <div class="facets">
+                    {% for kind, label in facet_kinds %}
+                    <div class="facet-group">
+                        <span class="search-label">{{label}}:</span>
+                        {% for f in facets if f.kind == kind %}
+                        <label><input type="checkbox" name="facet" value="{{f.key}}"{% if f.key in selected_facets %} checked{% endif %}> {{f.label}} <span class="facet-count">({{f.count}})</span></label>
+                        {% endfor %}
                     </div>
-                </form>
-
-                {% if error %}
-                  <div class="error">{{error}}</div>
+                    {% endfor %}
+                </div>
                 {% endif %}
+                <div class="mode-toggle">
+                    <a href="/">&laquo; SINGLE CODE LOOKUP</a>
+                </div>
+            </form>
+            {% else %}
+            <form method="get" action="/" class="search-form">
+                <label class="search-label">{{ 'SYMPTOM / DESCRIPTION:' if mode == 'text' else 'FAULT CODE:' }}</label>
+                <div class="input-group">
+                    <input type="text" name="code" placeholder="Enter fault code (e.g. 00532, P0123, B1234) or symptom (e.g. NOx sensor)" value="{{code}}" autocomplete="off" autocorrect="off" autocapitalize="off" spellcheck="false">
+                    <button type="submit">SCAN</button>
+                </div>
+                <ul class="suggestions" id="suggestions" hidden></ul>
+                <div class="mode-toggle">
+                    <label><input type="radio" name="mode" value="code"{% if mode != 'text' %} checked{% endif %}> CODE</label>
+                    <label><input type="radio" name="mode" value="text"{% if mode == 'text' %} checked{% endif %}> TEXT</label>
+                    <a href="/scan">PASTE SCAN REPORT</a>
+                    <a href="/browse">BROWSE CODES</a>
+                </div>
+            </form>
+            {% endif %}
+
+            {% if error %}
+              <div class="error">{{error}}</div>
+            {% endif %}
 
-                {% if result %}
-                  {% if result[0] is string %}
-                    <div class="result">
-                      <div class="result-header">
-                        <div class="result-title">
-                          FAULT CODE: <span class="code-badge">{{result[0]}}</span>
-                          {% if result[1] and result[1].strip() %}
-                            {% set title = result[1] %}
-                            {% set fault_code = result[0] %}
-                            {% if fault_code in title %}
-                              - {{title.replace(fault_code, '<span class="fault-code-bold">' + fault_code + '</span>')|safe}}
-                            {% else %}
-                              - {{title}}
-                            {% endif %}
-                          {% else %}
-                            - Description not available
+            {% if scan %}
+              <div class="result">
+                <div class="result-header">
+                  <div class="result-title">AUTOSCAN: {{scan_faults}} FAULTS IN {{scan|length}} MODULES</div>
+                </div>
+                <div class="result-content">
+                  {% for module in scan %}
+                    <div class="multiple-results">
+                      <h3>{% if module.address %}ADDRESS {{module.address}}: {{module.module}}{% else %}OTHER CODES{% endif %}</h3>
+                      <ul>
+                      {% for fault in module.faults %}
+                        <li>
+                          <span class="match-tag {{fault.match}}">{{fault.match}}</span>
+                          <a class="hit-link" href="/?code={{fault.code|urlencode}}">
+                            <span class="hit-code">{{fault.vag_code or fault.dtc}}</span>{% if fault.vag_code and fault.dtc %} / {{fault.dtc}}{% endif %}
+                            {% if fault.status %}{{fault.status}} [{{fault.fault_type}}]{% endif %}
+                            - {{fault.title or fault.description or fault.detail or 'Unknown code'}}
+                          </a>
+                          {% if fault.description or fault.detail %}
+                            <div class="fault-detail">{{fault.description}}{% if fault.description and fault.detail %} | {% endif %}{{fault.detail or ''}}</div>
                           {% endif %}
-                        </div>
-                      </div>
-                      <div class="result-content">
-                        {% if result[3] or result[4] or result[5] or result[6] %}
-                          <div class="tab-container">
-                            <div class="tab-wrapper">
-                              {% if result[3] %}
-                                <div class="tab active" onclick="showTab('symptoms-tab')">SYMPTOMS</div>
-                              {% endif %}
-                              {% if result[4] %}
-                                <div class="tab{% if not result[3] %} active{% endif %}" onclick="showTab('causes-tab')">CAUSES</div>
-                              {% endif %}
-                              {% if result[5] %}
-                                <div class="tab{% if not result[3] and not result[4] %} active{% endif %}" onclick="showTab('solutions-tab')">SOLUTIONS</div>
-                              {% endif %}
-                              {% if result[6] %}
-                                <div class="tab{% if not result[3] and not result[4] and not result[5] %} active{% endif %}" onclick="showTab('bonus-tab')">BONUS NOTES</div>
-                              {% endif %}
-                            </div>
-                          </div>
-                          
+                          {% if fault.candidates %}
+                            <div class="fault-detail">{% if fault.match == 'multiple' %}Listed on{% else %}Closest codes{% endif %}: {% for c in fault.candidates %}<a href="{{record_href(c.page, c.id) if fault.match == 'multiple' else '/?code=' ~ (c.code|urlencode)}}">{{c.code}}</a>{% if not loop.last %}, {% endif %}{% endfor %}</div>
+                          {% endif %}
+                        </li>
+                      {% endfor %}
+                      </ul>
+                    </div>
+                  {% endfor %}
+                </div>
+                <div class="status-bar">
+                  AUTOSCAN COMPLETE | {{scan_faults}} FAULTS RESOLVED IN ONE LOOKUP
+                </div>
+              </div>
+            {% endif %}
+
+            {% if hits %}
+              <div class="result">
+                <div class="result-header">
+                  <div class="result-title">TEXT SEARCH RESULTS FOR '{{code}}'</div>
+                </div>
+                <div class="result-content">
+                  <div class="multiple-results">
+                    <h3>SHOWING {{first_hit}}-{{first_hit + hits|length - 1}} OF {{total}} MATCHING CODES:</h3>
+                    <ul>
+                    {% for hit in hits %}
+                      <li>
+                        <a class="hit-link" href="{{record_href(hit.page, hit.id)}}">
+                          <span class="hit-code">{{hit.code}}</span> - {{hit.title}}
+                          <div class="snippet">{{hit.snippet|safe}}</div>
+                        </a>
+                      </li>
+                    {% endfor %}
+                    </ul>
+                    <div class="pager">
+                      <span>{% if page > 1 %}<a href="/search?q={{code|urlencode}}&page={{page - 1}}">&laquo; PREV</a>{% endif %}</span>
+                      <span>PAGE {{page}} / {{pages}}</span>
+                      <span>{% if page < pages %}<a href="/search?q={{code|urlencode}}&page={{page + 1}}">NEXT &raquo;</a>{% endif %}</span>
+                    </div>
+                  </div>
+                </div>
+                <div class="status-bar">
+                  SEARCH COMPLETE | {{total}} CODES MATCHED | RANKED BY RELEVANCE
+                </div>
+              </div>
+            {% endif %}
+
+            {% if listing %}
+              <div class="result">
+                <div class="result-header">
+                  <div class="result-title">CODES {{range_from or 'FIRST'}} TO {{range_to or 'LAST'}}{% if selected_facets %} | {{selected_facets|join(' + ')|upper}}{% endif %}</div>
+                </div>
+                <div class="result-content">
+                  <div class="multiple-results">
+                    <h3>{{paging.total}}{% if not paging.total_exact %}+{% endif %} CODES IN RANGE{% if paging.after %}, AFTER {{paging.after.partition(':')[0]}}{% endif %}:</h3>
+                    <ul>
+                    {% for r in listing %}
+                      <li><a class="hit-link" href="{{record_href(r[2], r[3])}}"><span class="code-badge">{{r[0]}}</span> - {{r[1]}}</a></li>
+                    {% endfor %}
+                    </ul>
+                    <div class="pager">
+                      <span>{% if paging.after %}<a href="/browse?from={{range_from|urlencode}}&to={{range_to|urlencode}}{{facet_query}}">&laquo; FIRST</a>{% endif %}</span>
+                      <span>{{listing[0][0]}} - {{listing[-1][0]}}</span>
+                      <span>{% if paging.next %}<a href="/browse?from={{range_from|urlencode}}&to={{range_to|urlencode}}{{facet_query}}&after={{paging.next|urlencode}}">NEXT &raquo;</a>{% endif %}</span>
+                    </div>
+                  </div>
+                </div>
+                <div class="status-bar">
+                  BROWSE COMPLETE | SORTED BY CODE | SELECT SPECIFIC CODE
+                </div>
+              </div>
+            {% endif %}
+
+            {% if result %}
+              {% if result[0] is string %}
+                <div class="result">
+                  <div class="result-header">
+                    <div class="result-title">
+                      FAULT CODE: <span class="code-badge">{{result[0]}}</span>
+                      {% if result[1] and result[1].strip() %}
+                        {% set title = result[1] %}
+                        {% set fault_code = result[0] %}
+                        {% if fault_code in title %}
+                          - {{title.replace(fault_code, '<span class="fault-code-bold">' + fault_code + '</span>')|safe}}
+                        {% else %}
+                          - {{title}}
+                        {% endif %}
+                      {% else %}
+                        - Description not available
+                      {% endif %}
+                    </div>
+                  </div>
+                  {% macro section_body(name) %}
+                    {% if name == inline_section %}
+                      <div class="section-content">{{inline_html}}</div>
+                    {% else %}
+                      <div class="section-content lazy-section" data-section="{{name}}" onclick="loadSection(this)">LOADING...</div>
+                    {% endif %}
+                  {% endmacro %}
+                  <div class="result-content" data-code="{{result[0]}}" data-version="{{result[8] or ''}}" data-record="{{record_id or ''}}">
+                    {% if result[3] or result[4] or result[5] or result[6] %}
+                      <div class="tab-container">
+                        <div class="tab-wrapper">
                           {% if result[3] %}
-                            <div id="symptoms-tab" class="tab-content active">
-                              <div class="section-content">{{result[3]}}</div>
-                            </div>
+                            <div class="tab active" onclick="showTab('symptoms-tab')">SYMPTOMS</div>
                           {% endif %}
                           {% if result[4] %}
-                            <div id="causes-tab" class="tab-content{% if not result[3] %} active{% endif %}">
-                              <div class="section-content">{{result[4]}}</div>
-                            </div>
+                            <div class="tab{% if not result[3] %} active{% endif %}" onclick="showTab('causes-tab')">CAUSES</div>
                           {% endif %}
                           {% if result[5] %}
-                            <div id="solutions-tab" class="tab-content{% if not result[3] and not result[4] %} active{% endif %}">
-                              <div class="section-content">{{result[5]}}</div>
-                            </div>
+                            <div class="tab{% if not result[3] and not result[4] %} active{% endif %}" onclick="showTab('solutions-tab')">SOLUTIONS</div>
                           {% endif %}
                           {% if result[6] %}
-                            <div id="bonus-tab" class="tab-content{% if not result[3] and not result[4] and not result[5] %} active{% endif %}">
-                              <div class="section-content">{{result[6]}}</div>
-                            </div>
+                            <div class="tab{% if not result[3] and not result[4] and not result[5] %} active{% endif %}" onclick="showTab('bonus-tab')">BONUS NOTES</div>
                           {% endif %}
-                        {% endif %}
-                        
-                        {% if result[2] %}
-                          <div class="section">
-                            <div class="section-title">FULL INFORMATION</div>
-                            <div class="section-content">
-                              {% set full_info = result[2] %}
-                              {% set fault_code = result[0] %}
-                              {% if fault_code in full_info %}
-                                {{full_info.replace(fault_code, '<strong>' + fault_code + '</strong>')|safe}}
-                              {% else %}
-                                {{full_info}}
-                              {% endif %}
-                            </div>
-                          </div>
-                        {% endif %}
-                        {% if result[7] %}
-                          <div class="section">
-                            <div class="section-title">TECHNICAL INFORMATION</div>
-                            <div class="section-content">{{result[7]}}</div>
-                          </div>
-                        {% endif %}
-                      </div>
-                      <div class="status-bar">
-                        SCAN COMPLETE | FAULT CODE: {{result[0]}} | STATUS: ANALYZED
-                      </div>
-                    </div>
-                  {% else %}
-                    <div class="result">
-                      <div class="result-header">
-                        <div class="result-title">MULTIPLE RESULTS FOR '{{code}}'</div>
+                        </div>
                       </div>
-                      <div class="result-content">
-                        <div class="multiple-results">
-                          <h3>FOUND {{result|length}} MATCHING CODES:</h3>
-                          <ul>
-                          {% for r in result %}
-                            <li><span class="code-badge">{{r[0]}}</span> - {{r[1]}}</li>
-                          {% endfor %}
-                          </ul>
+                      
+                      {% if result[3] %}
+                        <div id="symptoms-tab" class="tab-content active">
+                          {{ section_body('symptoms') }}
+                        </div>
+                      {% endif %}
+                      {% if result[4] %}
+                        <div id="causes-tab" class="tab-content{% if not result[3] %} active{% endif %}">
+                          {{ section_body('causes') }}
                         </div>
+                      {% endif %}
+                      {% if result[5] %}
+                        <div id="solutions-tab" class="tab-content{% if not result[3] and not result[4] %} active{% endif %}">
+                          {{ section_body('solutions') }}
+                        </div>
+                      {% endif %}
+                      {% if result[6] %}
+                        <div id="bonus-tab" class="tab-content{% if not result[3] and not result[4] and not result[5] %} active{% endif %}">
+                          {{ section_body('special_notes') }}
+                        </div>
+                      {% endif %}
+                    {% endif %}
+                    
+                    {% if result[2] %}
+                      <div class="section">
+                        <div class="section-title">FULL INFORMATION</div>
+                        {{ section_body('full_content') }}
                       </div>
-                      <div class="status-bar">
-                        SCAN COMPLETE | MULTIPLE MATCHES FOUND | SELECT SPECIFIC CODE
+                    {% endif %}
+                    {% if result[7] %}
+                      <div class="section">
+                        <div class="section-title">TECHNICAL INFORMATION</div>
+                        {{ section_body('technical_info') }}
                       </div>
-                    </div>
+                    {% endif %}
+                  </div>
+                  {% if prefix_href %}
+                    <div class="prefix-hint">Showing {{result[0]}} for '{{code}}'. <a href="{{prefix_href}}">Other codes starting with {{code}} &raquo;</a></div>
                   {% endif %}
-                {% endif %}
-            </div>
+                  <div class="status-bar">
+                    SCAN COMPLETE | FAULT CODE: {{result[0]}} | STATUS: ANALYZED
+                  </div>
+                </div>
+              {% else %}
+                <div class="result">
+                  <div class="result-header">
+                    <div class="result-title">MULTIPLE RESULTS FOR '{{code}}'</div>
+                  </div>
+                  <div class="result-content">
+                    <div class="multiple-results">
+                      {% if paging %}
+                        <h3>FOUND {{paging.total}}{% if not paging.total_exact %}+{% endif %} MATCHING CODES{% if paging.after %}, AFTER {{paging.after.partition(':')[0]}}{% endif %}:</h3>
+                      {% else %}
+                        <h3>FOUND {{result|length}} MATCHING CODES:</h3>
+                      {% endif %}
+                      <ul>
+                      {% for r in result %}
+                        <li><a class="hit-link" href="{{record_href(r[2], r[3]) if match_type == 'multiple' else '/?code=' ~ (r[0]|urlencode)}}"><span class="code-badge">{{r[0]}}</span> - {{r[1]}}</a></li>
+                      {% endfor %}
+                      </ul>
+                      {% if paging and (paging.after or paging.next) %}
+                        <div class="pager">
+                          <span>{% if paging.after %}<a href="/?code={{code|urlencode}}">&laquo; FIRST</a>{% endif %}</span>
+                          <span>{{result[0][0]}} - {{result[-1][0]}}</span>
+                          <span>{% if paging.next %}<a href="/?code={{code|urlencode}}&after={{paging.next|urlencode}}">NEXT &raquo;</a>{% endif %}</span>
+                        </div>
+                      {% endif %}
+                    </div>
+                  </div>
+                  <div class="status-bar">
+                    SCAN COMPLETE | MULTIPLE MATCHES FOUND | SELECT SPECIFIC CODE
+                  </div>
+                </div>
+              {% endif %}
+            {% endif %}
         </div>
-    </body>
-    </html>
-    """, code=code, result=result, error=error)
+    </div>
+</body>
+</html>
+"""
 
-if __name__ == "__main__":
+# Part of every page ETag, so template changes invalidate cached copies
+PAGE_TEMPLATE_DIGEST = hashlib.sha1(PAGE_TEMPLATE.encode("utf-8")).hexdigest()[:12]
+
+
+def render_page(**context):
+    """Render the page template, compiling it only once per process."""
+    global page_template
+    if page_template is None:
+        page_template = app.jinja_env.from_string(PAGE_TEMPLATE)
+    with stage("render"):
+        return render_template(page_template, record_href=record_href, **context)
+
+def fault_code_index():
+    """Return the FaultCodeIndex of DB_PATH.
+
+    A new one (with empty caches) is made when DB_PATH is pointed at
+    another database, as the tests and bench_lookup.py do.
+    """
+    global index
+    current = index
+    if current is None or current.db_path != DB_PATH:
+        with index_lock:
+            if index is None or index.db_path != DB_PATH:
+                index = FaultCodeIndex(DB_PATH)
+            current = index
+    return current
+
+def current_version():
+    """Return the database version token (one stat of the db and its WAL)."""
+    return fault_code_index().version()
+
+def normalize_cursor(value):
+    """Normalize an optional code parameter (a range bound).
+
+    Returns None when it is missing or not a valid code.
+    """
+    fault_code, error = normalize_fault_code((value or "").strip())
+    return None if error else fault_code
+
+def normalize_page_cursor(value):
+    """Normalize an optional page cursor: a code and row id (see page_cursor), or a bare code.
+
+    Returns None when it is missing or invalid.
+    """
+    code, separator, code_id = (value or "").strip().partition(":")
+    code = normalize_cursor(code)
+    if code is None or (separator and not code_id.isdigit()):
+        return None
+    return page_cursor(code, int(code_id)) if separator else code
+
+def lookup_message(match_type, text, fault_code):
+    """Explain a similar-code or missing lookup result to the user."""
+    if match_type == MATCH_SIMILAR:
+        return f"No exact match for '{text}'. Did you mean one of these similar codes?"
+    if match_type == MATCH_MISS:
+        return f"No results found for '{text}'. Try the other form of the code (the 5-digit VAG code instead of the P-code, or the other way round)."
+    return None
+
+def load_shared_index(index_path):
+    """Use a prebuilt shared index for exact and cleaned lookups in this process."""
+    return fault_code_index().load_shared_index(index_path)
+
+def cached_lookups(fault_codes, count=True):
+    """Resolve normalized codes through the FaultCodeIndex (see FaultCodeIndex.lookup_many).
+
+    Codes resolving to a record are counted as popular, and codes without
+    a match are queued for fetching, unless count is False. Returns a dict of code -> (match_type, result). Raises
+    sqlite3.Error.
+    """
+    resolved = fault_code_index().lookup_many(fault_codes)
+    for fault_code, (match_type, result) in resolved.items():
+        metrics.record_match(fault_code, match_type)
+        # Noted once per request, however often a code is resolved (see finish_timing)
+        if count and has_request_context():
+            if match_type in (MATCH_EXACT, MATCH_CLEANED):
+                g.setdefault("popular_codes", set()).add(result[0])
+            elif match_type in (MATCH_SIMILAR, MATCH_MISS):
+                g.setdefault("missed_codes", set()).add(fault_code)
+    return resolved
+
+def cached_page(key, render):
+    """Return a rendered page from the page cache, rendering it on a miss.
+
+    Pages are not cached when the key is None (invalid input, no database).
+    Concurrent misses for the same key share one render.
+    """
+    if key is None:
+        return render()
+    page = page_cache.get(key)
+    if page is MISSING:
+        def render_and_cache():
+            page = render()
+            page_cache.set(key, page)
+            return page
+        page = page_flight.do(key, render_and_cache)
+    return page
+
+def page_etag(*parts):
+    """Build a strong ETag value from the template digest and the page inputs."""
+    basis = ":".join([PAGE_TEMPLATE_DIGEST] + [str(part) for part in parts])
+    return hashlib.sha1(basis.encode("utf-8")).hexdigest()
+
+def code_page_etag(fault_code, version, after=None):
+    """ETag of a code page.
+
+    Exact matches are identified by the content hash stored with the
+    record, so the ETag survives unrelated database updates; other
+    outcomes (lists, misses) change with the database version.
+    """
+    try:
+        match_type, result = cached_lookups([fault_code])[fault_code]
+    except sqlite3.Error:
+        return None
+    if match_type == MATCH_EXACT and result[8]:
+        return page_etag("record", fault_code, result[8])
+    return page_etag("code", fault_code, after, version)
+
+def section_html(record, name):
+    """Render one section of a record as an escaped HTML fragment.
+
+    The code itself is highlighted in the full information text.
+    """
+    fault_code, text = record['code'], record[name] or ""
+    if name == "full_content" and fault_code:
+        return Markup(escape(text).replace(escape(fault_code), Markup("<strong>%s</strong>") % fault_code))
+    return escape(text)
+
+def first_section(result):
+    """Return (name, html) of the section shown when a code page opens."""
+    record = record_to_dict(result)
+    for name in PAGE_SECTIONS:
+        if record[name]:
+            return name, section_html(record, name)
+    return None, None
+
+def conditional_page(key, etag, render):
+    """Serve a page from the cache with an ETag, or 304 if the client has it.
+
+    A matching If-None-Match (for any encoding of the page) is answered
+    without rendering.
+    """
+    if etag:
+        for variant in (etag, f"{etag}-br", f"{etag}-gzip"):
+            if request.if_none_match.contains(variant):
+                response = make_response("", 304)
+                response.set_etag(variant)
+                response.vary.add("Accept-Encoding")
+                return response
+
+    response = make_response(cached_page(key, render))
+    if etag:
+        response.set_etag(etag)
+    return response
+
+def render_code_page(code, after=None):
+    """Render the home page, or the result page of a code."""
+    result, error, paging, match_type = query_fault_code(code, after) if code else (None, None, None, None)
+    inline_section, inline_html = first_section(result) if result and isinstance(result[0], str) else (None, None)
+    found = match_type in (MATCH_EXACT, MATCH_CLEANED)
+    prefix_href = prefix_browse_href(code) if found and result[0] != code else None
+    # Sections are loaded by row id, as other pages may share the record's code
+    return render_page(code=code, result=result, error=error, mode="code", paging=paging, match_type=match_type,
+                       record_id=result[9] if found else None, inline_section=inline_section,
+                       inline_html=inline_html, prefix_href=prefix_href)
+
+def prefix_browse_href(code):
+    """Link to the codes starting with a 3 or 4 digit input, which opens the code it pads to ("0120" is 00120).
+
+    Returns None for other input. Codes are at most 8 characters, so the
+    range ends at the prefix followed by Zs.
+    """
+    if not (code.isdigit() and 3 <= len(code) <= 4):
+        return None
+    return "/browse?" + urlencode({'from': code, 'to': code.ljust(8, "Z")})
+
+def record_href(page, record_id):
+    """Link to one record: by its page name, or by row id for records saved before pages were recorded."""
+    return "/?" + urlencode({'page': page} if page else {'id': record_id})
+
+def query_record(page=None, record_id=None):
+    """Fetch the record of a wiki page, or of a row id. Returns (record_id, result, error)."""
+    if not os.path.exists(DB_PATH):
+        return None, None, "Database not found. Please run crawler.py first."
+    try:
+        found = fault_code_index().record(page, record_id)
+    except sqlite3.Error as e:
+        return None, None, f"Database error: {e}"
+    if not found:
+        return None, None, "This record is no longer in the database. Please search for its code."
+    return found[0], found[1], None
+
+def render_record_page(page=None, record_id=None):
+    """Render the page of one record, picked from a list of records sharing a code."""
+    record_id, result, error = query_record(page, record_id)
+    inline_section, inline_html = first_section(result) if result else (None, None)
+    return render_page(code=result[0] if result else "", result=result, error=error, mode="code",
+                       record_id=record_id, inline_section=inline_section, inline_html=inline_html)
+
+def warm_caches(limit=WARM_CODES):
+    """Build the code filter and the autocomplete index, and preload the records and pages of the most
+    looked-up codes.
+
+    Reading them also pulls their database pages into the OS cache, so
+    the first requests after a restart are served like later ones.
+    Returns the number of codes warmed.
+    """
+    version = current_version()
+    if not version:
+        return 0
+    try:
+        fault_code_index().load_code_filter(version)
+        fault_code_index().completer(version)
+        codes = top_codes(DB_PATH, limit)
+        with app.app_context():
+            cached_page(("code", "", None, version), lambda: render_code_page(""))
+            if codes:
+                cached_lookups(codes, count=False)
+            for fault_code in codes:
+                cached_page(("code", fault_code, None, version), lambda: render_code_page(fault_code))
+    except sqlite3.Error:
+        return 0
+    return len(codes)
+
+def flush_popularity():
+    """Write the lookup counts gathered so far to the side table."""
+    return popularity.flush(DB_PATH)
+
+def start_background_tasks(warm_limit=WARM_CODES):
+    """Start the periodic popularity flush and the missing code fetcher, and
+    warm the caches in the background.
+
+    Called once per serving process; counts left at exit are flushed.
+    """
+    global background_started
+    if background_started:
+        return
+    background_started = True
+    popularity.start(lambda: DB_PATH)
+    miss_fetcher.start(lambda: DB_PATH, fetch=FETCH_MISSES)
+    atexit.register(stop_background_tasks)
+    if warm_limit:
+        threading.Thread(target=warm_caches, args=(warm_limit,), name="cache-warmup", daemon=True).start()
+
+def stop_background_tasks():
+    """Stop the background tasks and write the remaining counts and misses."""
+    popularity.stop(DB_PATH)
+    miss_fetcher.stop(DB_PATH)
+
+def query_partial_page(fault_code, after=None, rows=None):
+    """Fetch one page of the partial matches of a code (see FaultCodeIndex.partial_page).
+
+    Raises sqlite3.Error.
+    """
+    return fault_code_index().partial_page(fault_code, after, rows)
+
+def query_fault_code(text, after=None):
+    """Search for a fault code in the database.
+
+    Returns (result, error, paging, match_type); paging describes the page
+    shown when the result is a list of partial matches (see
+    query_partial_page).
+    """
+    fault_code, error = normalize_fault_code(text)
+    if error:
+        return None, error, None, None
+
+    if not os.path.exists(DB_PATH):
+        return None, "Database not found. Please run crawler.py first.", None, None
+
+    try:
+        match_type, result = cached_lookups([fault_code])[fault_code]
+
+        paging = None
+        if match_type == MATCH_PARTIAL:
+            result, paging = query_partial_page(fault_code, after, result)
+            if not result:
+                return None, f"No more codes containing '{fault_code}' after {after.partition(':')[0]}.", None, match_type
+
+        return result, lookup_message(match_type, text, fault_code), paging, match_type
+
+    except sqlite3.Error as e:
+        return None, f"Database error: {e}", None, None
+
+def lookup_entry(text, fault_code, match_type, result):
+    """Build the JSON representation of one lookup result."""
+    entry = {'query': text, 'code': fault_code, 'match': match_type}
+    if match_type in (MATCH_EXACT, MATCH_CLEANED):
+        entry['result'] = record_to_dict(result)
+    elif match_type in (MATCH_MULTIPLE, MATCH_PARTIAL, MATCH_SIMILAR):
+        entry['candidates'] = [summary_to_dict(row) for row in result]
+    message = lookup_message(match_type, text, fault_code)
+    if message:
+        entry['message'] = message
+    return entry
+
+def query_fault_codes(texts):
+    """Look up a batch of codes with one set of queries. Returns (entries, error)."""
+    if not os.path.exists(DB_PATH):
+        return None, "Database not found. Please run crawler.py first."
+
+    entries = [None] * len(texts)
+    valid = []
+    for i, text in enumerate(texts):
+        fault_code, error = normalize_fault_code(text if isinstance(text, str) else "")
+        if error:
+            entries[i] = {'query': text, 'match': MATCH_INVALID, 'message': error}
+        else:
+            valid.append((i, text, fault_code))
+
+    try:
+        lookups = cached_lookups([fault_code for _, _, fault_code in valid])
+    except sqlite3.Error as e:
+        return None, f"Database error: {e}"
+
+    for i, text, fault_code in valid:
+        match_type, result = lookups[fault_code]
+        entries[i] = lookup_entry(text, fault_code, match_type, result)
+    return entries, None
+
+def query_scan_report(report):
+    """Extract every fault from an autoscan log and resolve them in one batch.
+
+    Returns (modules, fault_count, error); each fault gets the match type,
+    code and title of the best lookup among its VAG and OBD codes.
+    """
+    if not report or not report.strip():
+        return [], 0, "Please paste a VCDS autoscan report"
+    if len(report) > MAX_SCAN_REPORT_CHARS:
+        return [], 0, f"Scan report is too large (limit {MAX_SCAN_REPORT_CHARS // 1024} KB)"
+
+    with stage("parse"):
+        modules = parse_scan_report(report)
+    faults = [fault for module in modules for fault in module['faults']]
+    if not faults:
+        return [], 0, "No fault codes found in the pasted text"
+
+    if not os.path.exists(DB_PATH):
+        return [], 0, "Database not found. Please run crawler.py first."
+
+    fault_keys = []
+    for fault in faults:
+        keys = [normalize_fault_code(key)[0] for key in fault_lookup_keys(fault)]
+        fault_keys.append([key for key in keys if key])
+    unique_keys = list(dict.fromkeys(key for keys in fault_keys for key in keys))
+
+    try:
+        lookups = cached_lookups(unique_keys)
+    except sqlite3.Error as e:
+        return [], 0, f"Database error: {e}"
+
+    for fault, keys in zip(faults, fault_keys):
+        fault.update(code=keys[0] if keys else None, match=MATCH_MISS, title=None, candidates=[])
+        if not keys:
+            continue
+
+        best = min(keys, key=lambda key: MATCH_ORDER.index(lookups[key][0]))
+        match_type, result = lookups[best]
+        fault['match'] = match_type
+        if match_type in (MATCH_EXACT, MATCH_CLEANED):
+            fault['code'], fault['title'] = result[0], result[1]
+        elif match_type in (MATCH_MULTIPLE, MATCH_PARTIAL, MATCH_SIMILAR):
+            fault['code'] = best
+            fault['candidates'] = [summary_to_dict(row) for row in result[:SCAN_CANDIDATES]]
+
+    return modules, len(faults), None
+
+def query_browse(start, end, after=None, facets=()):
+    """List the codes from start to end (filed under all of facets) one page at a time.
+
+    Returns (rows, paging, error); paging has the same keys as for
+    partial matches (see query_partial_page).
+    """
+    if not os.path.exists(DB_PATH):
+        return [], None, "Database not found. Please run crawler.py first."
+
+    try:
+        rows, paging = fault_code_index().browse(start, end, after, facets)
+    except sqlite3.Error as e:
+        return [], None, f"Database error: {e}"
+
+    if not rows:
+        return [], paging, "No codes in this range." if not facets else "No codes in this range under these facets."
+    return rows, paging, None
+
+def query_facets():
+    """List the facets with their record counts, or [] if they cannot be read."""
+    if not os.path.exists(DB_PATH):
+        return []
+    try:
+        return fault_code_index().facets()
+    except sqlite3.Error:
+        return []
+
+def query_text_search(text, page=1):
+    """Search titles and descriptions using the full-text index."""
+    if not text or len(text) < 2 or len(text) > 100:
+        return [], 0, "Please enter 2-100 characters to search descriptions"
+
+    if not os.path.exists(DB_PATH):
+        return [], 0, "Database not found. Please run crawler.py first."
+
+    try:
+        with fault_code_index().connection() as conn:
+            cursor = conn.cursor()
+            if not has_fts_index(cursor):
+                return [], 0, "Text search index not available. Run 'python fault_index.py' to build it."
+            hits, total = search_text(cursor, text, page, SEARCH_PAGE_SIZE)
+
+        if not total:
+            return [], 0, f"No descriptions match '{text}'. Try fewer or shorter words (e.g., 'glow plug')."
+        if not hits:
+            return [], total, f"Page {page} is past the last page of results."
+        return hits, total, None
+
+    except sqlite3.Error as e:
+        return [], 0, f"Database error: {e}"
+
+def render_text_search(text, page):
+    """Render one page of full-text search results."""
+    text = " ".join(text.split())
+
+    def render():
+        hits, total, error = query_text_search(text, page)
+        pages = max(1, -(-total // SEARCH_PAGE_SIZE))
+        return render_page(code=text, result=None, error=error, mode="text",
+                           hits=hits, total=total, page=page, pages=pages,
+                           first_hit=(page - 1) * SEARCH_PAGE_SIZE + 1)
+
+    version = current_version()
+    if not version:
+        return render()
+
+    key = ("text", text.lower(), page, version)
+    return conditional_page(key, page_etag(*key), render)
+
+def offline_manifest():
+    """Return the offline snapshot manifest, built once per database version.
+
+    Raises sqlite3.Error.
+    """
+    def build():
+        with fault_code_index().connection() as conn:
+            with stage("query_snapshot"):
+                return build_manifest(conn.cursor(), database_info_version(DB_PATH))
+
+    version = current_version()
+    return cached_page(("offline", version) if version else None, build)
+
+def negotiate_encoding():
+    """Pick the best supported content encoding the client accepts."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+def compress_body(body, encoding):
+    """Compress a response body with the given encoding."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+@app.before_request
+def start_timing():
+    metrics.start_request()
+
+# Registered before compress_response so it runs after it and the
+# compression time is included in the request total
+@app.after_request
+def finish_timing(response):
+    for fault_code in g.pop("popular_codes", ()):
+        popularity.hit(fault_code)
+    for fault_code in g.pop("missed_codes", ()):
+        miss_fetcher.record(fault_code)
+    timer = metrics.finish_request(request.endpoint or "unknown", response.status_code)
+    if timer is not None:
+        response.headers["Server-Timing"] = metrics.server_timing(timer)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Compress HTML and JSON responses for clients that accept it.
+
+    Compressed bodies of pages with an ETag are cached, and the ETag gets
+    an encoding suffix so each representation keeps a distinct validator.
+    """
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or "Content-Encoding" in response.headers):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding()
+    if encoding is None or (response.content_length or 0) < COMPRESS_MIN_BYTES:
+        return response
+
+    etag, _ = response.get_etag()
+    body = compressed_cache.get((etag, encoding)) if etag else MISSING
+    if body is MISSING:
+        with stage("compress"):
+            body = compress_body(response.get_data(), encoding)
+        if etag:
+            compressed_cache.set((etag, encoding), body)
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    if etag:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+@app.route("/", methods=["GET"])
+def home():
+    code = request.args.get("code", "").strip()
+    page = request.args.get("page", "").strip()
+    record_id = request.args.get("id", type=int)
+    if page or record_id is not None:
+        return record_page(page or None, record_id)
+
+    if code and request.args.get("mode") == "text":
+        return render_text_search(code, 1)
+
+    # Valid codes are shown normalized, so one cached page serves every spelling
+    fault_code, invalid = normalize_fault_code(code)
+    if code and not invalid:
+        code = fault_code
+
+    after = normalize_page_cursor(request.args.get("after")) if code else None
+
+    def render():
+        return render_code_page(code, after)
+
+    version = current_version()
+    if not version or (code and invalid):
+        return render()
+
+    etag = code_page_etag(code, version, after) if code else page_etag("home")
+    return conditional_page(("code", code, after, version), etag, render)
+
+def record_page(page, record_id):
+    """Serve the page of one record (see render_record_page), cached per database version."""
+    def render():
+        return render_record_page(page, record_id)
+
+    version = current_version()
+    if not version:
+        return render()
+
+    key = ("record", page, None if page else record_id, version)
+    return conditional_page(key, page_etag(*key), render)
+
+@app.route("/section/<code>/<name>", methods=["GET"])
+def section(code, name):
+    fault_code, invalid = normalize_fault_code(code)
+    if invalid or name not in PAGE_SECTIONS or not current_version():
+        abort(404)
+    # Records opened from a list of pages sharing their code are read by row id
+    record_id = request.args.get("id", type=int)
+    try:
+        if record_id is not None:
+            found = fault_code_index().record(record_id=record_id)
+            match_type, result = (MATCH_EXACT, found[1]) if found else (MATCH_MISS, None)
+        else:
+            match_type, result = cached_lookups([fault_code], count=False)[fault_code]
+    except sqlite3.Error:
+        abort(503)
+    if match_type not in (MATCH_EXACT, MATCH_CLEANED) or result[0] != fault_code:
+        abort(404)
+
+    record = record_to_dict(result)
+    content_hash = record['content_hash']
+    key = ("section", fault_code, name, content_hash) if content_hash else None
+    etag = page_etag(*key) if key else None
+    response = conditional_page(key, etag, lambda: str(section_html(record, name)))
+    # The page asks for ?v=<content hash>, so that URL never changes content
+    if content_hash and request.args.get("v") == content_hash:
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/search", methods=["GET"])
+def search():
+    text = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+
+    return render_text_search(text, page)
+
+def browse_range():
+    """Read and validate the from/to/after parameters of a browse request.
+
+    Returns (start, end, after, error); start and end are None when not given.
+    """
+    bounds = []
+    for name in ("from", "to"):
+        value = request.args.get(name, "").strip()
+        bound = normalize_cursor(value)
+        if value and bound is None:
+            return None, None, None, "Please enter a valid code range (1-8 alphanumeric characters each)"
+        bounds.append(bound)
+    return bounds[0], bounds[1], normalize_page_cursor(request.args.get("after")), None
+
+def browse_facets():
+    """Read and validate the facet parameters of a browse request.
+
+    Returns (facets, error); facets are in FACET_KEYS order, so the same
+    selection always makes the same cache key.
+    """
+    selected = set(request.args.getlist("facet"))
+    unknown = selected.difference(FACET_KEYS)
+    if unknown:
+        return (), f"Unknown facet: {sorted(unknown)[0][:40]}"
+    return tuple(key for key in FACET_KEYS if key in selected), None
+
+@app.route("/browse", methods=["GET"])
+def browse():
+    start, end, after, invalid = browse_range()
+    facets, facet_error = browse_facets()
+    invalid = invalid or facet_error
+
+    def render():
+        listing, paging, error = (None, None, invalid) if invalid else query_browse(start or "", end, after, facets)
+        return render_page(code="", result=None, error=error, mode="browse", listing=listing,
+                           paging=paging, range_from=start or "", range_to=end or "",
+                           facets=query_facets(), selected_facets=facets,
+                           facet_kinds=((FACET_COMPONENT, "Components"), (FACET_SYSTEM, "Systems")),
+                           facet_query="".join(f"&facet={key}" for key in facets))
+
+    version = current_version()
+    if not version or invalid:
+        return render()
+
+    key = ("browse", start, end, after, facets, version)
+    return conditional_page(key, page_etag(*key), render)
+
+@app.route("/scan", methods=["GET", "POST"])
+def scan():
+    report = request.form.get("report", "") if request.method == "POST" else ""
+    modules, fault_count, error = (None, 0, None)
+
+    if request.method == "POST":
+        modules, fault_count, error = query_scan_report(report)
+
+    return render_page(code="", result=None, error=error, mode="scan",
+                       report=report, scan=modules, scan_faults=fault_count)
+
+@app.route("/api/scan", methods=["POST"])
+def api_scan():
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        report = payload.get("report", "") if isinstance(payload, dict) else ""
+    else:
+        report = request.form.get("report") or request.get_data(as_text=True)
+
+    modules, fault_count, error = query_scan_report(report)
+    if error:
+        return jsonify({'error': error}), 400
+
+    return jsonify({'faults': fault_count, 'modules': modules})
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    lookups = fault_code_index().stats()
+    return jsonify({
+        'database_version': str(database_version(DB_PATH)),
+        'pages': page_cache.stats(),
+        'lookups': lookups['lookups'],
+        'compressed': compressed_cache.stats(),
+        'misses': lookups['misses'],
+        'code_filter': lookups['code_filter'],
+        'coalesced': {'pages': page_flight.stats(), 'lookups': lookups['coalesced']},
+        'pooled_connections': lookups['pooled_connections'],
+        'popularity': {'pending_codes': popularity.pending()},
+        'missing_codes': queue_counts(DB_PATH)
+    })
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    lookups = fault_code_index()
+    caches = {'pages': page_cache, 'lookups': lookups.cache, 'compressed': compressed_cache, 'misses': lookups.miss_cache}
+    stats = {name: cache.stats() for name, cache in caches.items()}
+    extra = []
+    for key, help_text in (('hits', 'Cache hits.'), ('misses', 'Cache misses.'), ('size', 'Cached entries.')):
+        extra.extend(metrics.format_gauges(f"{metrics.METRIC_PREFIX}_cache_{key}", help_text, "cache",
+                                           {name: stat[key] for name, stat in stats.items()}))
+    response = make_response(metrics.render_metrics(extra))
+    response.mimetype = "text/plain"
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
+@app.route("/api/code/<path:code>", methods=["GET"])
+def api_code(code):
+    entries, error = query_fault_codes([code.strip()])
+    if error:
+        return jsonify({'error': error}), 503
+
+    entry = entries[0]
+    if entry['match'] == MATCH_PARTIAL:
+        try:
+            rows, paging = query_partial_page(entry['code'], normalize_page_cursor(request.args.get("after")))
+        except sqlite3.Error as e:
+            return jsonify({'error': f"Database error: {e}"}), 503
+        entry['candidates'] = [summary_to_dict(row) for row in rows]
+        entry.update(total=paging['total'], total_exact=paging['total_exact'], next=paging['next'])
+    status = {MATCH_INVALID: 400, MATCH_MISS: 404}.get(entry['match'], 200)
+    return jsonify(entry), status
+
+@app.route("/api/complete", methods=["GET"])
+def api_complete():
+    prefix, error = normalize_fault_code(request.args.get("q", "").strip())
+    if error:
+        return jsonify({'error': error}), 400
+    if not os.path.exists(DB_PATH):
+        return jsonify({'error': "Database not found. Please run crawler.py first."}), 503
+
+    try:
+        suggestions, more = fault_code_index().complete(prefix)
+    except sqlite3.Error as e:
+        return jsonify({'error': f"Database error: {e}"}), 503
+
+    # Compact [key, code, title] lists keep a response well under 1 KB
+    response = jsonify({'q': prefix, 'codes': [list(entry) for entry in suggestions], 'more': more})
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return response
+
+@app.route("/api/browse", methods=["GET"])
+def api_browse():
+    start, end, after, error = browse_range()
+    facets, facet_error = browse_facets()
+    error = error or facet_error
+    if error:
+        return jsonify({'error': error}), 400
+
+    rows, paging, error = query_browse(start or "", end, after, facets)
+    if paging is None:
+        return jsonify({'error': error}), 503
+
+    return jsonify({
+        'from': start,
+        'to': end,
+        'facets': list(facets),
+        'total': paging['total'],
+        'total_exact': paging['total_exact'],
+        'codes': [summary_to_dict(row) for row in rows],
+        'next': paging['next']
+    })
+
+@app.route("/api/facets", methods=["GET"])
+def api_facets():
+    if not os.path.exists(DB_PATH):
+        return jsonify({'error': "Database not found. Please run crawler.py first."}), 503
+
+    try:
+        facets = fault_code_index().facets()
+    except sqlite3.Error as e:
+        return jsonify({'error': f"Database error: {e}"}), 503
+
+    response = jsonify({'facets': facets})
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return response
+
+@app.route("/offline/", methods=["GET"])
+def offline_app():
+    return send_from_directory(SHELL_DIR, "index.html")
+
+@app.route("/offline/snapshot.json", methods=["GET"])
+def offline_snapshot():
+    if not os.path.exists(DB_PATH):
+        return jsonify({'error': "Database not found. Please run crawler.py first."}), 503
+    try:
+        manifest = offline_manifest()
+    except sqlite3.Error as e:
+        return jsonify({'error': f"Database error: {e}"}), 503
+
+    response = jsonify(manifest)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/offline/shards/<name>", methods=["GET"])
+def offline_shard(name):
+    if not os.path.exists(DB_PATH):
+        abort(404)
+    try:
+        manifest = offline_manifest()
+        shard = next((shard for shard in manifest['shards'] if shard['url'] == f"shards/{name}"), None)
+        if shard is None:
+            # Superseded by a newer snapshot; the client re-reads snapshot.json
+            abort(404)
+
+        def render():
+            with fault_code_index().connection() as conn:
+                records = shard_records(conn.cursor(), shard['prefix'])
+            return shard_body(records, shard['prefix'], shard['hash'])
+
+        # Keyed by content hash, so shards survive unrelated database updates
+        body = cached_page(("offline-shard", shard['prefix'], shard['hash']), render)
+    except sqlite3.Error as e:
+        return jsonify({'error': f"Database error: {e}"}), 503
+
+    response = make_response(body)
+    response.mimetype = "application/gzip"
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+@app.route("/offline/<path:filename>", methods=["GET"])
+def offline_file(filename):
+    response = send_from_directory(SHELL_DIR, filename)
+    if filename == "sw.js":
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/api/lookup", methods=["GET", "POST"])
+def api_lookup():
+    if request.method == "POST":
+        payload = request.get_json(silent=True)
+        codes = payload.get("codes") if isinstance(payload, dict) else payload
+    else:
+        codes = [code for code in request.args.get("codes", "").split(",") if code.strip()]
+
+    if not isinstance(codes, list) or not codes:
+        return jsonify({'error': 'Expected a list of codes, e.g. {"codes": ["00532", "P1757"]}'}), 400
+    if len(codes) > MAX_BATCH_CODES:
+        return jsonify({'error': f'At most {MAX_BATCH_CODES} codes per request'}), 413
+
+    codes = [code.strip() if isinstance(code, str) else code for code in codes]
+    entries, error = query_fault_codes(codes)
+    if error:
+        return jsonify({'error': error}), 503
+
+    return jsonify({'count': len(entries), 'results': entries})
+
+def main():
     print("Starting VCDS Fault Code Lookup Server...")
     print("Mobile-optimized version")
     print("=" * 40)
+    if os.path.exists(DB_PATH):
+        fault_code_index().ensure_indexes()
+        start_background_tasks()
     app.run(host="0.0.0.0", port=5000, debug=False)
+
+if __name__ == "__main__":
+    main()
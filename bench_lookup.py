@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Lookup Server Benchmark
+
+Replays a mix of realistic lookups against the web app and reports
+throughput and latency percentiles, overall and per kind of lookup:
+
+    exact     codes that exist, typed as stored
+    cleaned   codes that exist, typed with padding or in lower case
+    partial   fragments of codes (partial-match lists)
+    similar   mistyped codes (a swapped or wrong digit) with no exact match
+    miss      codes that match nothing
+
+Queries are drawn from the database itself, and each one is checked
+against lookup_code so it really exercises its tier. Runs either in
+process through the Flask test client or against a live server:
+
+    python bench_lookup.py --requests 5000 --concurrency 8
+    python bench_lookup.py --url http://127.0.0.1:5000 --output before.json
+    python bench_lookup.py --compare before.json after.json
+
+With --tiers it skips the server and times lookup_code itself, uncached,
+reporting the SQL statements each kind of lookup runs:
+
+    python bench_lookup.py --tiers
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import sqlite3
+import string
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+from fault_index import (
+    MATCH_CLEANED, MATCH_EXACT, MATCH_MISS, MATCH_PARTIAL, MATCH_SIMILAR,
+    ensure_indexes, lookup_code,
+)
+
+DB_PATH = "fault_codes.db"
+
+# Share of each kind of lookup in the default workload, in percent
+DEFAULT_MIX = {"exact": 50, "cleaned": 10, "partial": 20, "similar": 10, "miss": 10}
+
+# Distinct queries prepared per kind; requests cycle through them
+QUERIES_PER_KIND = 200
+
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    """Parse 'exact=50,partial=20,...' into a workload mix."""
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown lookup kind '{kind}' (expected one of {', '.join(DEFAULT_MIX)})")
+        try:
+            mix[kind] = int(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Weight of '{kind}' must be an integer")
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("At least one weight must be positive")
+    return mix
+
+
+def build_queries(db_path: str, per_kind: int = QUERIES_PER_KIND,
+                  seed: int = 0) -> Dict[str, List[str]]:
+    """Draw queries of every kind from the database.
+
+    Candidates are resolved with lookup_code and kept only if they land
+    in the intended tier, so the mix stays honest as matching changes.
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    # lookup_code reads the alias table and content hashes, which a
+    # database that was never served may not have yet
+    ensure_indexes(conn)
+    cursor = conn.cursor()
+    codes = [row[0] for row in cursor.execute("SELECT code FROM fault_codes ORDER BY code")]
+    if not codes:
+        conn.close()
+        raise SystemExit(f"No fault codes in {db_path}")
+
+    def tier(query):
+        return lookup_code(cursor, query.strip().upper())[0]
+
+    def candidates(kind):
+        code = rng.choice(codes)
+        if kind == "exact":
+            return code
+        if kind == "cleaned":
+            return rng.choice([f" {code.lower()} ", f"{code.lower()}", f"  {code}"])
+        if kind == "partial" and len(code) > 2:
+            start = rng.randrange(len(code) - 2)
+            return code[start:start + rng.choice((2, 3))]
+        if kind == "similar" and len(code) >= 2:
+            typo = list(code)
+            position = rng.randrange(len(code) - 1)
+            if rng.random() < 0.5:
+                typo[position], typo[position + 1] = typo[position + 1], typo[position]
+            else:
+                typo[position] = rng.choice(string.digits)
+            return "".join(typo)
+        return "".join(rng.choice(string.ascii_uppercase) for _ in range(2)) + \
+            "".join(rng.choice(string.digits) for _ in range(3))
+
+    wanted = {
+        "exact": (MATCH_EXACT,),
+        "cleaned": (MATCH_EXACT, MATCH_CLEANED),
+        "partial": (MATCH_PARTIAL,),
+        "similar": (MATCH_SIMILAR,),
+        "miss": (MATCH_MISS,),
+    }
+    queries = {}
+    try:
+        for kind, tiers in wanted.items():
+            found = []
+            attempts = 0
+            while len(found) < per_kind and attempts < per_kind * 50:
+                attempts += 1
+                query = candidates(kind)
+                if tier(query) in tiers:
+                    found.append(query)
+            queries[kind] = found
+    finally:
+        conn.close()
+    return queries
+
+
+class TestClientTarget:
+    """Sends requests through the Flask test client, in process."""
+
+    def __init__(self, db_path: str):
+        import app_flask
+        app_flask.DB_PATH = db_path
+        self.app = app_flask.app
+        self.local = threading.local()
+
+    def describe(self) -> str:
+        return "flask test client"
+
+    def get(self, path: str) -> int:
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        return client.get(path).status_code
+
+
+class HTTPTarget:
+    """Sends requests to a live server, one keep-alive connection per thread."""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.url = url
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.local = threading.local()
+
+    def describe(self) -> str:
+        return self.url
+
+    def get(self, path: str) -> int:
+        for attempt in range(2):
+            conn = getattr(self.local, "conn", None)
+            if conn is None:
+                conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                conn.request("GET", path, headers={"Accept-Encoding": "gzip"})
+                response = conn.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, OSError):
+                # The server may close idle keep-alive connections; reconnect once
+                conn.close()
+                self.local.conn = None
+                if attempt:
+                    raise
+        return 0
+
+
+def request_path(endpoint: str, query: str) -> str:
+    if endpoint == "api":
+        return f"/api/code/{quote(query.strip(), safe='')}"
+    return f"/?code={quote(query)}"
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    """Throughput and latency figures (milliseconds) for one set of requests."""
+    latencies = sorted(latencies)
+    summary = {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+    for pct in PERCENTILES:
+        summary[f'p{pct}_ms'] = round(percentile(latencies, pct) * 1000, 3)
+    return summary
+
+
+def run_benchmark(target, schedule: List[Tuple[str, str]], concurrency: int,
+                  endpoint: str) -> Tuple[Dict[str, List[float]], Dict[str, int], float]:
+    """Send every scheduled (kind, query) request using concurrency threads.
+
+    Returns latencies per kind, error counts per kind and the wall time.
+    A response counts as an error if it is a 5xx or the request fails.
+    """
+    latencies = {kind: [] for kind, _ in schedule}
+    errors = {kind: 0 for kind, _ in schedule}
+    lock = threading.Lock()
+    position = iter(range(len(schedule)))
+
+    def worker():
+        local_latencies = {kind: [] for kind in latencies}
+        local_errors = {kind: 0 for kind in errors}
+        while True:
+            with lock:
+                index = next(position, None)
+            if index is None:
+                break
+            kind, query = schedule[index]
+            started = time.perf_counter()
+            try:
+                status = target.get(request_path(endpoint, query))
+            except (http.client.HTTPException, OSError):
+                status = 0
+            elapsed = time.perf_counter() - started
+            if status == 0 or status >= 500:
+                local_errors[kind] += 1
+            else:
+                local_latencies[kind].append(elapsed)
+        with lock:
+            for kind in latencies:
+                latencies[kind].extend(local_latencies[kind])
+                errors[kind] += local_errors[kind]
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def build_schedule(queries: Dict[str, List[str]], mix: Dict[str, int],
+                   total: int, seed: int) -> List[Tuple[str, str]]:
+    """Interleave requests of each kind in proportion to the mix."""
+    rng = random.Random(seed)
+    kinds = [kind for kind, weight in mix.items() if weight > 0 and queries.get(kind)]
+    if not kinds:
+        raise SystemExit("No queries could be prepared for the requested mix")
+    weights = [mix[kind] for kind in kinds]
+    schedule = []
+    for kind in rng.choices(kinds, weights=weights, k=total):
+        schedule.append((kind, rng.choice(queries[kind])))
+    return schedule
+
+
+def profile_tiers(db_path: str, queries: Dict[str, List[str]], rounds: int = 5) -> Dict[str, Dict[str, float]]:
+    """Time lookup_code directly for every kind of query and count its SQL statements.
+
+    Returns {kind: {'statements': mean per lookup, 'mean_us': best round}}.
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    profile = {}
+    try:
+        for kind, kind_queries in queries.items():
+            normalized = [query.strip().upper() for query in kind_queries]
+            if not normalized:
+                continue
+            statements = []
+            conn.set_trace_callback(statements.append)
+            for query in normalized:
+                lookup_code(cursor, query)
+            conn.set_trace_callback(None)
+
+            best = None
+            for _ in range(rounds):
+                started = time.perf_counter()
+                for query in normalized:
+                    lookup_code(cursor, query)
+                elapsed = (time.perf_counter() - started) / len(normalized)
+                best = elapsed if best is None else min(best, elapsed)
+            profile[kind] = {'statements': round(len(statements) / len(normalized), 2),
+                             'mean_us': round(best * 1e6, 1)}
+    finally:
+        conn.close()
+    return profile
+
+
+def print_tiers(profile: Dict[str, Dict[str, float]]):
+    print(f"{'kind':<10}{'statements':>12}{'mean_us':>10}")
+    for kind, row in profile.items():
+        print(f"{kind:<10}{row['statements']:>12.2f}{row['mean_us']:>10.1f}")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: Dict):
+    print(f"Target: {results['target']}  endpoint: {results['endpoint']}  "
+          f"concurrency: {results['concurrency']}")
+    header = f"{'kind':<10}{'requests':>9}{'errors':>8}{'req/s':>10}{'mean':>9}" + \
+        "".join(f"{'p' + str(pct):>9}" for pct in PERCENTILES) + f"{'max':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(results['kinds'].items()) + [("overall", results['overall'])]
+    for kind, summary in rows:
+        print(f"{kind:<10}{summary['requests']:>9}{summary['errors']:>8}{summary['throughput_rps']:>10.1f}"
+              f"{summary['mean_ms']:>9.2f}" +
+              "".join(f"{summary[f'p{pct}_ms']:>9.2f}" for pct in PERCENTILES) +
+              f"{summary['max_ms']:>9.2f}")
+    print("(latencies in ms)")
+
+
+def compare(before_path: str, after_path: str):
+    """Print the change in throughput and latency between two result files."""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    print(f"{before_path} ({before.get('git_revision')}) -> {after_path} ({after.get('git_revision')})")
+    metrics = ["throughput_rps", "mean_ms"] + [f"p{pct}_ms" for pct in PERCENTILES]
+    print(f"{'kind':<10}" + "".join(f"{metric:>16}" for metric in metrics))
+    names = list(after['kinds']) + ["overall"]
+    for kind in names:
+        old = before['overall'] if kind == "overall" else before['kinds'].get(kind)
+        new = after['overall'] if kind == "overall" else after['kinds'][kind]
+        if not old:
+            continue
+        cells = []
+        for metric in metrics:
+            change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            cells.append(f"{new[metric]:>9.2f} {change:+5.0f}%")
+        print(f"{kind:<10}" + "".join(f"{cell:>16}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fault code lookups under concurrent load")
+    parser.add_argument("--url", help="benchmark a live server (e.g. http://127.0.0.1:5000) "
+                                      "instead of the in-process test client")
+    parser.add_argument("--db", default=DB_PATH, help="database to draw queries from (and to serve, in process)")
+    parser.add_argument("--requests", type=int, default=2000, help="number of requests to send")
+    parser.add_argument("--concurrency", type=int, default=4, help="number of concurrent clients")
+    parser.add_argument("--warmup", type=int, default=200, help="requests sent before measuring")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="workload mix, e.g. exact=50,cleaned=10,partial=20,similar=10,miss=10")
+    parser.add_argument("--endpoint", choices=("page", "api"), default="page",
+                        help="request HTML pages (/?code=) or JSON (/api/code/)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the query mix")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="compare two result files instead of running")
+    parser.add_argument("--tiers", action="store_true",
+                        help="time uncached lookup_code calls and count their SQL statements instead")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    if not os.path.exists(args.db):
+        print(f"Database {args.db} not found. Please run crawler.py first.")
+        return 1
+
+    queries = build_queries(args.db, seed=args.seed)
+    if args.tiers:
+        profile = profile_tiers(args.db, queries)
+        print_tiers(profile)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({'git_revision': git_revision(), 'db': args.db, 'tiers': profile}, f, indent=2)
+        return 0
+
+    target = HTTPTarget(args.url) if args.url else TestClientTarget(args.db)
+
+    if args.warmup:
+        run_benchmark(target, build_schedule(queries, args.mix, args.warmup, args.seed + 1),
+                      args.concurrency, args.endpoint)
+    schedule = build_schedule(queries, args.mix, args.requests, args.seed)
+    latencies, errors, elapsed = run_benchmark(target, schedule, args.concurrency, args.endpoint)
+
+    all_latencies = [latency for values in latencies.values() for latency in values]
+    results = {
+        'timestamp': datetime.now().isoformat(timespec="seconds"),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'target': target.describe(),
+        'endpoint': args.endpoint,
+        'concurrency': args.concurrency,
+        'warmup': args.warmup,
+        'mix': args.mix,
+        'seed': args.seed,
+        'elapsed_s': round(elapsed, 3),
+        'overall': summarize(all_latencies, sum(errors.values()), elapsed),
+        'kinds': {kind: summarize(latencies[kind], errors[kind], elapsed) for kind in latencies},
+    }
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
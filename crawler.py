@@ -12,9 +12,14 @@ import sqlite3
 import time
 import re
 import logging
-from urllib.parse import urljoin, urlparse
+from urllib.parse import parse_qs, unquote, urljoin, urlparse
 from typing import List, Dict, Optional
 
+from fault_index import (
+    FULL_FIELDS, code_keys, create_fault_codes_table, ensure_indexes, index_fault_code, page_code,
+    record_facets, record_hash, unindex_fault_code,
+)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -42,39 +47,13 @@ class FaultCodeCrawler:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        # Create table if it doesn't exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS fault_codes(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT NOT NULL,
-                title TEXT,
-                symptoms TEXT,
-                causes TEXT,
-                solutions TEXT,
-                UNIQUE(code)
-            )
-        ''')
-        
-        # Add new columns if they don't exist (for existing databases)
-        try:
-            cursor.execute("ALTER TABLE fault_codes ADD COLUMN full_content TEXT")
-            logger.info("Added full_content column")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-        
-        try:
-            cursor.execute("ALTER TABLE fault_codes ADD COLUMN special_notes TEXT")
-            logger.info("Added special_notes column")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-        
-        try:
-            cursor.execute("ALTER TABLE fault_codes ADD COLUMN technical_info TEXT")
-            logger.info("Added technical_info column")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-        
+        # Create table if it doesn't exist; older databases get the columns
+        # and page keys they lack from ensure_indexes
+        create_fault_codes_table(cursor)
         conn.commit()
+        
+        # Content hashes, substring and full-text indexes used by the lookup frontends
+        ensure_indexes(conn)
         conn.close()
         logger.info("Database initialized successfully")
     
@@ -210,20 +189,17 @@ class FaultCodeCrawler:
             response.raise_for_status()
             soup = BeautifulSoup(response.content, 'html.parser')
             
+            # Records are keyed by the wiki page, as its heading names it
+            title_element = soup.find('h1', {'class': 'firstHeading'})
+            page = title_element.get_text().strip() if title_element else self.extract_page_from_url(url)
+            
             # Extract fault code from URL or page title
-            fault_code = self.extract_code_from_url(url)
-            if not fault_code:
-                # Try to extract from page title
-                title_element = soup.find('h1', {'class': 'firstHeading'})
-                if title_element:
-                    title_text = title_element.get_text()
-                    code_match = re.search(r'(\d{5})', title_text)
-                    if code_match:
-                        fault_code = code_match.group(1)
+            fault_code = self.extract_code_from_url(url) or page_code(page)
             
             if not fault_code:
                 logger.warning(f"Could not extract fault code from: {url}")
                 return None
+            page = page or fault_code
             
             # Extract title
             title = self.extract_title(soup)
@@ -240,6 +216,7 @@ class FaultCodeCrawler:
             
             return {
                 'code': fault_code,
+                'page': page,
                 'title': title,
                 'full_content': full_content,
                 'symptoms': symptoms,
@@ -253,11 +230,21 @@ class FaultCodeCrawler:
             logger.error(f"Error fetching page {url}: {e}")
             return None
     
+    def extract_page_from_url(self, url: str) -> str:
+        """Extract the wiki page name from a URL (index.php/<page> or ?title=<page>)."""
+        parsed = urlparse(url)
+        titles = parse_qs(parsed.query).get('title')
+        if titles:
+            page = titles[0]
+        else:
+            page = unquote(parsed.path).split('/index.php/', 1)[-1].rsplit('/wiki/', 1)[-1]
+        return page.replace('_', ' ').strip()
+    
     def extract_code_from_url(self, url: str) -> Optional[str]:
         """Extract fault code from URL."""
-        # Look for 5-digit codes in the URL
-        code_match = re.search(r'(\d{5})', url)
-        return code_match.group(1) if code_match else None
+        # The code the page name lists, not the first digits in the URL:
+        # "P310B/012555" is P310B, not 01255
+        return page_code(self.extract_page_from_url(url))
     
     def extract_title(self, soup: BeautifulSoup) -> str:
         """Extract the title from the page."""
@@ -336,20 +323,40 @@ class FaultCodeCrawler:
         cursor = conn.cursor()
         
         try:
+            # Drop the rows this save replaces: the page's record, and records
+            # saved before pages were recorded that have the page name as
+            # their title, or the page's title and code. Deleted explicitly,
+            # so the delete triggers keep the full-text index in sync
+            cursor.execute(
+                "SELECT id, code, title, full_content, technical_info FROM fault_codes WHERE page = ? "
+                "OR (page IS NULL AND title = ? AND (title = ? OR code = ?))",
+                (data['page'], data['title'], data['page'], data['code'])
+            )
+            for existing_id, existing_code, existing_title, existing_content, existing_info in cursor.fetchall():
+                unindex_fault_code(cursor, existing_id, existing_code, existing_title,
+                                   record_facets(existing_title, existing_content, existing_info))
+                cursor.execute("DELETE FROM fault_codes WHERE id = ?", (existing_id,))
+            
             cursor.execute('''
-                INSERT OR REPLACE INTO fault_codes 
-                (code, title, full_content, symptoms, causes, solutions, special_notes, technical_info)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO fault_codes 
+                (code, page, title, full_content, symptoms, causes, solutions, special_notes, technical_info,
+                 content_hash, vag_code, obd_code)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 data['code'], 
+                data['page'],
                 data['title'], 
                 data['full_content'],
                 data['symptoms'], 
                 data['causes'], 
                 data['solutions'],
                 data['special_notes'],
-                data['technical_info']
+                data['technical_info'],
+                record_hash([data[field] for field in FULL_FIELDS]),
+                *code_keys(data['code'], data['title'])
             ))
+            index_fault_code(cursor, cursor.lastrowid, data['code'], data['title'],
+                             record_facets(data['title'], data['full_content'], data['technical_info']))
             
             conn.commit()
             logger.info(f"Saved fault code: {data['code']} - {data['title']}")
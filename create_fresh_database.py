@@ -7,6 +7,8 @@ import sqlite3
 import gzip
 import os
 
+from fault_index import ensure_indexes
+
 def create_fresh_database():
     """Create a fresh database package."""
     
@@ -32,6 +34,8 @@ def create_fresh_database():
     cursor.execute("SELECT COUNT(*) FROM fault_codes WHERE full_content LIKE '%Possible Symptoms%'")
     ross_tech_codes = cursor.fetchone()[0]
     
+    # Ship the lookup indexes with the package
+    ensure_indexes(conn)
     conn.close()
     
     print(f"Source database stats:")
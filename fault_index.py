@@ -0,0 +1,1497 @@
+#!/usr/bin/env python3
+"""
+Ross-Tech VCDS Fault Codes Index
+
+Shared lookup helpers used by the crawler and the frontends. Keeps an
+alias table mapping every code a page lists to its record, a facet
+table of the components and systems each record is about, an n-gram
+substring index over fault codes so partial matches are answered with an
+index probe instead of a LIKE '%...%' scan of the whole table, a
+deletion-neighborhood index for finding codes within a typo or two of a
+query, and an FTS5 full-text index for searching titles and
+descriptions.
+"""
+
+import hashlib
+import re
+import sqlite3
+import sys
+from itertools import combinations
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from lookup_cache import BloomFilter
+from metrics import stage
+
+DB_PATH = "fault_codes.db"
+
+# Grams of every length up to this size are indexed, so fragments of up
+# to three characters resolve with a single posting list lookup.
+NGRAM_SIZE = 3
+
+# Lists of codes carry the page and row id of each record, as pages can
+# share a code
+SUMMARY_COLUMNS = "code, title, page, id"
+SUMMARY_FIELDS = ("code", "title", "page", "id")
+FULL_COLUMNS = ("code, title, full_content, symptoms, causes, solutions, "
+                "special_notes, technical_info")
+FULL_FIELDS = tuple(column.strip() for column in FULL_COLUMNS.split(","))
+
+# Lookups also return the stored content hash, used for HTTP validators,
+# and the row id, as pages can share a code
+RECORD_COLUMNS = FULL_COLUMNS + ", content_hash, id"
+RECORD_FIELDS = FULL_FIELDS + ("content_hash", "id")
+
+# Match types reported by the lookup tiers, in priority order
+MATCH_EXACT = "exact"
+MATCH_CLEANED = "cleaned"
+MATCH_MULTIPLE = "multiple"
+MATCH_PARTIAL = "partial"
+MATCH_SIMILAR = "similar"
+MATCH_MISS = "miss"
+MATCH_ORDER = (MATCH_EXACT, MATCH_CLEANED, MATCH_MULTIPLE, MATCH_PARTIAL, MATCH_SIMILAR, MATCH_MISS)
+
+# Codes per IN (...) list in batch lookups; well under SQLite's
+# host parameter limit on older builds (999)
+BATCH_CHUNK_SIZE = 500
+
+# Columns of the full-text index and their BM25 weights. Codes and titles
+# rank above a hit buried somewhere in the full page text.
+FTS_COLUMNS = ("code", "title", "symptoms", "causes", "solutions",
+               "special_notes", "full_content")
+FTS_WEIGHTS = (10.0, 8.0, 3.0, 3.0, 2.0, 1.0, 0.5)
+
+# Similar-code matching returns at most FUZZY_LIMIT codes within this
+# many single-character edits (insert, delete, substitute, swap)
+FUZZY_MAX_DISTANCE = 2
+FUZZY_LIMIT = 10
+
+# Partial matches and code ranges are listed a page at a time in code
+# order; counting stops past COUNT_LIMIT so broad queries stay cheap
+PAGE_SIZE = 50
+COUNT_LIMIT = 1000
+# Facets with at least this many records are browsed by walking the code
+# index (see _facet_filter)
+FACET_SCAN_MIN = 2000
+
+# Grams found in more codes than this are too common to be worth
+# collecting candidates for when only a page of matches is needed
+DENSE_GRAM_CODES = 2000
+
+# Canonical code forms: OBD-II codes (P0431, U0101) and VAG 5-digit codes
+# (16815). Typed VAG numbers of 3-4 digits are zero-padded ("1757" is
+# 01757); shorter ones stay partial-match queries. A VCDS fault line adds a
+# status and fault type ("P1757 00 [237]"), and page titles list several
+# forms of one fault ("16815/P0431/001073").
+OBD_CODE = re.compile(r"^[PBCU][0-9A-F]{4}$")
+VAG_CODE = re.compile(r"^\d{5}$")
+VAG_NUMBER = re.compile(r"^\d{3,5}$")
+CODE_SUFFIX = re.compile(r"\s+([0-9A-F]{2})\s*\[(\d{1,3})\]")
+CODE_LIST = re.compile(r"^[A-Z0-9]+(?:\s*/\s*[A-Z0-9]+)*$")
+
+# Codes a wiki page name lists ("B1487/038023"): OBD codes and VAG 5- and
+# 6-digit codes
+PAGE_CODE = re.compile(r"^(?:[PBCU][0-9A-F]{4}|\d{5,6})$")
+
+# Columns holding the canonical keys of each record (see ensure_code_keys)
+CODE_KEY_COLUMNS = ("vag_code", "obd_code")
+
+# One row per wiki page. Pages can list the same code, so codes are not
+# unique; page is NULL for rows saved before pages were recorded.
+FAULT_CODES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name}(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        code TEXT NOT NULL,
+        page TEXT,
+        title TEXT,
+        symptoms TEXT,
+        causes TEXT,
+        solutions TEXT,
+        full_content TEXT,
+        special_notes TEXT,
+        technical_info TEXT,
+        content_hash TEXT,
+        vag_code TEXT,
+        obd_code TEXT,
+        UNIQUE(page)
+    )
+'''
+
+# Facets (key, kind, label, terms) a record is filed under when its title,
+# headline (the first line of its page) or technical information contains
+# one of the terms: whole words or phrases, matched case-insensitively,
+# across punctuation ("a c" is A/C, "can bus" is CAN-Bus) and in the
+# singular (see record_facets). Terms with capitals match only as written,
+# so "CAN" is the data bus and "Can't unlock" is not
+FACET_COMPONENT = "component"
+FACET_SYSTEM = "system"
+FACETS = (
+    ("nox-sensor", FACET_COMPONENT, "NOx sensor", ("nox sensor",)),
+    ("scr", FACET_COMPONENT, "SCR / AdBlue", ("scr", "adblue", "urea", "reducing agent", "reductant")),
+    ("egr", FACET_COMPONENT, "EGR", ("egr", "exhaust gas recirculation")),
+    ("glow-plugs", FACET_COMPONENT, "Glow plugs", ("glow", "glowplug", "preheating")),
+    ("lambda-sensor", FACET_COMPONENT, "Oxygen (lambda) sensor", ("lambda", "oxygen sensor", "o2 sensor")),
+    ("catalytic-converter", FACET_COMPONENT, "Catalytic converter", ("catalyst", "catalytic")),
+    ("particle-filter", FACET_COMPONENT, "Particle filter", ("particle filter", "particulate", "dpf")),
+    ("secondary-air", FACET_COMPONENT, "Secondary air", ("secondary air",)),
+    ("evap", FACET_COMPONENT, "EVAP system", ("evap", "evaporative", "canister")),
+    ("throttle", FACET_COMPONENT, "Throttle", ("throttle",)),
+    ("maf-sensor", FACET_COMPONENT, "Mass air flow sensor", ("mass air flow", "air mass", "maf")),
+    ("intake-manifold", FACET_COMPONENT, "Intake manifold", ("intake manifold", "manifold pressure")),
+    ("turbocharger", FACET_COMPONENT, "Turbocharger / boost",
+     ("turbo", "turbocharger", "boost", "charge pressure", "wastegate")),
+    ("injectors", FACET_COMPONENT, "Injectors", ("injector", "injection valve", "pump jet")),
+    ("fuel-pump", FACET_COMPONENT, "Fuel pump", ("fuel pump", "injection pump")),
+    ("ignition-coils", FACET_COMPONENT, "Ignition coils", ("ignition coil", "spark")),
+    ("knock-sensor", FACET_COMPONENT, "Knock sensor", ("knock sensor",)),
+    ("camshaft", FACET_COMPONENT, "Camshaft", ("camshaft", "cam adjustment", "cam adj")),
+    ("crankshaft", FACET_COMPONENT, "Crankshaft / engine speed", ("crankshaft", "engine speed sensor")),
+    ("coolant", FACET_COMPONENT, "Coolant", ("coolant", "cooling", "radiator", "thermostat")),
+    ("abs", FACET_COMPONENT, "ABS", ("abs", "anti lock", "antilock")),
+    ("wheel-speed-sensor", FACET_COMPONENT, "Wheel speed sensor", ("wheel speed",)),
+    ("airbag", FACET_COMPONENT, "Airbag / belt tensioner", ("airbag", "igniter", "crash", "belt tensioner")),
+    ("window", FACET_COMPONENT, "Window", ("window",)),
+    ("door-lock", FACET_COMPONENT, "Door lock",
+     ("central locking", "door lock", "locking motor", "door contact", "lock unit")),
+    ("battery", FACET_COMPONENT, "Battery", ("battery", "undervoltage", "under voltage")),
+    ("headlights", FACET_COMPONENT, "Headlights", ("headlight", "headlamp", "swivel module", "xenon")),
+    ("parking-aid", FACET_COMPONENT, "Parking aid", ("parking aid", "park distance", "park assist")),
+    ("engine", FACET_SYSTEM, "Engine",
+     ("engine", "cylinder", "misfire", "idle", "camshaft", "cam adjustment", "crankshaft", "knock",
+      "ignition", "throttle", "boost", "turbo", "turbocharger", "intake", "mixture", "glow", "injector")),
+    ("emissions", FACET_SYSTEM, "Emissions / exhaust",
+     ("exhaust", "emission", "nox", "egr", "lambda", "oxygen sensor", "catalyst", "catalytic",
+      "particle filter", "particulate", "dpf", "evap", "evaporative", "secondary air", "scr", "adblue",
+      "too rich", "too lean")),
+    ("fuel-system", FACET_SYSTEM, "Fuel system", ("fuel", "injector", "injection")),
+    ("transmission", FACET_SYSTEM, "Transmission",
+     ("transmission", "gearbox", "gear", "clutch", "shift", "selector", "tiptronic", "mechatronic")),
+    ("brakes", FACET_SYSTEM, "Brakes / stability", ("brake", "braking", "abs", "stability", "esp", "wheel speed")),
+    ("steering", FACET_SYSTEM, "Steering", ("steering",)),
+    ("suspension", FACET_SYSTEM, "Suspension / level control",
+     ("suspension", "level control", "leveling", "levelling", "damper", "damping", "shock absorber")),
+    ("restraints", FACET_SYSTEM, "Airbag / restraints",
+     ("airbag", "igniter", "crash", "belt", "occupant", "rollover")),
+    ("climate", FACET_SYSTEM, "Climate control",
+     ("a c", "air conditioning", "climatronic", "compressor", "blower", "heater", "refrigerant",
+      "evaporator", "defroster", "flap motor", "temperature flap", "sunlight", "vent temperature",
+      "outside air temperature", "ambient temperature", "fresh air")),
+    ("body", FACET_SYSTEM, "Body / comfort",
+     ("door", "window", "central locking", "mirror", "seat", "sunroof", "alarm", "wiper", "rear lid",
+      "tailgate")),
+    ("lighting", FACET_SYSTEM, "Lighting", ("light", "lamp", "headlight", "headlamp", "bulb", "turn signal")),
+    ("data-bus", FACET_SYSTEM, "Data bus",
+     ("data bus", "databus", "data wiring", "can bus", "CAN", "network", "missing message", "communication")),
+    ("infotainment", FACET_SYSTEM, "Radio / infotainment",
+     ("radio", "loudspeaker", "cd", "navigation", "amplifier", "telephone")),
+    ("power-supply", FACET_SYSTEM, "Power supply", ("voltage", "battery", "terminal", "supply relay", "power supply")),
+    ("immobilizer", FACET_SYSTEM, "Immobilizer / access",
+     ("immobilizer", "immobiliser", "key", "access start", "authorization", "authorisation", "transponder")),
+)
+FACET_KEYS = tuple(key for key, _, _, _ in FACETS)
+
+# Facet keys by term, and the longest term in words; terms with capitals
+# are kept apart and matched against the words as written
+_FACET_TERMS: Dict[str, List[str]] = {}
+_FACET_CASED_TERMS: Dict[str, List[str]] = {}
+for _key, _, _, _terms in FACETS:
+    for _term in _terms:
+        (_FACET_TERMS if _term.islower() else _FACET_CASED_TERMS).setdefault(_term, []).append(_key)
+_FACET_TERM_WORDS = max(len(term.split()) for term in _FACET_TERMS)
+_FACET_CASED_TERM_WORDS = max(len(term.split()) for term in _FACET_CASED_TERMS)
+
+# Snippet markers; swapped for <mark> tags after the text is escaped
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+
+def code_ngrams(code: str) -> Set[str]:
+    """Return every distinct substring of up to NGRAM_SIZE characters."""
+    code = code.upper()
+    grams = set()
+    for size in range(1, NGRAM_SIZE + 1):
+        for start in range(len(code) - size + 1):
+            grams.add(code[start:start + size])
+    return grams
+
+
+def query_ngrams(fragment: str) -> List[str]:
+    """Return the grams that must all be present for a code to contain fragment."""
+    fragment = fragment.upper()
+    if len(fragment) <= NGRAM_SIZE:
+        return [fragment]
+    grams = []
+    for start in range(len(fragment) - NGRAM_SIZE + 1):
+        gram = fragment[start:start + NGRAM_SIZE]
+        if gram not in grams:
+            grams.append(gram)
+    return grams
+
+
+def create_ngram_table(cursor):
+    """Create the n-gram posting table if it does not exist."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS code_ngrams(
+            gram TEXT NOT NULL,
+            code_id INTEGER NOT NULL,
+            PRIMARY KEY (gram, code_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def has_ngram_index(cursor) -> bool:
+    """Check whether the n-gram posting table exists."""
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'code_ngrams'"
+    )
+    return cursor.fetchone() is not None
+
+
+def code_deletions(code: str, max_deletions: int = FUZZY_MAX_DISTANCE) -> List[Tuple[str, int, int]]:
+    """Return (variant, deletions, mask) for every way of deleting up to
+    max_deletions characters from code; mask has a bit set per deleted position."""
+    code = code.upper()
+    variants = []
+    for deletions in range(min(max_deletions, len(code) - 1) + 1):
+        for positions in combinations(range(len(code)), deletions):
+            variant = "".join(char for position, char in enumerate(code) if position not in positions)
+            variants.append((variant, deletions, sum(1 << position for position in positions)))
+    return variants
+
+
+def create_fuzzy_table(cursor):
+    """Create the deletion-neighborhood table if it does not exist."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS code_deletes(
+            variant TEXT NOT NULL,
+            mask INTEGER NOT NULL,
+            code_id INTEGER NOT NULL,
+            deletions INTEGER NOT NULL,
+            PRIMARY KEY (variant, mask, code_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def has_fuzzy_index(cursor) -> bool:
+    """Check whether the deletion-neighborhood table exists."""
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'code_deletes'"
+    )
+    return cursor.fetchone() is not None
+
+
+def index_fault_code(cursor, code_id: int, code: str, title: Optional[str] = None,
+                     facets: Sequence[str] = ()):
+    """Add the aliases, facets, n-gram postings and deletion variants for a single fault code row."""
+    cursor.executemany(
+        "INSERT OR IGNORE INTO code_aliases (alias, code_id) VALUES (?, ?)",
+        [(alias, code_id) for alias in record_aliases(code, title)]
+    )
+    cursor.executemany(
+        "INSERT OR IGNORE INTO code_facets (facet, code_id) VALUES (?, ?)",
+        [(facet, code_id) for facet in facets]
+    )
+    cursor.executemany(
+        "INSERT OR IGNORE INTO code_ngrams (gram, code_id) VALUES (?, ?)",
+        [(gram, code_id) for gram in code_ngrams(code)]
+    )
+    if has_fuzzy_index(cursor):
+        cursor.executemany(
+            "INSERT OR IGNORE INTO code_deletes (variant, mask, code_id, deletions) VALUES (?, ?, ?, ?)",
+            [(variant, mask, code_id, deletions) for variant, deletions, mask in code_deletions(code)]
+        )
+
+
+def unindex_fault_code(cursor, code_id: int, code: str, title: Optional[str] = None,
+                       facets: Sequence[str] = ()):
+    """Remove the aliases, facets, n-gram postings and deletion variants for a single fault code row."""
+    cursor.executemany(
+        "DELETE FROM code_aliases WHERE alias = ? AND code_id = ?",
+        [(alias, code_id) for alias in record_aliases(code, title)]
+    )
+    cursor.executemany(
+        "DELETE FROM code_facets WHERE facet = ? AND code_id = ?",
+        [(facet, code_id) for facet in facets]
+    )
+    cursor.executemany(
+        "DELETE FROM code_ngrams WHERE gram = ? AND code_id = ?",
+        [(gram, code_id) for gram in code_ngrams(code)]
+    )
+    if has_fuzzy_index(cursor):
+        cursor.executemany(
+            "DELETE FROM code_deletes WHERE variant = ? AND mask = ? AND code_id = ?",
+            [(variant, mask, code_id) for variant, _, mask in code_deletions(code)]
+        )
+
+
+def build_ngram_index(conn: sqlite3.Connection) -> int:
+    """Rebuild the n-gram index from scratch. Returns the number of codes indexed."""
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS code_ngrams")
+    create_ngram_table(cursor)
+
+    cursor.execute("SELECT id, code FROM fault_codes")
+    rows = cursor.fetchall()
+    cursor.executemany(
+        "INSERT OR IGNORE INTO code_ngrams (gram, code_id) VALUES (?, ?)",
+        ((gram, code_id) for code_id, code in rows for gram in code_ngrams(code))
+    )
+    conn.commit()
+    return len(rows)
+
+
+def ensure_ngram_index(conn: sqlite3.Connection) -> bool:
+    """Build the n-gram index for databases created before it existed.
+
+    Returns True if the index is available afterwards.
+    """
+    cursor = conn.cursor()
+    if has_ngram_index(cursor):
+        return True
+    try:
+        build_ngram_index(conn)
+        return True
+    except sqlite3.OperationalError:
+        # Read-only database; partial matches fall back to LIKE scans
+        conn.rollback()
+        return False
+
+
+def build_fuzzy_index(conn: sqlite3.Connection) -> int:
+    """Rebuild the deletion-neighborhood index. Returns the number of codes indexed."""
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS code_deletes")
+    create_fuzzy_table(cursor)
+
+    cursor.execute("SELECT id, code FROM fault_codes")
+    rows = cursor.fetchall()
+    cursor.executemany(
+        "INSERT OR IGNORE INTO code_deletes (variant, mask, code_id, deletions) VALUES (?, ?, ?, ?)",
+        ((variant, mask, code_id, deletions)
+         for code_id, code in rows
+         for variant, deletions, mask in code_deletions(code))
+    )
+    conn.commit()
+    return len(rows)
+
+
+def ensure_fuzzy_index(conn: sqlite3.Connection) -> bool:
+    """Build the deletion-neighborhood index if missing.
+
+    Returns True if the index is available afterwards.
+    """
+    cursor = conn.cursor()
+    if has_fuzzy_index(cursor):
+        return True
+    try:
+        build_fuzzy_index(conn)
+        return True
+    except sqlite3.OperationalError:
+        # Read-only database; similar codes are found by scanning all codes
+        conn.rollback()
+        return False
+
+
+def index_tables(cursor) -> Set[str]:
+    """Return which of the optional lookup index tables exist, in one query."""
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('code_ngrams', 'code_deletes')"
+    )
+    return {name for name, in cursor.fetchall()}
+
+
+def _gram_density(cursor, grams: Sequence[str]) -> Optional[bool]:
+    """Check whether every gram occurs in more than DENSE_GRAM_CODES codes.
+
+    Returns None when a gram checked occurs in no code at all, so nothing
+    can contain the fragment.
+    """
+    for gram in grams:
+        cursor.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM code_ngrams WHERE gram = ? LIMIT ?)",
+            (gram, DENSE_GRAM_CODES + 1)
+        )
+        count = cursor.fetchone()[0]
+        if not count:
+            return None
+        if count <= DENSE_GRAM_CODES:
+            return False
+    return True
+
+
+def _partial_filter(cursor, fragment: str, pattern: str, bounded: bool,
+                    ngram_index: bool = None) -> Optional[Tuple[str, tuple]]:
+    """WHERE clause selecting the codes LIKE pattern, and its parameters.
+
+    Candidates come from the n-gram index, unless the query is bounded
+    (LIMIT) and its grams are so common that scanning codes in order and
+    stopping early touches fewer rows than collecting every candidate.
+    Returns None for a bounded query that the index shows cannot match.
+    """
+    if ngram_index is None:
+        ngram_index = has_ngram_index(cursor)
+    if not fragment or not ngram_index:
+        return "code LIKE ?", (pattern,)
+
+    grams = query_ngrams(fragment)
+    if bounded:
+        density = _gram_density(cursor, grams)
+        if density is None:
+            return None
+        if density:
+            return "code LIKE ?", (pattern,)
+    candidates = " INTERSECT ".join(
+        "SELECT code_id FROM code_ngrams WHERE gram = ?" for _ in grams
+    )
+    # The LIKE only runs against the candidate rows and keeps the exact
+    # semantics of the old scan (case folding, suffix anchoring)
+    return f"id IN ({candidates}) AND code LIKE ?", (*grams, pattern)
+
+
+def page_cursor(code: str, code_id: int) -> str:
+    """Return the cursor of the page after a record: its code and row id.
+
+    Pages can share a code, so records are listed in (code, id) order and
+    the cursor carries both ("00438:1199").
+    """
+    return f"{code}:{code_id}"
+
+
+def _after_filter(after: str) -> Tuple[str, tuple]:
+    """WHERE clause selecting the records listed after a page cursor.
+
+    A bare code (the cursor of links made before records were keyed by
+    page) selects the records after every record of that code.
+    """
+    code, _, code_id = after.partition(":")
+    if not code_id.isdigit():
+        return "code > ?", (code,)
+    return "(code, id) > (?, ?)", (code, int(code_id))
+
+
+def _split_page(rows: list, page_size: int) -> Tuple[list, Optional[str]]:
+    """Split rows selected as (code, id, *columns) into one page of columns and the next cursor."""
+    page = [row[2:] for row in rows[:page_size]]
+    if len(rows) > page_size:
+        code, code_id = rows[page_size - 1][:2]
+        return page, page_cursor(code, code_id)
+    return page, None
+
+
+def partial_matches(cursor, fragment: str, columns: str = SUMMARY_COLUMNS,
+                    suffix: bool = False, limit: int = None, after: str = None) -> list:
+    """Find codes containing fragment (or ending with it if suffix is set).
+
+    Returns the same rows as ``code LIKE '%fragment%'`` (or ``'%fragment'``)
+    in (code, id) order, but resolves candidates through the n-gram index
+    when it is available. With after set to a page cursor (see
+    page_cursor), only records listed after it are returned.
+    """
+    pattern = f"%{fragment}" if suffix else f"%{fragment}%"
+    found = _partial_filter(cursor, fragment, pattern, bool(limit))
+    if found is None:
+        return []
+    where, params = found
+    if after is not None:
+        after_where, after_params = _after_filter(after)
+        where, params = f"{where} AND {after_where}", params + after_params
+    limit_clause = f" LIMIT {int(limit)}" if limit else ""
+
+    cursor.execute(
+        f"SELECT {columns} FROM fault_codes WHERE {where} ORDER BY code, id{limit_clause}",
+        params
+    )
+    return cursor.fetchall()
+
+
+def _capped_count(cursor, query: str, params: Sequence, limit: int) -> Tuple[int, bool]:
+    """Count the rows of query, stopping after limit + 1 of them.
+
+    Returns (count, exact); when exact is False there are more than
+    limit rows and count is limit.
+    """
+    cursor.execute(f"SELECT COUNT(*) FROM ({query} LIMIT ?)", (*params, limit + 1))
+    count = cursor.fetchone()[0]
+    if count > limit:
+        return limit, False
+    return count, True
+
+
+def count_partial_matches(cursor, fragment: str, limit: int = COUNT_LIMIT) -> Tuple[int, bool]:
+    """Count the codes containing fragment, up to limit (see _capped_count)."""
+    found = _partial_filter(cursor, fragment, f"%{fragment}%", True)
+    if found is None:
+        return 0, True
+    where, params = found
+    return _capped_count(cursor, f"SELECT 1 FROM fault_codes WHERE {where}", params, limit)
+
+
+def partial_page(cursor, fragment: str, after: str = None, page_size: int = PAGE_SIZE,
+                 columns: str = SUMMARY_COLUMNS) -> Tuple[list, Optional[str]]:
+    """Return one page of partial matches and the cursor of the next page.
+
+    The cursor is that of the last record on the page (see page_cursor),
+    or None on the last page.
+    """
+    rows = partial_matches(cursor, fragment, f"code, id, {columns}", limit=page_size + 1, after=after)
+    return _split_page(rows, page_size)
+
+
+def _range_filter(start: str, end: Optional[str], facets: Sequence[str] = (),
+                  counts: Dict[str, int] = None, page: bool = False) -> Tuple[str, tuple]:
+    where, params = ("code >= ?", (start,)) if end is None else ("code >= ? AND code <= ?", (start, end))
+    if facets:
+        facet_where, facet_params = _facet_filter(facets, counts or {}, page)
+        where, params = f"{facet_where} AND {where}", facet_params + params
+    return where, params
+
+
+def browse_codes(cursor, start: str = "", end: str = None, after: str = None,
+                 page_size: int = PAGE_SIZE, columns: str = SUMMARY_COLUMNS,
+                 facets: Sequence[str] = (), counts: Dict[str, int] = None) -> Tuple[list, Optional[str]]:
+    """List codes from start to end (inclusive, in (code, id) order), one page at a time.
+
+    Codes compare as strings, so "00500" to "00600" also covers longer
+    codes such as "005001". Pages are read with a range scan of the code
+    index (which is in (code, id) order); pass the returned cursor as
+    after to get the next page. With facets, only records filed under all
+    of them are listed; counts (see facet_counts) orders the intersection.
+    """
+    where, params = _range_filter(start, end, facets, counts, page=True)
+    if after is not None:
+        after_where, after_params = _after_filter(after)
+        where, params = f"{where} AND {after_where}", params + after_params
+    cursor.execute(
+        f"SELECT code, id, {columns} FROM fault_codes WHERE {where} ORDER BY code, id LIMIT ?",
+        (*params, page_size + 1)
+    )
+    return _split_page(cursor.fetchall(), page_size)
+
+
+def count_codes(cursor, start: str = "", end: str = None, limit: int = COUNT_LIMIT,
+                facets: Sequence[str] = (), counts: Dict[str, int] = None) -> Tuple[int, bool]:
+    """Count the codes from start to end (under facets), up to limit (see _capped_count)."""
+    where, params = _range_filter(start, end, facets, counts)
+    return _capped_count(cursor, f"SELECT 1 FROM fault_codes WHERE {where}", params, limit)
+
+
+def clean_code(fault_code: str) -> str:
+    """Strip spaces and brackets pasted along with a code."""
+    return re.sub(r'[\[\]\s]+', '', fault_code)
+
+
+class CodeParts(NamedTuple):
+    """Canonical components of a code as typed or pasted."""
+    obd: Optional[str]
+    vag: Optional[str]
+    suffix: Optional[str]
+
+
+def parse_code(text: str) -> CodeParts:
+    """Split a code as typed or pasted into its canonical components.
+
+    Handles "P1757", "01757", "1757", "P1757 00 [237]" (suffix "00 [237]"),
+    "P2BA6/01174" and a trailing " - description". Components that are
+    not present, or input that is not a list of codes, give None.
+    """
+    text = (text or "").strip().upper()
+    suffix = None
+    match = CODE_SUFFIX.search(text)
+    if match:
+        suffix = f"{match.group(1)} [{match.group(2)}]"
+        text = text[:match.start()]
+    text = text.split(" - ", 1)[0].strip()
+    if not CODE_LIST.match(text):
+        return CodeParts(None, None, suffix)
+
+    obd = vag = None
+    for token in re.split(r"\s*/\s*", text):
+        if obd is None and OBD_CODE.match(token):
+            obd = token
+        elif vag is None and VAG_NUMBER.match(token):
+            vag = token.zfill(5)
+    return CodeParts(obd, vag, suffix)
+
+
+def code_keys(code: str, title: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Return the canonical (vag_code, obd_code) of a record.
+
+    Each is the record's own code if it has that form, else the first one
+    listed in a title made of codes ("16815/P0431/001073").
+    """
+    tokens = [code.upper()]
+    title = (title or "").strip().upper()
+    if CODE_LIST.match(title):
+        tokens += re.split(r"\s*/\s*", title)
+    vag = next((token for token in tokens if VAG_CODE.match(token)), None)
+    obd = next((token for token in tokens if OBD_CODE.match(token)), None)
+    return vag, obd
+
+
+def page_codes(text: Optional[str]) -> List[str]:
+    """Return the codes a wiki page name or title lists, in order.
+
+    "B1487/038023" gives B1487 and 038023; a trailing " - description" is
+    ignored, and text that is not a list of codes gives none.
+    """
+    text = (text or "").strip().upper().split(" - ", 1)[0].strip()
+    if not CODE_LIST.match(text):
+        return []
+    return [token for token in re.split(r"\s*/\s*", text) if PAGE_CODE.match(token)]
+
+
+def page_code(text: Optional[str]) -> Optional[str]:
+    """Return the code a page is filed under: the VAG 5-digit code it lists,
+    else its first code."""
+    codes = page_codes(text)
+    return next((code for code in codes if VAG_CODE.match(code)), codes[0] if codes else None)
+
+
+def record_aliases(code: str, title: Optional[str]) -> List[str]:
+    """Return every code a record is found by: its own code, the codes its
+    title lists and its canonical keys."""
+    aliases = [code.upper(), *page_codes(title), *code_keys(code, title)]
+    return list(dict.fromkeys(alias for alias in aliases if alias))
+
+
+def lookup_keys(fault_code: str) -> List[str]:
+    """Return the keys a normalized query is probed with, in priority order.
+
+    The query itself, its cleaned form, then its VAG and OBD components.
+    """
+    parts = parse_code(fault_code)
+    keys = (fault_code, clean_code(fault_code), parts.vag, parts.obd)
+    return list(dict.fromkeys(key for key in keys if key))
+
+
+def ensure_code_keys(conn: sqlite3.Connection) -> bool:
+    """Add the canonical key columns if needed, and fill them for rows
+    without keys.
+
+    Returns True if the keys are available afterwards.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("PRAGMA table_info(fault_codes)")
+        columns = {row[1] for row in cursor.fetchall()}
+        for column in CODE_KEY_COLUMNS:
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE fault_codes ADD COLUMN {column} TEXT")
+
+        cursor.execute("SELECT id, code, title FROM fault_codes WHERE vag_code IS NULL AND obd_code IS NULL")
+        updates = []
+        for row_id, code, title in cursor.fetchall():
+            vag, obd = code_keys(code, title)
+            if vag or obd:
+                updates.append((vag, obd, row_id))
+        cursor.executemany("UPDATE fault_codes SET vag_code = ?, obd_code = ? WHERE id = ?", updates)
+        conn.commit()
+        return True
+    except sqlite3.OperationalError:
+        conn.rollback()
+        return False
+
+
+def create_fault_codes_table(cursor):
+    """Create the records table (see FAULT_CODES_TABLE) and its code index."""
+    cursor.execute(FAULT_CODES_TABLE.format(name="fault_codes"))
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fault_codes_code ON fault_codes(code)")
+
+
+def ensure_page_keys(conn: sqlite3.Connection) -> bool:
+    """Key the records by their source page instead of their code.
+
+    Databases from before had UNIQUE(code), so a page saved under a code
+    another page already had replaced that page's record. SQLite cannot
+    drop a constraint, so the table is rebuilt without it; every row keeps
+    its id (and any column the new table lacks), so the other indexes stay
+    valid. Returns True if the table is keyed by page afterwards.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("PRAGMA table_info(fault_codes)")
+        columns = [(row[1], row[2]) for row in cursor.fetchall()]
+        if not columns:
+            return False
+        if any(column == "page" for column, _ in columns):
+            return True
+
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("DROP TABLE IF EXISTS fault_codes_paged")
+        cursor.execute(FAULT_CODES_TABLE.format(name="fault_codes_paged"))
+        cursor.execute("PRAGMA table_info(fault_codes_paged)")
+        new_columns = {row[1] for row in cursor.fetchall()}
+        for column, column_type in columns:
+            if column not in new_columns:
+                cursor.execute(f"ALTER TABLE fault_codes_paged ADD COLUMN {column} {column_type}")
+        names = ", ".join(column for column, _ in columns)
+        cursor.execute(f"INSERT INTO fault_codes_paged ({names}) SELECT {names} FROM fault_codes")
+
+        # Dropping the table drops its triggers and indexes with it
+        cursor.execute("DROP TABLE fault_codes")
+        cursor.execute("ALTER TABLE fault_codes_paged RENAME TO fault_codes")
+        create_fault_codes_table(cursor)
+        if has_fts_index(cursor):
+            create_fts_triggers(cursor)
+        conn.commit()
+        return True
+    except sqlite3.OperationalError:
+        conn.rollback()
+        return False
+
+
+def create_alias_table(cursor):
+    """Create the alias posting table if it does not exist."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS code_aliases(
+            alias TEXT NOT NULL,
+            code_id INTEGER NOT NULL,
+            PRIMARY KEY (alias, code_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def has_alias_index(cursor) -> bool:
+    """Check whether the alias table exists."""
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'code_aliases'"
+    )
+    return cursor.fetchone() is not None
+
+
+def build_alias_index(conn: sqlite3.Connection) -> int:
+    """Rebuild the alias table from the records. Returns the number of records indexed."""
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS code_aliases")
+    create_alias_table(cursor)
+
+    cursor.execute("SELECT id, code, title FROM fault_codes")
+    rows = cursor.fetchall()
+    cursor.executemany(
+        "INSERT OR IGNORE INTO code_aliases (alias, code_id) VALUES (?, ?)",
+        ((alias, code_id) for code_id, code, title in rows for alias in record_aliases(code, title))
+    )
+    conn.commit()
+    return len(rows)
+
+
+def ensure_alias_index(conn: sqlite3.Connection) -> bool:
+    """Build the alias table if missing.
+
+    Returns True if the table is available afterwards.
+    """
+    cursor = conn.cursor()
+    if has_alias_index(cursor):
+        return True
+    try:
+        build_alias_index(conn)
+        return True
+    except sqlite3.OperationalError:
+        # Read-only database; codes are only found by their own code
+        conn.rollback()
+        return False
+
+
+def record_facets(title: Optional[str], full_content: Optional[str] = None,
+                  technical_info: Optional[str] = None) -> List[str]:
+    """Return the keys of the FACETS a record is filed under, in FACETS order.
+
+    Matched against its title, the headline of its page ("16955/P0571/001393
+    - Brake Light Switch (F): Implausible Signal", the first line of
+    full_content) and its technical information; every run of up to
+    _FACET_TERM_WORDS words is one dictionary probe.
+    """
+    headline = (full_content or "").split("\n", 1)[0]
+    text = " ".join(part for part in (title, headline, technical_info) if part)
+    cased = re.findall(r"[A-Za-z0-9]+", text)
+    words = [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+             for word in (word.lower() for word in cased)]
+    found = set()
+    for terms, probed, longest in ((_FACET_TERMS, words, _FACET_TERM_WORDS),
+                                   (_FACET_CASED_TERMS, cased, _FACET_CASED_TERM_WORDS)):
+        for size in range(1, longest + 1):
+            for start in range(len(probed) - size + 1):
+                found.update(terms.get(" ".join(probed[start:start + size]), ()))
+    return [key for key in FACET_KEYS if key in found]
+
+
+def create_facet_table(cursor):
+    """Create the facet posting table if it does not exist.
+
+    Each facet's posting list is read in code_id order off the primary key.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS code_facets(
+            facet TEXT NOT NULL,
+            code_id INTEGER NOT NULL,
+            PRIMARY KEY (facet, code_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def has_facet_index(cursor) -> bool:
+    """Check whether the facet table exists."""
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'code_facets'"
+    )
+    return cursor.fetchone() is not None
+
+
+def build_facet_index(conn: sqlite3.Connection) -> int:
+    """Extract the facets of every record into a new facet table. Returns the number of records indexed."""
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS code_facets")
+    create_facet_table(cursor)
+
+    # Only the headline of each page is read, not the whole text
+    cursor.execute(
+        "SELECT id, title, substr(full_content, 1, instr(full_content || char(10), char(10)) - 1), "
+        "technical_info FROM fault_codes"
+    )
+    rows = cursor.fetchall()
+    cursor.executemany(
+        "INSERT OR IGNORE INTO code_facets (facet, code_id) VALUES (?, ?)",
+        ((facet, code_id) for code_id, title, headline, technical_info in rows
+         for facet in record_facets(title, headline, technical_info))
+    )
+    conn.commit()
+    return len(rows)
+
+
+def ensure_facet_index(conn: sqlite3.Connection) -> bool:
+    """Build the facet table if missing.
+
+    Returns True if the table is available afterwards.
+    """
+    cursor = conn.cursor()
+    if has_facet_index(cursor):
+        return True
+    try:
+        build_facet_index(conn)
+        return True
+    except sqlite3.OperationalError:
+        # Read-only database; browsing by facet is unavailable
+        conn.rollback()
+        return False
+
+
+def facet_counts(cursor) -> Dict[str, int]:
+    """Return the number of records filed under each facet."""
+    cursor.execute("SELECT facet, COUNT(*) FROM code_facets GROUP BY facet")
+    return dict(cursor.fetchall())
+
+
+def _facet_filter(facets: Sequence[str], counts: Dict[str, int], page: bool = False) -> Tuple[str, tuple]:
+    """WHERE clause selecting the records filed under every one of facets.
+
+    The posting lists are intersected smallest first: the shortest one is
+    walked in code_id order and each id is looked up in the others by
+    primary key, so the cost follows the rarest facet (CROSS JOIN keeps
+    SQLite from reordering the lists). For one page of a single common
+    facet it is cheaper to walk the code index and probe the posting list
+    per code, which stops as soon as the page is full.
+    """
+    ordered = sorted(dict.fromkeys(facets), key=lambda facet: counts.get(facet, 0))
+    if page and len(ordered) == 1 and counts.get(ordered[0], 0) >= FACET_SCAN_MIN:
+        return ("EXISTS (SELECT 1 FROM code_facets WHERE facet = ? AND code_id = fault_codes.id)",
+                (ordered[0],))
+    joins = "".join(f" CROSS JOIN code_facets p{i}" for i in range(1, len(ordered)))
+    matches = " AND ".join(f"p{i}.facet = ? AND p{i}.code_id = p0.code_id" for i in range(1, len(ordered)))
+    return (f"id IN (SELECT p0.code_id FROM code_facets p0{joins} WHERE p0.facet = ?"
+            f"{' AND ' + matches if matches else ''})", (ordered[0], *ordered[1:]))
+
+
+def code_distance(a: str, b: str, limit: int = FUZZY_MAX_DISTANCE) -> int:
+    """Levenshtein distance, except that codes differing only by one swap of
+    neighbouring characters (00352 for 00532) are one edit apart.
+
+    Stops early and returns limit + 1 once the distance must exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    # Shared leading and trailing characters never change the distance, and
+    # codes in the same neighborhood mostly differ in a character or two
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if not a or not b:
+        return min(len(a) + len(b), limit + 1)
+
+    if len(a) == len(b):
+        if len(a) == 1:
+            return 1
+        if len(a) == 2:
+            return 1 if a == b[::-1] else min(2, limit + 1)
+        if limit <= 2:
+            # Both ends differ, so two edits are either substitutions of
+            # the two ends or a deletion plus an insertion that shift the
+            # characters in between
+            if limit == 2 and (a[1:-1] == b[1:-1] or a[1:] == b[:-1] or a[:-1] == b[1:]):
+                return 2
+            return limit + 1
+
+    # Every edit fixes at most one character the strings do not have in
+    # common, which rejects most candidates without the full table
+    common = sum(min(a.count(char), b.count(char)) for char in set(a))
+    if max(len(a), len(b)) - common > limit:
+        return limit + 1
+
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        previous_row, row = row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1,
+                         previous_row[j - 1] + (a[i - 1] != b[j - 1]))
+        if min(row) > limit:
+            return limit + 1
+    return min(row[-1], limit + 1)
+
+
+def code_family(code: str) -> Tuple[str, int]:
+    """Group codes by kind: the OBD system letter (or none for VAG numbers) and length."""
+    return (code[0] if code[:1].isalpha() else "", len(code))
+
+
+def _similarity_key(fault_code: str, code: str, distance: int):
+    """Rank nearer codes first, then codes of the same family, then longer shared prefixes."""
+    shared_prefix = 0
+    for left, right in zip(fault_code, code):
+        if left != right:
+            break
+        shared_prefix += 1
+    return (distance, code_family(code) != code_family(fault_code), -shared_prefix, code)
+
+
+def _without(code: str, positions: Sequence[int]) -> str:
+    return "".join(char for position, char in enumerate(code) if position not in positions)
+
+
+def _fuzzy_probes(fault_code: str, tier: int) -> Tuple[Set[Tuple[str, int]], Set[Tuple[str, int]]]:
+    """Return the index entries that codes found in a search tier must have.
+
+    Tier 1 finds every code one edit away (plus same-length codes where a
+    character moved, two edits away): a shared variant one deletion from
+    each side at most. Tier 2 finds same-length codes two substitutions
+    away, which share the variant with both substituted positions deleted.
+    Tier 3 finds codes of another length two edits away.
+
+    Returns (loose, masked): (variant, deletions) entries matched on the
+    variant alone, and (variant, mask) entries that must also have been
+    reached by deleting exactly those positions.
+    """
+    code = fault_code
+    length = len(code)
+    loose = set()
+    masked = set()
+    if tier == 1:
+        loose.add((code, 1))
+        for i in range(length):
+            loose.add((_without(code, (i,)), 0))
+            loose.add((_without(code, (i,)), 1))
+    elif tier == 2:
+        for i, j in combinations(range(length), 2):
+            masked.add((_without(code, (i, j)), (1 << i) | (1 << j)))
+    else:
+        loose.add((code, 2))
+        for i, j in combinations(range(length), 2):
+            variant = _without(code, (i, j))
+            loose.add((variant, 0))
+            # One character dropped and one substituted: the code lacks
+            # either position and has the other (shifted if after the gap)
+            masked.add((variant, 1 << i))
+            masked.add((variant, 1 << (j - 1)))
+        for i in range(length):
+            # One character substituted at i and one inserted at t
+            variant = _without(code, (i,))
+            for t in range(length + 1):
+                position = i if t > i else i + 1
+                masked.add((variant, (1 << position) | (1 << t)))
+    return ({entry for entry in loose if entry[0]},
+            {entry for entry in masked if entry[0]})
+
+
+def _fuzzy_candidates(cursor, fault_code: str, tier: int) -> List[Tuple[int, str]]:
+    """Return (id, code) of the codes the index finds in a search tier."""
+    loose, masked = _fuzzy_probes(fault_code, tier)
+
+    selects = []
+    params = []
+    for deletions in sorted({deletions for _, deletions in loose}):
+        variants = [variant for variant, count in loose if count == deletions]
+        placeholders = ", ".join("?" for _ in variants)
+        selects.append(f"SELECT code_id FROM code_deletes WHERE variant IN ({placeholders}) AND deletions = ?")
+        params.extend(variants)
+        params.append(deletions)
+    if masked:
+        matches = " OR ".join("(variant = ? AND mask = ?)" for _ in masked)
+        selects.append(f"SELECT code_id FROM code_deletes WHERE {matches}")
+        params.extend(value for entry in masked for value in entry)
+    if not selects:
+        return []
+
+    cursor.execute(
+        f"SELECT id, code FROM fault_codes WHERE id IN ({' UNION '.join(selects)})",
+        params
+    )
+    return cursor.fetchall()
+
+
+# After each search tier, the codes ranked below these key prefixes are
+# final: later tiers only find codes two edits away (tier 2), and then
+# only codes of another length, which are never of the query's family
+_FUZZY_SETTLED = {1: (2, False), 2: (2, True)}
+
+
+def similar_codes(cursor, fault_code: str, columns: str = SUMMARY_COLUMNS,
+                  limit: int = FUZZY_LIMIT, max_distance: int = FUZZY_MAX_DISTANCE,
+                  fuzzy_index: bool = None) -> list:
+    """Find the codes nearest to a mistyped code, within max_distance (1 or 2) edits.
+
+    Candidates come from the deletion-neighborhood index in up to three
+    tiers (see _fuzzy_probes); the search stops as soon as limit codes
+    are known to rank ahead of anything a later tier could find. Rows
+    are returned best first (see _similarity_key). fuzzy_index says
+    whether the index exists, if the caller already knows.
+    """
+    fault_code = fault_code.upper()
+    if len(fault_code) < 2:
+        return []
+
+    if fuzzy_index is None:
+        fuzzy_index = has_fuzzy_index(cursor)
+    if fuzzy_index:
+        found = {}
+        for tier in (1, 2, 3):
+            if tier > 1 and max_distance < 2:
+                break
+            for code_id, code in _fuzzy_candidates(cursor, fault_code, tier):
+                if code_id not in found:
+                    edits = code_distance(fault_code, code, max_distance)
+                    if 0 < edits <= max_distance:
+                        found[code_id] = _similarity_key(fault_code, code, edits)
+            settled = _FUZZY_SETTLED.get(tier)
+            if settled and sum(1 for key in found.values() if key[:2] < settled) >= limit:
+                break
+        ranked = [(key, code_id) for code_id, key in found.items()]
+    else:
+        cursor.execute("SELECT id, code FROM fault_codes")
+        ranked = []
+        for code_id, code in cursor.fetchall():
+            edits = code_distance(fault_code, code, max_distance)
+            if 0 < edits <= max_distance:
+                ranked.append((_similarity_key(fault_code, code, edits), code_id))
+
+    ids = [code_id for _, code_id in sorted(ranked)[:limit]]
+    if not ids:
+        return []
+    placeholders = ", ".join("?" for _ in ids)
+    cursor.execute(f"SELECT id, {columns} FROM fault_codes WHERE id IN ({placeholders})", ids)
+    rows = {row[0]: row[1:] for row in cursor.fetchall()}
+    return [rows[code_id] for code_id in ids if code_id in rows]
+
+
+def record_to_dict(row: Sequence) -> Dict[str, Optional[str]]:
+    """Map a row selected with RECORD_COLUMNS (or a prefix of them) to a dict."""
+    return dict(zip(RECORD_FIELDS, row))
+
+
+def summary_to_dict(row: Sequence) -> Dict[str, object]:
+    """Map a row selected with SUMMARY_COLUMNS to a dict."""
+    return dict(zip(SUMMARY_FIELDS, row))
+
+
+def record_hash(record: Sequence) -> str:
+    """Hash the displayed fields of a record, given in FULL_FIELDS order."""
+    content = "\x1f".join(value or "" for value in record[:len(FULL_FIELDS)])
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def ensure_content_hashes(conn: sqlite3.Connection) -> bool:
+    """Add the content_hash column if needed and fill it for rows without one.
+
+    Returns True if every row has a hash afterwards.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("PRAGMA table_info(fault_codes)")
+        if "content_hash" not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE fault_codes ADD COLUMN content_hash TEXT")
+
+        cursor.execute(f"SELECT id, {FULL_COLUMNS} FROM fault_codes WHERE content_hash IS NULL")
+        rows = cursor.fetchall()
+        cursor.executemany(
+            "UPDATE fault_codes SET content_hash = ? WHERE id = ?",
+            [(record_hash(row[1:]), row[0]) for row in rows]
+        )
+        conn.commit()
+        return True
+    except sqlite3.OperationalError:
+        conn.rollback()
+        return False
+
+
+def _partial_candidates(cursor, fragments: Sequence[str], limit: int, ngram_index: bool) -> list:
+    """First limit codes containing any of fragments, in code order, in one statement."""
+    clauses = []
+    params = []
+    for fragment in dict.fromkeys(fragments):
+        found = _partial_filter(cursor, fragment, f"%{fragment}%", True, ngram_index)
+        if found is not None:
+            clauses.append(f"({found[0]})")
+            params.extend(found[1])
+    if not clauses:
+        return []
+    cursor.execute(
+        f"SELECT {SUMMARY_COLUMNS} FROM fault_codes WHERE {' OR '.join(clauses)} ORDER BY code, id LIMIT ?",
+        (*params, limit)
+    )
+    return cursor.fetchall()
+
+
+def _lookup_fallbacks(cursor, fault_code: str, indexes: Set[str] = None) -> Tuple[str, object]:
+    """Run the partial and similar-code tiers for a code with no exact match.
+
+    Each tier is one statement (the similar tier up to three, see
+    similar_codes) and the first tier with results wins, so the
+    similar-code search only runs when no code contains the query. indexes is the result of
+    index_tables, if the caller already has it.
+    """
+    if indexes is None:
+        indexes = index_tables(cursor)
+
+    # Codes containing the query or its cleaned form, each listed once;
+    # only the first page is kept (see partial_page)
+    with stage("query_partial"):
+        results = _partial_candidates(cursor, (fault_code, clean_code(fault_code)), PAGE_SIZE,
+                                      "code_ngrams" in indexes)
+    if results:
+        return MATCH_PARTIAL, results
+
+    # Typos within a couple of edits
+    with stage("query_similar"):
+        similar_results = similar_codes(cursor, fault_code, fuzzy_index="code_deletes" in indexes)
+    if similar_results:
+        return MATCH_SIMILAR, similar_results
+    return MATCH_MISS, None
+
+
+def build_code_filter(cursor, error_rate: float = 0.01) -> BloomFilter:
+    """Build a Bloom filter of every code and alias in the database."""
+    try:
+        cursor.execute("SELECT DISTINCT alias FROM code_aliases")
+    except sqlite3.OperationalError:
+        cursor.execute("SELECT code FROM fault_codes")
+    keys = [key for key, in cursor.fetchall() if key]
+    return BloomFilter.from_items(keys, len(keys), error_rate)
+
+
+def _fetch_by_keys(cursor, keys: Sequence[str], chunk_size: int = BATCH_CHUNK_SIZE) -> Dict[str, List[tuple]]:
+    """Fetch every record found by each key, one statement per chunk of keys.
+
+    Each key is one seek in the alias table (see record_aliases). Returns
+    key -> records in code order, each as (page, id, *RECORD_COLUMNS);
+    keys without records are left out.
+    """
+    records = {}
+    for start in range(0, len(keys), chunk_size):
+        chunk = list(keys[start:start + chunk_size])
+        placeholders = ", ".join("?" for _ in chunk)
+        try:
+            cursor.execute(
+                f"SELECT alias, page, fault_codes.id, {RECORD_COLUMNS} FROM code_aliases "
+                f"JOIN fault_codes ON fault_codes.id = code_aliases.code_id "
+                f"WHERE alias IN ({placeholders}) ORDER BY code, fault_codes.id",
+                chunk
+            )
+        except sqlite3.OperationalError as e:
+            if "no such table" not in str(e):
+                raise
+            # Read-only database without aliases (see ensure_alias_index)
+            cursor.execute(
+                f"SELECT code, page, id, {RECORD_COLUMNS} FROM fault_codes WHERE code IN ({placeholders}) "
+                f"ORDER BY code, id",
+                chunk
+            )
+        for row in cursor.fetchall():
+            records.setdefault(row[0], []).append(row[1:])
+    return records
+
+
+def _resolve_keys(fault_code: str, keys: Sequence[str], records: Dict[str, List[tuple]]) -> Optional[Tuple[str, object]]:
+    """Resolve the first key that found records.
+
+    The record filed under the key itself wins over records only listing
+    it; that record, or the only record found, is an exact match if it is
+    the query's own record and a cleaned match otherwise. Several records
+    are a multiple match, listed as SUMMARY_COLUMNS rows.
+    """
+    for key in keys:
+        found = records.get(key)
+        if not found:
+            continue
+        own = [record for record in found if record[2] == key]
+        if len(own) == 1 or len(found) == 1:
+            record = (own[0] if own else found[0])[2:]
+            return (MATCH_EXACT if record[0] == fault_code else MATCH_CLEANED), record
+        return MATCH_MULTIPLE, [(code, title, page, code_id) for page, code_id, code, title, *_ in found]
+    return None
+
+
+def lookup_exact(cursor, fault_code: str, code_filter=None) -> Optional[Tuple[str, object]]:
+    """Resolve a normalized code through the exact, cleaned and multiple tiers only.
+
+    Returns (match_type, result) as lookup_code does, or None when no
+    record is filed under or lists any of the code's keys.
+    """
+    keys = lookup_keys(fault_code)
+    if code_filter is not None:
+        keys = [key for key in keys if key in code_filter]
+    if not keys:
+        return None
+    # Every key in one statement, each one seek in the alias table
+    with stage("query_exact"):
+        return _resolve_keys(fault_code, keys, _fetch_by_keys(cursor, keys))
+
+
+def lookup_code(cursor, fault_code: str, code_index=None, code_filter=None) -> Tuple[str, object]:
+    """Resolve a normalized code through the lookup tiers.
+
+    Returns (match_type, result) where result is the full record (with its
+    content hash and row id, see RECORD_COLUMNS) for an exact match or a cleaned match (found by the
+    cleaned query, by its canonical VAG or OBD code, see parse_code, or by
+    a code its page lists), a list of SUMMARY_COLUMNS rows for multiple,
+    partial and similar matches (every page listing the code; the first
+    PAGE_SIZE partial matches in code order), or None.
+
+    code_index is an optional in-memory index of every code (see
+    shared_index.SharedIndex); when given, the query itself is looked up
+    in it first and, if exactly one record has that code, it is read from
+    SQLite by row id.
+    code_filter is an optional Bloom filter of every code and alias (see
+    build_code_filter); keys it rules out are not probed.
+    """
+    if code_index is not None and (code_filter is None or fault_code in code_filter):
+        with stage("query_exact"):
+            found = code_index.find(fault_code)
+            if len(found) == 1:
+                cursor.execute(
+                    f"SELECT {RECORD_COLUMNS} FROM fault_codes WHERE id = ?",
+                    (found[0][0],)
+                )
+                result = cursor.fetchone()
+                if result:
+                    return MATCH_EXACT, result
+        # The query may still be an alias of another record, and a code
+        # several pages share is reported as a multiple match below
+
+    return lookup_exact(cursor, fault_code, code_filter) or _lookup_fallbacks(cursor, fault_code)
+
+
+def lookup_codes(cursor, fault_codes: Sequence[str], chunk_size: int = BATCH_CHUNK_SIZE,
+                 code_index=None, code_filter=None) -> List[Tuple[str, object]]:
+    """Resolve many normalized codes at once, in input order.
+
+    Exact, cleaned and multiple matches for the whole batch are fetched
+    with a handful of IN queries over the alias table; only the
+    remaining codes go through the partial and similar tiers one by one.
+    Each entry has the same shape as the return value of lookup_code.
+    Keys ruled out by a code_filter are left out of the IN lists;
+    code_index is accepted for symmetry with lookup_code and not needed,
+    as the batch statements read every match anyway.
+    """
+    unique_codes = list(dict.fromkeys(fault_codes))
+    code_keys_by_code = {}
+    for code in unique_codes:
+        keys = lookup_keys(code)
+        if code_filter is not None:
+            keys = [key for key in keys if key in code_filter]
+        code_keys_by_code[code] = keys
+
+    with stage("query_exact"):
+        all_keys = list(dict.fromkeys(key for keys in code_keys_by_code.values() for key in keys))
+        records = _fetch_by_keys(cursor, all_keys, chunk_size)
+
+    resolved = {}
+    indexes = None
+    for code in unique_codes:
+        found = _resolve_keys(code, code_keys_by_code[code], records)
+        if found:
+            resolved[code] = found
+        else:
+            if indexes is None:
+                indexes = index_tables(cursor)
+            resolved[code] = _lookup_fallbacks(cursor, code, indexes)
+
+    return [resolved[code] for code in fault_codes]
+
+
+def has_fts_index(cursor) -> bool:
+    """Check whether the full-text index exists."""
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fault_codes_fts'"
+    )
+    return cursor.fetchone() is not None
+
+
+def create_fts_triggers(cursor):
+    """Create the triggers that keep the full-text index in sync with the records."""
+    columns = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"new.{column}" for column in FTS_COLUMNS)
+    old_values = ", ".join(f"old.{column}" for column in FTS_COLUMNS)
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS fault_codes_fts_insert AFTER INSERT ON fault_codes BEGIN
+            INSERT INTO fault_codes_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS fault_codes_fts_delete AFTER DELETE ON fault_codes BEGIN
+            INSERT INTO fault_codes_fts (fault_codes_fts, rowid, {columns})
+            VALUES ('delete', old.id, {old_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS fault_codes_fts_update AFTER UPDATE OF {columns} ON fault_codes BEGIN
+            INSERT INTO fault_codes_fts (fault_codes_fts, rowid, {columns})
+            VALUES ('delete', old.id, {old_values});
+            INSERT INTO fault_codes_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    ''')
+
+
+def build_fts_index(conn: sqlite3.Connection):
+    """Create the full-text index and the triggers that keep it in sync."""
+    cursor = conn.cursor()
+    columns = ", ".join(FTS_COLUMNS)
+    cursor.execute("DROP TABLE IF EXISTS fault_codes_fts")
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE fault_codes_fts USING fts5(
+            {columns},
+            content='fault_codes',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    create_fts_triggers(cursor)
+    cursor.execute("INSERT INTO fault_codes_fts (fault_codes_fts) VALUES ('rebuild')")
+    conn.commit()
+
+
+def ensure_fts_index(conn: sqlite3.Connection) -> bool:
+    """Build the full-text index if missing.
+
+    Returns True if the index is available afterwards. SQLite builds
+    without FTS5 and read-only databases are left without it.
+    """
+    cursor = conn.cursor()
+    if has_fts_index(cursor):
+        return True
+    try:
+        build_fts_index(conn)
+        return True
+    except sqlite3.OperationalError:
+        conn.rollback()
+        return False
+
+
+def ensure_indexes(conn: sqlite3.Connection):
+    """Build any lookup index missing from an existing database."""
+    ensure_page_keys(conn)
+    ensure_content_hashes(conn)
+    ensure_code_keys(conn)
+    ensure_alias_index(conn)
+    ensure_facet_index(conn)
+    ensure_ngram_index(conn)
+    ensure_fuzzy_index(conn)
+    ensure_fts_index(conn)
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query matching every word as a prefix.
+
+    Returns an empty string when the text contains no searchable words.
+    """
+    words = re.findall(r"\w+", text.lower())
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def highlight_snippet(snippet: str) -> str:
+    """Escape a raw FTS snippet and mark the matched terms."""
+    # Imported here: html loads its entity tables, which only search needs
+    from html import escape
+    escaped = escape(snippet or "")
+    return escaped.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def search_text(cursor, text: str, page: int = 1,
+                per_page: int = 20) -> Tuple[List[dict], int]:
+    """Full-text search over titles and descriptions.
+
+    Returns one page of BM25-ranked hits, each with the page and row id of
+    its record and a highlighted snippet, and the total number of matching
+    codes.
+    """
+    query = fts_query(text)
+    if not query:
+        return [], 0
+
+    with stage("query_text_count"):
+        cursor.execute(
+            "SELECT COUNT(*) FROM fault_codes_fts WHERE fault_codes_fts MATCH ?",
+            (query,)
+        )
+        total = cursor.fetchone()[0]
+    if not total:
+        return [], 0
+
+    weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+    with stage("query_text"):
+        cursor.execute(
+            f"""SELECT f.code, f.title, c.page, c.id,
+                       snippet(fault_codes_fts, -1, ?, ?, '...', 16),
+                       bm25(fault_codes_fts, {weights}) AS rank
+                FROM fault_codes_fts f
+                JOIN fault_codes c ON c.id = f.rowid
+                WHERE fault_codes_fts MATCH ?
+                ORDER BY rank
+                LIMIT ? OFFSET ?""",
+            (_MARK_START, _MARK_END, query, per_page, (page - 1) * per_page)
+        )
+        rows = cursor.fetchall()
+    hits = [
+        {
+            'code': code,
+            'title': title,
+            'page': record_page,
+            'id': record_id,
+            'snippet': highlight_snippet(snippet),
+            'score': -rank
+        }
+        for code, title, record_page, record_id, snippet, rank in rows
+    ]
+    return hits, total
+
+
+def main():
+    """Rebuild the lookup indexes of a fault codes database."""
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_page_keys(conn)
+        ensure_content_hashes(conn)
+        ensure_code_keys(conn)
+        build_alias_index(conn)
+        build_facet_index(conn)
+        count = build_ngram_index(conn)
+        build_fuzzy_index(conn)
+        build_fts_index(conn)
+    finally:
+        conn.close()
+    print(f"Indexed {count} fault codes in {db_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+Fault Code Lookup Library
+
+FaultCodeIndex is the lookup engine shared by the frontends (app_flask.py,
+the Tkinter app.py and the Kivy main.py): exact, partial, similar-code and
+batch lookups over the tiers and indexes of fault_index, with pooled
+SQLite connections and results cached per database version, so a changed
+or replaced database is picked up by the next lookup.
+
+Only the standard library and the lookup modules next to it (fault_index,
+lookup_cache, popularity, shared_index) are imported, so a frontend pays
+a few milliseconds for it and never loads Flask, Kivy or Tk through it:
+
+    from fault_lookup import FaultCodeIndex
+
+    index = FaultCodeIndex("fault_codes.db")
+    match_type, result = index.lookup("00532")
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fault_index import (
+    FACETS, MATCH_MISS, RECORD_COLUMNS, SUMMARY_COLUMNS, browse_codes, build_code_filter, count_codes,
+    count_partial_matches, ensure_indexes, facet_counts, lookup_code, lookup_codes, lookup_exact, parse_code,
+    page_cursor, partial_matches, partial_page, record_aliases, similar_codes,
+)
+from lookup_cache import MISSING, LRUCache, SingleFlight, database_version
+from metrics import stage
+from popularity import top_codes
+from shared_index import SharedIndex, build_shared_index
+
+DB_PATH = "fault_codes.db"
+
+# Lookup results, keyed by code and database version
+LOOKUP_CACHE_SIZE = 2048
+CACHE_TTL = 600
+
+# Codes found nowhere (garbage, codes not crawled yet) are remembered in a
+# cache of their own, so a flood of them cannot evict useful lookups.
+# Entries are keyed by database version, so they can live longer.
+MISS_CACHE_SIZE = 8192
+MISS_CACHE_TTL = 3600
+
+# Idle connections kept open for reuse; more are opened when needed
+POOL_SIZE = 8
+
+VALID_CODE = re.compile(r"^[A-Za-z0-9]{1,8}$")
+MAX_INPUT_CHARS = 100
+
+# Autocomplete: suggestions per prefix, with titles cut short so a
+# response stays well under 1 KB
+COMPLETE_LIMIT = 8
+COMPLETE_TITLE_CHARS = 60
+
+# Prefixes matching up to this many keys are ranked in full; wider ones
+# list the most looked-up matches first, then the rest in code order
+COMPLETE_SCAN = 256
+
+# Most looked-up codes ranked ahead of the rest, and how often (seconds)
+# their order is re-read from the popularity table
+COMPLETE_POPULAR = 1000
+RANK_INTERVAL = 60.0
+
+
+def normalize_fault_code(search_text: str) -> Tuple[Optional[str], Optional[str]]:
+    """Validate a code from user input and normalize it for lookup.
+
+    A plain code is upper-cased. Pasted forms ("P1757 00 [237]",
+    "P2BA6/01174") become their canonical VAG and OBD codes joined by a
+    slash ("P1757", "01174/P2BA6"), so every spelling shares one cache
+    entry. Returns (code, None), or (None, error message) for invalid input.
+    """
+    if search_text and VALID_CODE.match(search_text):
+        return search_text.upper(), None
+    if search_text and len(search_text) <= MAX_INPUT_CHARS:
+        parts = parse_code(search_text)
+        keys = [key for key in (parts.vag, parts.obd) if key]
+        if keys:
+            return "/".join(keys), None
+    return None, "Please enter a valid fault code (1-8 alphanumeric characters)"
+
+
+def code_aliases(code: str, title: Optional[str]) -> List[str]:
+    """Return the other codes (P0431, 001073, ...) a record is found by (see record_aliases)."""
+    return [alias for alias in record_aliases(code, title) if alias != code]
+
+
+class CodeCompleter:
+    """Sorted prefix index over codes and their aliases, for typeahead."""
+
+    def __init__(self, records: Iterable[Tuple[str, str]], popular: Sequence[str] = (), version=None):
+        entries = []
+        for code, title in records:
+            aliases = code_aliases(code.upper(), title)
+            title = (title or "")[:COMPLETE_TITLE_CHARS]
+            entries.append((code.upper(), code, title))
+            for alias in aliases:
+                entries.append((alias, code, title))
+        entries.sort()
+        self.version = version
+        self.entries = entries
+        self.keys = [key for key, _, _ in entries]
+        self.rank(popular)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def rank(self, popular: Sequence[str]):
+        """Rank suggestions by these codes, most looked-up first."""
+        ranks = {code: rank for rank, code in enumerate(popular)}
+        ranked = sorted((entry for entry in self.entries if entry[1] in ranks),
+                        key=lambda entry: ranks[entry[1]])
+        # Swapped in one assignment, so lookups never see half of a ranking
+        self.ranking = (ranks, ranked)
+        self.ranked_at = time.monotonic()
+
+    def complete(self, prefix: str, limit: int = COMPLETE_LIMIT) -> Tuple[List[Tuple[str, str, str]], bool]:
+        """Return up to limit (key, code, title) entries whose key starts with prefix.
+
+        The most looked-up codes come first, then the others in code order;
+        each code is listed once. The flag says whether there are more
+        matches than returned.
+        """
+        prefix = prefix.upper()
+        ranks, ranked = self.ranking
+        start = bisect_left(self.keys, prefix)
+        window = self.entries[start:start + COMPLETE_SCAN + 1]
+        matches = [entry for entry in window if entry[0].startswith(prefix)]
+        if len(matches) <= COMPLETE_SCAN:
+            unranked = len(ranks)
+            matches.sort(key=lambda entry: (ranks.get(entry[1], unranked), entry[0]))
+        else:
+            matches = [entry for entry in ranked if entry[0].startswith(prefix)] + matches
+
+        suggestions = []
+        seen = set()
+        for entry in matches:
+            if entry[1] not in seen:
+                if len(suggestions) == limit:
+                    return suggestions, True
+                seen.add(entry[1])
+                suggestions.append(entry)
+        return suggestions, False
+
+
+class FaultCodeIndex:
+    """Cached lookups in one fault codes database, safe to share between threads."""
+
+    def __init__(self, db_path: str = DB_PATH, cache_size: int = LOOKUP_CACHE_SIZE,
+                 cache_ttl: float = CACHE_TTL, miss_cache_size: int = MISS_CACHE_SIZE,
+                 miss_cache_ttl: float = MISS_CACHE_TTL):
+        self.db_path = db_path
+        self.cache = LRUCache(cache_size, cache_ttl)
+        self.miss_cache = LRUCache(miss_cache_size, miss_cache_ttl)
+        # Identical lookups arriving together wait for the first one's query
+        self.flight = SingleFlight()
+        # Memory-mapped code index shared by prefork workers (see serve_prefork.py)
+        self.shared_index = None
+        self.shared_index_path = None
+        self._shared_index_lock = threading.Lock()
+        # Bloom filter of every code, as (database version, filter)
+        self._code_filter = None
+        self._code_filter_lock = threading.Lock()
+        self._completer = None
+        self._completer_lock = threading.Lock()
+        # Records per facet, as (database version, counts)
+        self._facet_counts = None
+        self._pool = []
+        self._pool_lock = threading.Lock()
+        self._pool_pid = os.getpid()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.db_path)
+
+    def version(self):
+        """Return the database version token (one stat of the db and its WAL)."""
+        with stage("db_check"):
+            return database_version(self.db_path)
+
+    def _inode(self) -> Optional[int]:
+        try:
+            return os.stat(self.db_path).st_ino
+        except OSError:
+            return None
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection from the pool for the duration of a with block.
+
+        Pooled connections are dropped when the database file has been
+        replaced, and in a forked child. Raises sqlite3.Error.
+        """
+        inode = self._inode()
+        with stage("connect"):
+            with self._pool_lock:
+                if self._pool_pid != os.getpid():
+                    # Inherited from the parent process; never use them here
+                    self._pool, self._pool_pid = [], os.getpid()
+                pooled = self._pool.pop() if self._pool else None
+            if pooled is not None and pooled[1] != inode:
+                pooled[0].close()
+                pooled = None
+            if pooled is None:
+                pooled = (sqlite3.connect(self.db_path, check_same_thread=False), inode)
+
+        conn = pooled[0]
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        if conn.in_transaction:
+            conn.rollback()
+        with self._pool_lock:
+            if len(self._pool) < POOL_SIZE and self._pool_pid == os.getpid():
+                self._pool.append(pooled)
+                return
+        conn.close()
+
+    def close(self):
+        """Close the pooled connections."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, []
+        for conn, _ in pool:
+            conn.close()
+
+    def count(self) -> int:
+        """Return the number of codes in the database. Raises sqlite3.Error."""
+        with self.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM fault_codes").fetchone()[0]
+
+    def ensure_indexes(self):
+        """Build any lookup index missing from the database (see fault_index)."""
+        with self.connection() as conn:
+            ensure_indexes(conn)
+
+    def load_shared_index(self, index_path: str) -> SharedIndex:
+        """Map a prebuilt shared index and keep it in step with the database."""
+        self.shared_index = SharedIndex(index_path)
+        self.shared_index_path = index_path
+        return self.shared_index
+
+    def _refresh_shared_index(self, version):
+        path = self.shared_index_path
+        try:
+            # Another worker may have rebuilt the file already
+            mapped = SharedIndex(path)
+        except (OSError, ValueError):
+            mapped = None
+        if mapped is None or not mapped.matches(version):
+            if mapped is not None:
+                mapped.close()
+            build_shared_index(self.db_path, path)
+            mapped = SharedIndex(path)
+        # The stale map is closed once the last lookup using it lets go
+        self.shared_index = mapped
+
+    def code_index(self, version):
+        """Return the shared index if it was built from this database version.
+
+        After a database change, such as records saved by the miss-queue
+        fetcher, the index file is rebuilt and remapped in the background;
+        lookups meanwhile go to SQLite.
+        """
+        current = self.shared_index
+        if current is not None and current.matches(version):
+            return current
+        if self.shared_index_path is not None and self._shared_index_lock.acquire(blocking=False):
+            def rebuild():
+                try:
+                    self._refresh_shared_index(version)
+                except (OSError, ValueError, sqlite3.Error):
+                    pass
+                finally:
+                    self._shared_index_lock.release()
+            threading.Thread(target=rebuild, name="shared-index", daemon=True).start()
+        return None
+
+    def load_code_filter(self, version=None):
+        """Build the Bloom filter of the database's codes and use it for version."""
+        version = version or self.version()
+        with self.connection() as conn:
+            built = build_code_filter(conn.cursor())
+        self._code_filter = (version, built)
+        return built
+
+    def code_filter(self, version):
+        """Return the Bloom filter of this database version's codes.
+
+        After a database change it is rebuilt in the background (a second or
+        so for 200k codes); lookups meanwhile go without a filter.
+        """
+        current = self._code_filter
+        if current is not None and current[0] == version:
+            return current[1]
+        if self._code_filter_lock.acquire(blocking=False):
+            def rebuild():
+                try:
+                    self.load_code_filter(version)
+                except sqlite3.Error:
+                    pass
+                finally:
+                    self._code_filter_lock.release()
+            threading.Thread(target=rebuild, name="code-filter", daemon=True).start()
+        return None
+
+    def _build_completer(self, version) -> CodeCompleter:
+        with self.connection() as conn:
+            records = conn.execute("SELECT code, title FROM fault_codes").fetchall()
+        return CodeCompleter(records, self._popular_codes(), version)
+
+    def _popular_codes(self) -> List[str]:
+        try:
+            return top_codes(self.db_path, COMPLETE_POPULAR)
+        except sqlite3.Error:
+            return []
+
+    def completer(self, version) -> CodeCompleter:
+        """Return the autocomplete index, built on first use.
+
+        After a database change the previous index keeps answering while a
+        new one is built in the background; the popularity order is
+        refreshed the same way every RANK_INTERVAL seconds. Raises
+        sqlite3.Error.
+        """
+        current = self._completer
+        if current is None:
+            with self._completer_lock:
+                if self._completer is None:
+                    self._completer = self._build_completer(version)
+                return self._completer
+
+        stale = current.version != version
+        if ((stale or time.monotonic() - current.ranked_at > RANK_INTERVAL)
+                and self._completer_lock.acquire(blocking=False)):
+            # Not retried before the next interval if this fails
+            current.ranked_at = time.monotonic()
+
+            def refresh():
+                try:
+                    if stale:
+                        self._completer = self._build_completer(version)
+                    else:
+                        current.rank(self._popular_codes())
+                except sqlite3.Error:
+                    pass
+                finally:
+                    self._completer_lock.release()
+            threading.Thread(target=refresh, name="code-completer", daemon=True).start()
+        return current
+
+    def complete(self, prefix: str, limit: int = COMPLETE_LIMIT) -> Tuple[List[Tuple[str, str, str]], bool]:
+        """Suggest codes starting with prefix (see CodeCompleter.complete). Raises sqlite3.Error."""
+        completer = self.completer(self.version())
+        with stage("complete"):
+            return completer.complete(prefix, limit)
+
+    def lookup(self, fault_code: str) -> Tuple[str, object]:
+        """Resolve one normalized code; see lookup_many."""
+        return self.lookup_many([fault_code])[fault_code]
+
+    def lookup_many(self, fault_codes: Iterable[str]) -> Dict[str, Tuple[str, object]]:
+        """Resolve normalized codes, querying SQLite only for codes not in the caches.
+
+        Each code goes through the lookup tiers (see fault_index.lookup_code);
+        the codes of a batch share one set of queries, and concurrent lookups
+        of a code share one query. Returns a dict of code -> (match_type,
+        result). Raises sqlite3.Error.
+        """
+        version = self.version()
+        resolved = {}
+        pending = []
+        for fault_code in dict.fromkeys(fault_codes):
+            cached = self.cache.get((fault_code, version))
+            if cached is MISSING and self.miss_cache.get((fault_code, version)) is not MISSING:
+                cached = (MATCH_MISS, None)
+            if cached is MISSING:
+                pending.append(fault_code)
+            else:
+                resolved[fault_code] = cached
+
+        def query(keys):
+            codes = [fault_code for fault_code, _ in keys]
+            code_index = self.code_index(version)
+            codes_filter = self.code_filter(version)
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                if len(codes) == 1:
+                    lookups = [lookup_code(cursor, codes[0], code_index=code_index, code_filter=codes_filter)]
+                else:
+                    lookups = lookup_codes(cursor, codes, code_index=code_index, code_filter=codes_filter)
+            # Cached before the flight ends, so later requests find them
+            for key, lookup in zip(keys, lookups):
+                if lookup[0] == MATCH_MISS:
+                    self.miss_cache.set(key, True)
+                else:
+                    self.cache.set(key, lookup)
+            return dict(zip(keys, lookups))
+
+        if pending:
+            lookups = self.flight.run([(fault_code, version) for fault_code in pending], query)
+            for (fault_code, _), lookup in lookups.items():
+                resolved[fault_code] = lookup
+        return resolved
+
+    def exact(self, fault_code: str) -> Optional[Tuple[str, object]]:
+        """Resolve a normalized code through the exact, cleaned and multiple tiers only.
+
+        Uses the same alias lookup as lookup, so a code several pages share
+        is a multiple match. Returns (match_type, result) as lookup does, or
+        None. Raises sqlite3.Error.
+        """
+        codes_filter = self.code_filter(self.version())
+        with self.connection() as conn:
+            return lookup_exact(conn.cursor(), fault_code, code_filter=codes_filter)
+
+    def record(self, page: str = None, record_id: int = None, columns: str = RECORD_COLUMNS):
+        """Return (id, record) of the record of a wiki page, or of a row id, or None.
+
+        Raises sqlite3.Error.
+        """
+        where, key = ("page = ?", page) if page is not None else ("id = ?", record_id)
+        with self.connection() as conn:
+            row = conn.execute(f"SELECT id, {columns} FROM fault_codes WHERE {where}", (key,)).fetchone()
+        return (row[0], row[1:]) if row else None
+
+    def partial(self, fragment: str, columns: str = SUMMARY_COLUMNS, limit: int = None) -> list:
+        """Return the codes containing fragment, in code order. Raises sqlite3.Error."""
+        with self.connection() as conn:
+            return partial_matches(conn.cursor(), fragment, columns=columns, limit=limit)
+
+    def similar(self, fault_code: str, columns: str = SUMMARY_COLUMNS) -> list:
+        """Return the codes within two typos of a code, nearest first. Raises sqlite3.Error."""
+        with self.connection() as conn:
+            return similar_codes(conn.cursor(), fault_code, columns=columns)
+
+    def partial_page(self, fragment: str, after: str = None, rows: list = None) -> Tuple[list, dict]:
+        """Fetch one page of the codes containing fragment.
+
+        rows is the first page as returned by the lookup tiers; it is reused
+        when no cursor is given. Returns (rows, paging), where paging has the
+        match count (capped, see count_partial_matches), the cursor of this
+        page and that of the next. Raises sqlite3.Error.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            with stage("query_partial"):
+                if after is None and rows is not None:
+                    next_after = page_cursor(rows[-1][0], rows[-1][-1]) if rows else None
+                else:
+                    rows, next_after = partial_page(cursor, fragment, after)
+            with stage("query_count"):
+                total, total_exact = count_partial_matches(cursor, fragment)
+
+        # The lookup tiers keep one page, so the count says whether there are more
+        if after is None and total_exact and total <= len(rows):
+            next_after = None
+        return rows, {'total': total, 'total_exact': total_exact, 'after': after, 'next': next_after}
+
+    def facet_counts(self, version=None) -> Dict[str, int]:
+        """Return the number of records under each facet, read once per database version.
+
+        Empty if the database has no facet table. Raises sqlite3.Error.
+        """
+        version = version or self.version()
+        current = self._facet_counts
+        if current is not None and current[0] == version:
+            return current[1]
+        with self.connection() as conn:
+            try:
+                counts = facet_counts(conn.cursor())
+            except sqlite3.OperationalError as e:
+                if "no such table" not in str(e):
+                    raise
+                counts = {}
+        self._facet_counts = (version, counts)
+        return counts
+
+    def facets(self) -> List[dict]:
+        """List every facet (key, kind, label) with its number of records. Raises sqlite3.Error."""
+        counts = self.facet_counts()
+        return [{'key': key, 'kind': kind, 'label': label, 'count': counts.get(key, 0)}
+                for key, kind, label, _ in FACETS]
+
+    def browse(self, start: str = "", end: str = None, after: str = None,
+               facets: Sequence[str] = ()) -> Tuple[list, dict]:
+        """List the codes from start to end (filed under all of facets) one page at a time.
+
+        Returns (rows, paging) like partial_page. Raises sqlite3.Error.
+        """
+        counts = self.facet_counts() if facets else None
+        if facets and not counts:
+            # No facet table, so nothing is filed under any facet
+            return [], {'total': 0, 'total_exact': True, 'after': after, 'next': None}
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            with stage("query_browse"):
+                rows, next_after = browse_codes(cursor, start, end, after, facets=facets, counts=counts)
+            with stage("query_count"):
+                total, total_exact = count_codes(cursor, start, end, facets=facets, counts=counts)
+        return rows, {'total': total, 'total_exact': total_exact, 'after': after, 'next': next_after}
+
+    def clear(self):
+        """Empty the lookup and miss caches."""
+        self.cache.clear()
+        self.miss_cache.clear()
+
+    def stats(self) -> dict:
+        """Counters of the caches, the code filter and coalesced lookups."""
+        code_filter = self._code_filter
+        return {
+            'lookups': self.cache.stats(),
+            'misses': self.miss_cache.stats(),
+            'code_filter': code_filter[1].stats() if code_filter else None,
+            'coalesced': self.flight.stats(),
+            'pooled_connections': len(self._pool),
+        }
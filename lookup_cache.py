@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Lookup and Page Caches
+
+A small thread-safe LRU cache with a TTL, a database version token used
+in cache keys so that entries go stale as soon as fault_codes.db is
+replaced or written to, a single-flight helper so that concurrent
+misses for the same key are computed only once, and a Bloom filter
+for answering "is this code in the database?" without a query.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+# Returned by LRUCache.get when a key is not cached (None is a valid value)
+MISSING = object()
+
+
+class LRUCache:
+    """Bounded least-recently-used cache whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value for key, or MISSING."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry; the hit and miss counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent computations of the same keys.
+
+    While one thread computes a key, other threads asking for it wait and
+    share its result (or exception) instead of computing it again. A
+    caller computes the keys nobody else is working on before waiting for
+    the rest, so callers with overlapping key sets cannot deadlock.
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def run(self, keys: Iterable[Hashable],
+            compute: Callable[[List[Hashable]], Dict[Hashable, Any]]) -> Dict[Hashable, Any]:
+        """Return {key: value} for keys.
+
+        compute is called at most once, with the keys not already in
+        flight, and must return a value for each of them.
+        """
+        owned = {}
+        joined = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                flight = self._flights.get(key)
+                if flight is None:
+                    owned[key] = self._flights[key] = _Flight()
+                else:
+                    joined[key] = flight
+            self.shared += len(joined)
+
+        results = {}
+        if owned:
+            try:
+                results = compute(list(owned))
+                for key, flight in owned.items():
+                    flight.value = results[key]
+            except BaseException as e:
+                for flight in owned.values():
+                    flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    for key in owned:
+                        del self._flights[key]
+                for flight in owned.values():
+                    flight.done.set()
+
+        for key, flight in joined.items():
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            results[key] = flight.value
+        return results
+
+    def do(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return compute() for key, sharing a computation already in flight."""
+        return self.run((key,), lambda keys: {key: compute()})[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of keys in flight and of callers that shared one."""
+        with self._lock:
+            return {'in_flight': len(self._flights), 'shared': self.shared}
+
+
+class BloomFilter:
+    """Set membership with no false negatives and a small false-positive rate.
+
+    Sized for capacity items at error_rate; about 1.2 bytes per item at 1%.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def from_items(cls, items: Iterable[str], capacity: int, error_rate: float = 0.01) -> "BloomFilter":
+        bloom = cls(capacity, error_rate)
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the item count and the memory used by the bit array."""
+        return {'items': self.count, 'bytes': len(self._bits), 'hashes': self.hash_count}
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def database_version(db_path: str) -> Optional[Tuple]:
+    """Return a token that changes whenever the database file changes.
+
+    Covers the file being replaced (new inode) and being written to, either
+    directly or through its write-ahead log. Returns None if the database
+    does not exist.
+    """
+    signature = _file_signature(db_path)
+    if signature is None:
+        return None
+    return signature + (_file_signature(db_path + "-wal"),)
@@ -7,7 +7,6 @@ A Kivy-based mobile application for searching fault codes offline.
 
 import os
 import sqlite3
-import re
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
@@ -17,12 +16,16 @@ from kivy.uix.scrollview import ScrollView
 from kivy.uix.popup import Popup
 from kivy.core.window import Window
 from kivy.metrics import dp
-from kivy.utils import platform
+from kivy.utils import escape_markup, platform
+
+from fault_index import MATCH_CLEANED, MATCH_EXACT, MATCH_MULTIPLE, MATCH_PARTIAL, MATCH_SIMILAR
+from fault_lookup import FaultCodeIndex, normalize_fault_code
 
 class FaultCodeApp(App):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.db_path = self.get_database_path()
+        self.index = FaultCodeIndex(self.db_path)
         self.check_database()
     
     def get_database_path(self):
@@ -46,11 +49,8 @@ class FaultCodeApp(App):
             return False
         
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM fault_codes")
-            count = cursor.fetchone()[0]
-            conn.close()
+            count = self.index.count()
+            self.index.ensure_indexes()
             
             if count == 0:
                 self.show_popup("Empty Database", 
@@ -102,6 +102,7 @@ class FaultCodeApp(App):
                                  halign='left',
                                  valign='top',
                                  markup=True)
+        self.results_label.bind(on_ref_press=self.open_record)
         self.results_scroll.add_widget(self.results_label)
         main_layout.add_widget(self.results_scroll)
         
@@ -121,41 +122,24 @@ class FaultCodeApp(App):
             self.status_label.text = "Please enter a fault code"
             return
         
-        # Validate input (should be 1-5 digits)
-        if not re.match(r'^\d{1,5}$', search_text):
-            self.status_label.text = "Please enter a valid fault code (1-5 digits)"
+        # Same validation and lookup tiers as the web app: VAG codes with
+        # or without leading zeros, P-codes and pasted VCDS lines
+        fault_code, error = normalize_fault_code(search_text)
+        if error:
+            self.status_label.text = error
             return
         
-        # Pad with zeros to 5 digits if needed
-        fault_code = search_text.zfill(5)
-        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            match_type, result = self.index.lookup(fault_code)
             
-            # Search for exact match first
-            cursor.execute('''
-                SELECT code, title, full_content, symptoms, causes, solutions, special_notes, technical_info 
-                FROM fault_codes WHERE code = ?
-            ''', (fault_code,))
-            result = cursor.fetchone()
-            
-            # If no exact match, search for partial matches
-            if not result:
-                cursor.execute('''
-                    SELECT code, title, full_content, symptoms, causes, solutions, special_notes, technical_info 
-                    FROM fault_codes WHERE code LIKE ?
-                ''', (f"%{fault_code}%",))
-                results = cursor.fetchall()
-                
-                if results:
-                    self.display_multiple_results(results, search_text)
-                else:
-                    self.display_no_results(search_text)
-            else:
+            if match_type in (MATCH_EXACT, MATCH_CLEANED):
                 self.display_single_result(result)
-            
-            conn.close()
+                if match_type == MATCH_CLEANED:
+                    self.status_label.text = f"Showing fault code {result[0]} for '{search_text}'"
+            elif match_type in (MATCH_MULTIPLE, MATCH_PARTIAL, MATCH_SIMILAR):
+                self.display_multiple_results(result, search_text, match_type)
+            else:
+                self.display_no_results(search_text)
             
         except sqlite3.Error as e:
             self.status_label.text = "Database error occurred"
@@ -163,7 +147,7 @@ class FaultCodeApp(App):
     
     def display_single_result(self, result):
         """Display a single fault code result."""
-        code, title, full_content, symptoms, causes, solutions, special_notes, technical_info = result
+        code, title, full_content, symptoms, causes, solutions, special_notes, technical_info = result[:8]
         
         text = f"[color=2E86AB][b]Fault Code: {code}[/b][/color]\n"
         
@@ -207,43 +191,41 @@ class FaultCodeApp(App):
         self.results_label.text = text
         self.status_label.text = f"Found fault code: {code}"
     
-    def display_multiple_results(self, results, search_text):
-        """Display multiple fault code results."""
-        text = f"[color=A23B72][b]Multiple results found for '{search_text}':[/b][/color]\n\n"
+    def display_multiple_results(self, results, search_text, match_type=MATCH_PARTIAL):
+        """Display a list of fault codes; tapping one opens its record."""
+        if match_type == MATCH_MULTIPLE:
+            heading = f"Several pages list fault code '{search_text}':"
+        elif match_type == MATCH_SIMILAR:
+            heading = f"No exact match for '{search_text}'. Did you mean one of these similar codes?"
+        else:
+            heading = f"Fault codes containing '{search_text}':"
+        text = f"[color=A23B72][b]{heading}[/b][/color]\n\n"
         
-        for i, (code, title, full_content, symptoms, causes, solutions, special_notes, technical_info) in enumerate(results, 1):
-            text += f"[color=2E86AB][b]{i}. Fault Code: {code}[/b][/color]\n"
+        for i, (code, title, page, record_id) in enumerate(results, 1):
+            text += f"[ref={record_id}][color=2E86AB][b]{i}. Fault Code: {code}[/b][/color][/ref]\n"
             if title:
-                text += f"   [color=2E86AB][b]{title}[/b][/color]\n"
-            
-            # Show a preview of available information
-            info_preview = []
-            if symptoms:
-                info_preview.append("Symptoms")
-            if causes:
-                info_preview.append("Causes")
-            if solutions:
-                info_preview.append("Solutions")
-            if special_notes:
-                info_preview.append("Special Notes")
-            if technical_info:
-                info_preview.append("Technical Info")
-            if full_content:
-                info_preview.append("Full Content")
-            
-            if info_preview:
-                text += f"   Available: {', '.join(info_preview)}\n"
-            
+                text += f"   {escape_markup(title)}\n"
             text += "\n"
         
         self.results_label.text = text
         self.status_label.text = f"Found {len(results)} results for '{search_text}'"
     
+    def open_record(self, instance, ref):
+        """Display the record of a row id tapped in a list of results."""
+        try:
+            found = self.index.record(record_id=int(ref))
+        except sqlite3.Error as e:
+            self.status_label.text = "Database error occurred"
+            self.show_popup("Database Error", f"Error searching database: {e}")
+            return
+        if found:
+            self.display_single_result(found[1])
+    
     def display_no_results(self, search_text):
         """Display no results message."""
         text = f"[color=E17055][b]No results found for fault code '{search_text}'[/b][/color]\n\n"
         text += "Please check the fault code and try again.\n"
-        text += "Fault codes are typically 5-digit numbers (e.g., 00532).\n"
+        text += "Try the other form of the code: the 5-digit VAG code (e.g., 00532) instead of the P-code, or the other way round.\n"
         
         self.results_label.text = text
         self.status_label.text = f"No results found for '{search_text}'"
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Request Timing Metrics
+
+Per-stage timers for lookups, aggregated into Prometheus histograms and
+reported per request as a Server-Timing header.
+
+A request is timed by calling start_request() when it arrives and
+finish_request() when the response is ready. In between, any code on the
+same thread can wrap work in `with stage("name"):`; outside a timed
+request stage() returns a shared no-op, so library code (fault_index)
+can be instrumented without caring who calls it.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+# Set FAULT_METRICS=0 to turn timing off entirely
+ENABLED = os.environ.get("FAULT_METRICS", "1") != "0"
+
+METRIC_PREFIX = "fault_lookup"
+
+# Upper bounds in seconds; stages are sub-millisecond, whole requests a
+# few milliseconds, scan reports and cold pages up to about a second
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# One lock for every metric, so finishing a request takes it only once
+_lock = threading.Lock()
+
+
+class Histogram:
+    """Cumulative latency histogram with one label."""
+
+    def __init__(self, name: str, help_text: str, label: str,
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, label_value: str, seconds: float):
+        with _lock:
+            self._observe(label_value, seconds)
+
+    def _observe(self, label_value: str, seconds: float):
+        series = self._series.get(label_value)
+        if series is None:
+            series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, seconds)] += 1
+        series[1] += seconds
+
+    def samples(self) -> Iterable[str]:
+        with _lock:
+            snapshot = [(value, list(counts), total) for value, (counts, total) in self._series.items()]
+
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for value, counts, total in sorted(snapshot):
+            labels = f'{self.label}="{value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+            cumulative += counts[-1]
+            yield f'{self.name}_bucket{{{labels},le="+Inf"}} {cumulative}'
+            yield f"{self.name}_sum{{{labels}}} {total:.6f}"
+            yield f"{self.name}_count{{{labels}}} {cumulative}"
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, label_values: Tuple[str, ...], amount: int = 1):
+        with _lock:
+            self._inc(label_values, amount)
+
+    def _inc(self, label_values: Tuple[str, ...], amount: int = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with _lock:
+            snapshot = sorted(self._values.items())
+
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in snapshot:
+            labels = ",".join(f'{label}="{value}"' for label, value in zip(self.labels, label_values))
+            yield f"{self.name}{{{labels}}} {value}"
+
+
+request_seconds = Histogram(f"{METRIC_PREFIX}_request_seconds",
+                            "Time spent handling a request, by endpoint.", "endpoint")
+stage_seconds = Histogram(f"{METRIC_PREFIX}_stage_seconds",
+                          "Time spent in each stage of a request.", "stage")
+requests_total = Counter(f"{METRIC_PREFIX}_requests_total",
+                         "Requests handled, by endpoint and status code.", ("endpoint", "status"))
+matches_total = Counter(f"{METRIC_PREFIX}_matches_total",
+                        "Code lookups served, by match type.", ("match",))
+
+
+class RequestTimer:
+    """Stage durations of the request running on the current thread."""
+
+    __slots__ = ("started", "stages", "matches")
+
+    def __init__(self):
+        self.started = time.perf_counter_ns()
+        self.stages: Dict[str, int] = {}
+        self.matches: Dict[str, str] = {}
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "started")
+
+    def __init__(self, timer: RequestTimer, name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter_ns() - self.started
+        stages = self.timer.stages
+        stages[self.name] = stages.get(self.name, 0) + elapsed
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_STAGE = _NoStage()
+_current = threading.local()
+
+
+def start_request() -> Optional[RequestTimer]:
+    """Start timing a request on this thread."""
+    if not ENABLED:
+        return None
+    timer = _current.timer = RequestTimer()
+    return timer
+
+
+def stage(name: str):
+    """Context manager adding the time of its block to a stage of the current request.
+
+    Time spent in the same stage more than once (e.g. one query per code
+    in a batch) adds up.
+    """
+    timer = getattr(_current, "timer", None)
+    if timer is None:
+        return _NO_STAGE
+    return _Stage(timer, name)
+
+
+def record_match(fault_code: str, match_type: str):
+    """Note the match type a code resolved to in the current request.
+
+    Each code is counted once per request when the request finishes, however
+    often it was resolved while handling it.
+    """
+    timer = getattr(_current, "timer", None)
+    if timer is not None:
+        timer.matches[fault_code] = match_type
+
+
+def finish_request(endpoint: str, status: int) -> Optional[RequestTimer]:
+    """Stop timing the request on this thread and record its metrics.
+
+    Returns the finished timer (for server_timing), or None if the request
+    was not timed.
+    """
+    timer = getattr(_current, "timer", None)
+    if timer is None:
+        return None
+    _current.timer = None
+
+    total = time.perf_counter_ns() - timer.started
+    with _lock:
+        request_seconds._observe(endpoint, total / 1e9)
+        requests_total._inc((endpoint, str(status)))
+        for name, elapsed in timer.stages.items():
+            stage_seconds._observe(name, elapsed / 1e9)
+        for match_type in timer.matches.values():
+            matches_total._inc((match_type,))
+    timer.stages["total"] = total
+    return timer
+
+
+def server_timing(timer: RequestTimer) -> str:
+    """Format a finished request's stages as a Server-Timing header value."""
+    return ", ".join(["%s;dur=%.3f" % (name, elapsed / 1e6) for name, elapsed in timer.stages.items()])
+
+
+def format_gauges(name: str, help_text: str, label: str, values: Dict[str, float]) -> Iterable[str]:
+    """Format point-in-time values (e.g. cache sizes) in the exposition format."""
+    yield f"# HELP {name} {help_text}"
+    yield f"# TYPE {name} gauge"
+    for value_label, value in sorted(values.items()):
+        yield f'{name}{{{label}="{value_label}"}} {value}'
+
+
+def render_metrics(extra: Iterable[str] = ()) -> str:
+    """Return every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in (request_seconds, stage_seconds, requests_total, matches_total):
+        lines.extend(metric.samples())
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
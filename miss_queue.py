@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Missing Code Fetcher
+
+Codes that users look up but the database does not have are recorded in
+a queue, and a background worker fetches just those wiki pages with
+FaultCodeCrawler.extract_fault_code_data and saves them. Saving changes
+the database version, so the next lookup of the code finds it instead of
+waiting for the next full crawl.
+
+The queue is kept in its own database file next to fault_codes.db
+(fault_codes_misses.db), for the same reason as popularity.py: recording
+a miss must not invalidate the caches. Several processes can share it;
+each code is claimed by one of them before it is fetched. Codes the wiki
+does not have are retried a few times, then left alone.
+
+Fetching needs the crawler's dependencies (requests, beautifulsoup4).
+Without them misses are still queued, and can be fetched later with
+
+    python miss_queue.py [fault_codes.db]
+
+Set FAULT_WIKI_URL to fetch from a local mirror of the wiki instead.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from fault_index import record_aliases
+
+DB_PATH = "fault_codes.db"
+
+# Only wiki fault codes can be fetched: the crawler identifies a page by
+# the 5-digit code in its URL or heading
+FETCHABLE_CODE = re.compile(r"^\d{5}$")
+
+MAX_ATTEMPTS = 3
+RETRY_AFTER = 3600.0
+
+# Seconds between page fetches, as in the crawler, and between queue checks
+FETCH_DELAY = 1.0
+POLL_INTERVAL = 30.0
+
+# Misses remembered between two queue writes
+MAX_RECORDED = 1000
+
+STATUS_PENDING = "pending"
+STATUS_FETCHED = "fetched"
+STATUS_NOT_FOUND = "not_found"
+
+logger = logging.getLogger(__name__)
+
+
+def queue_path(db_path: str) -> str:
+    """Return the queue database of a fault codes database (fault_codes_misses.db)."""
+    return os.path.splitext(db_path)[0] + "_misses.db"
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Open the queue database of db_path, creating its table if needed."""
+    conn = sqlite3.connect(queue_path(db_path), timeout=5.0)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS missing_codes (
+            code TEXT PRIMARY KEY,
+            misses INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_seen REAL,
+            last_attempt REAL
+        )
+    """)
+    return conn
+
+
+def is_fetchable(fault_code: str) -> bool:
+    return bool(FETCHABLE_CODE.match(fault_code))
+
+
+def enqueue(db_path: str, misses: Dict[str, int]) -> int:
+    """Add missed codes (code -> times missed) to the queue. Returns the number added."""
+    misses = {code: count for code, count in misses.items() if is_fetchable(code)}
+    if not misses:
+        return 0
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.executemany("""
+                INSERT INTO missing_codes (code, misses, last_seen) VALUES (?, ?, ?)
+                ON CONFLICT(code) DO UPDATE SET misses = misses + excluded.misses, last_seen = excluded.last_seen
+            """, [(code, count, now) for code, count in misses.items()])
+    finally:
+        conn.close()
+    return len(misses)
+
+
+def claim_due(db_path: str, limit: int = 10) -> List[str]:
+    """Claim up to limit pending codes that are due for a fetch, most missed first.
+
+    A claimed code counts as attempted, so another process (or a retry
+    within RETRY_AFTER seconds) skips it.
+    """
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        due = "status = ? AND attempts < ? AND (last_attempt IS NULL OR last_attempt < ?)"
+        due_params = (STATUS_PENDING, MAX_ATTEMPTS, now - RETRY_AFTER)
+        cursor = conn.execute(f"SELECT code FROM missing_codes WHERE {due} ORDER BY misses DESC LIMIT ?",
+                              due_params + (limit,))
+        claimed = []
+        for code, in cursor.fetchall():
+            with conn:
+                updated = conn.execute(f"""
+                    UPDATE missing_codes SET attempts = attempts + 1, last_attempt = ?
+                    WHERE code = ? AND {due}
+                """, (now, code) + due_params)
+            if updated.rowcount:
+                claimed.append(code)
+        return claimed
+    finally:
+        conn.close()
+
+
+def finish(db_path: str, fault_code: str, found: bool):
+    """Record the outcome of a fetch.
+
+    A code that was not found stays pending until it has used up its
+    attempts (the page may be missing or the wiki unreachable).
+    """
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute("""
+                UPDATE missing_codes
+                SET status = CASE WHEN ? THEN ? WHEN attempts >= ? THEN ? ELSE status END
+                WHERE code = ?
+            """, (found, STATUS_FETCHED, MAX_ATTEMPTS, STATUS_NOT_FOUND, fault_code))
+    finally:
+        conn.close()
+
+
+def queue_counts(db_path: str) -> Dict[str, int]:
+    """Return the number of queued codes by status."""
+    if not os.path.exists(queue_path(db_path)):
+        return {}
+    conn = connect(db_path)
+    try:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM missing_codes GROUP BY status").fetchall())
+    finally:
+        conn.close()
+
+
+def make_crawler(db_path: str):
+    """Return a FaultCodeCrawler saving into db_path, or None without its dependencies."""
+    try:
+        from crawler import FaultCodeCrawler
+    except ImportError as e:
+        logger.warning(f"Cannot fetch missing codes ({e}); install requirements.txt")
+        return None
+    crawler = FaultCodeCrawler(db_path)
+    base_url = os.environ.get("FAULT_WIKI_URL")
+    if base_url:
+        crawler.base_url = base_url.rstrip("/")
+    return crawler
+
+
+def code_url(base_url: str, fault_code: str) -> str:
+    """URL of the wiki page of a code (MediaWiki resolves it by title)."""
+    return f"{base_url}/wiki/index.php?title={quote(fault_code)}"
+
+
+def fetch_code(crawler, fault_code: str) -> bool:
+    """Fetch and save one code. Returns True if the wiki had a page for it."""
+    data = crawler.extract_fault_code_data(code_url(crawler.base_url, fault_code))
+    # A page that does not list this code (a search result) is a miss
+    if not data or fault_code not in record_aliases(data['code'], data['page']):
+        return False
+    crawler.save_fault_code(data)
+    return True
+
+
+def fetch_pending(db_path: str, crawler, limit: int = 10, delay: float = FETCH_DELAY,
+                  stop: Optional[threading.Event] = None) -> Tuple[int, int]:
+    """Fetch up to limit due codes from the queue. Returns (fetched, not found)."""
+    fetched = missed = 0
+    for i, fault_code in enumerate(claim_due(db_path, limit)):
+        if stop is not None and stop.is_set():
+            # Claimed but not attempted; it is retried after RETRY_AFTER
+            break
+        if i:
+            time.sleep(delay)
+        found = fetch_code(crawler, fault_code)
+        finish(db_path, fault_code, found)
+        if found:
+            fetched += 1
+            logger.info(f"Fetched missing code {fault_code}")
+        else:
+            missed += 1
+    return fetched, missed
+
+
+class MissFetcher:
+    """Collects missed codes in memory and fetches them from a background thread."""
+
+    def __init__(self, interval: float = POLL_INTERVAL):
+        self.interval = interval
+        self.fetch = True
+        self._recorded: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._crawlers = {}
+
+    def record(self, fault_code: str):
+        """Note a lookup that found nothing (cheap; the queue is written later)."""
+        if not is_fetchable(fault_code):
+            return
+        with self._lock:
+            if fault_code not in self._recorded and len(self._recorded) >= MAX_RECORDED:
+                return
+            self._recorded[fault_code] = self._recorded.get(fault_code, 0) + 1
+        self._wake.set()
+
+    def write_queue(self, db_path: str) -> int:
+        """Move the recorded misses into the queue table."""
+        with self._lock:
+            recorded, self._recorded = self._recorded, {}
+        try:
+            return enqueue(db_path, recorded)
+        except sqlite3.Error as e:
+            logger.error(f"Could not queue missing codes: {e}")
+            return 0
+
+    def crawler(self, db_path: str):
+        if db_path not in self._crawlers:
+            self._crawlers[db_path] = make_crawler(db_path)
+        return self._crawlers[db_path]
+
+    def process(self, db_path: str) -> Tuple[int, int]:
+        """Queue the recorded misses and fetch the codes that are due."""
+        self.write_queue(db_path)
+        crawler = self.crawler(db_path) if self.fetch else None
+        if crawler is None:
+            return 0, 0
+        try:
+            return fetch_pending(db_path, crawler, stop=self._stop)
+        except sqlite3.Error as e:
+            logger.error(f"Could not fetch missing codes: {e}")
+            return 0, 0
+
+    def start(self, db_path: Callable[[], str], fetch: bool = True):
+        """Process the queue from a daemon thread after each miss, and every interval seconds.
+
+        With fetch False misses are only queued, for a later
+        `python miss_queue.py`.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.fetch = fetch
+
+        def run():
+            while not self._stop.is_set():
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                if not self._stop.is_set():
+                    self.process(db_path())
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="miss-fetcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, db_path: str):
+        """Stop the worker; misses not yet queued are written to the queue."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write_queue(db_path)
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    if not os.path.exists(db_path):
+        print("Database not found. Please run crawler.py first.")
+        return 1
+
+    crawler = make_crawler(db_path)
+    if crawler is None:
+        print("Fetching needs the crawler's dependencies: pip install -r requirements.txt")
+        return 1
+
+    fetched = missed = 0
+    while True:
+        done = fetch_pending(db_path, crawler)
+        if done == (0, 0):
+            break
+        fetched += done[0]
+        missed += done[1]
+    print(f"Missing codes: {fetched} fetched, {missed} not found")
+    print("Queue: " + ", ".join(f"{count} {status}" for status, count in sorted(queue_counts(db_path).items())))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
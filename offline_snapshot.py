@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Offline Database Snapshots
+
+Exports the fault codes database for the offline web app (static/offline):
+a small snapshot.json manifest plus gzip-compressed JSON shards, one per
+code prefix. Each shard carries a hash of its records' content hashes,
+so a phone that already has a copy downloads only the shards that
+changed after a recrawl.
+
+The Flask app serves the snapshot under /offline/. To host the offline
+app on any static web server instead, export it with
+
+    python offline_snapshot.py [fault_codes.db] [output_dir]
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from fault_index import FULL_COLUMNS, FULL_FIELDS, ensure_indexes, record_hash
+
+DB_PATH = "fault_codes.db"
+INFO_FILE = "database_info.json"
+OUTPUT_DIR = "offline_app"
+
+# App shell files, served from here by app_flask.py and copied by the export
+SHELL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "offline")
+
+# Records are exported with their page and row id, as pages can share a code
+SNAPSHOT_COLUMNS = FULL_COLUMNS + ", page, id"
+SNAPSHOT_FIELDS = FULL_FIELDS + ("page", "id")
+
+# Codes sharing their first SHARD_PREFIX_LENGTH characters go in one shard
+SHARD_PREFIX_LENGTH = 2
+SHARD_DIR = "shards"
+GZIP_LEVEL = 9
+
+
+def shard_prefix(code: str) -> str:
+    """Return the shard a code belongs to (URL-safe)."""
+    return re.sub(r"[^A-Z0-9]", "_", code[:SHARD_PREFIX_LENGTH].upper()) or "_"
+
+
+def shard_url(prefix: str, shard_hash: str) -> str:
+    """Path of a shard relative to snapshot.json; it changes with the content."""
+    return f"{SHARD_DIR}/{prefix}-{shard_hash}.json.gz"
+
+
+def database_info_version(db_path: str) -> str:
+    """Return the version from the database_info.json next to the database."""
+    info_path = os.path.join(os.path.dirname(os.path.abspath(db_path)), INFO_FILE)
+    try:
+        with open(info_path, "r", encoding="utf-8") as f:
+            return str(json.load(f).get("version", ""))
+    except (OSError, ValueError):
+        return ""
+
+
+def shard_hashes(cursor) -> Dict[str, Tuple[str, int]]:
+    """Hash every shard from the stored content hashes.
+
+    Returns {prefix: (hash, record count)}. Records without a content hash
+    (a database that was never migrated) are hashed on the fly.
+    """
+    cursor.execute("SELECT id, code, page, content_hash FROM fault_codes ORDER BY code, id")
+    rows = cursor.fetchall()
+    digests = {}
+    counts = {}
+    for record_id, code, page, content_hash in rows:
+        if not content_hash:
+            cursor.execute(f"SELECT {FULL_COLUMNS} FROM fault_codes WHERE id = ?", (record_id,))
+            content_hash = record_hash(cursor.fetchone())
+        prefix = shard_prefix(code)
+        if prefix not in digests:
+            digests[prefix] = hashlib.sha1()
+            counts[prefix] = 0
+        digests[prefix].update(f"{record_id}:{code}:{page or ''}:{content_hash}\n".encode("utf-8"))
+        counts[prefix] += 1
+    return {prefix: (digest.hexdigest()[:16], counts[prefix]) for prefix, digest in digests.items()}
+
+
+def build_manifest(cursor, version: str = "") -> dict:
+    """Build snapshot.json: the database version and every shard with its hash."""
+    shards = shard_hashes(cursor)
+    revision = hashlib.sha1(
+        "".join(f"{prefix}:{shard_hash}\n" for prefix, (shard_hash, _) in sorted(shards.items())).encode("utf-8")
+    ).hexdigest()[:16]
+    return {
+        'version': version,
+        'revision': revision,
+        'total_codes': sum(count for _, count in shards.values()),
+        'fields': list(SNAPSHOT_FIELDS),
+        'shards': [
+            {'prefix': prefix, 'hash': shard_hash, 'codes': count, 'url': shard_url(prefix, shard_hash)}
+            for prefix, (shard_hash, count) in sorted(shards.items())
+        ]
+    }
+
+
+def shard_records(cursor, prefix: str) -> List[tuple]:
+    """Return the records of one shard (SNAPSHOT_COLUMNS), in code order."""
+    # LIKE folds case like shard_prefix does, and its '_' wildcard covers
+    # the characters shard_prefix replaces with '_'
+    cursor.execute(
+        f"SELECT {SNAPSHOT_COLUMNS} FROM fault_codes WHERE code LIKE ? ORDER BY code, id",
+        (prefix + "%",)
+    )
+    return [row for row in cursor.fetchall() if shard_prefix(row[0]) == prefix]
+
+
+def shard_body(records: Sequence[tuple], prefix: str, shard_hash: str) -> bytes:
+    """Serialize a shard as gzip-compressed JSON (records as arrays of SNAPSHOT_FIELDS)."""
+    data = json.dumps({'prefix': prefix, 'hash': shard_hash, 'records': [list(row) for row in records]},
+                      ensure_ascii=False, separators=(",", ":"))
+    return gzip.compress(data.encode("utf-8"), compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def shell_files() -> Iterable[str]:
+    """Names of the app shell files in SHELL_DIR."""
+    return sorted(name for name in os.listdir(SHELL_DIR) if not name.startswith("."))
+
+
+def export_snapshot(db_path: str, output_dir: str) -> Tuple[int, int]:
+    """Write the offline app, snapshot.json and every shard to output_dir.
+
+    Shards already present (same prefix and hash) are kept and shards no
+    longer listed are removed. Returns (shards written, shards kept).
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_indexes(conn)
+        cursor = conn.cursor()
+        manifest = build_manifest(cursor, database_info_version(db_path))
+
+        os.makedirs(os.path.join(output_dir, SHARD_DIR), exist_ok=True)
+        for name in shell_files():
+            shutil.copyfile(os.path.join(SHELL_DIR, name), os.path.join(output_dir, name))
+
+        changed = {shard['prefix']: shard for shard in manifest['shards']
+                   if not os.path.exists(os.path.join(output_dir, shard['url']))}
+        records = {prefix: [] for prefix in changed}
+        if changed:
+            # One pass over the table instead of one query per shard
+            cursor.execute(f"SELECT {SNAPSHOT_COLUMNS} FROM fault_codes ORDER BY code, id")
+            for row in cursor:
+                prefix = shard_prefix(row[0])
+                if prefix in records:
+                    records[prefix].append(row)
+    finally:
+        conn.close()
+
+    for prefix, shard in changed.items():
+        path = os.path.join(output_dir, shard['url'])
+        with open(path + ".tmp", "wb") as f:
+            f.write(shard_body(records[prefix], prefix, shard['hash']))
+        os.replace(path + ".tmp", path)
+
+    # The manifest is replaced only once its shards exist, and old shards
+    # are removed only after it no longer lists them
+    path = os.path.join(output_dir, "snapshot.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+    current = {os.path.basename(shard['url']) for shard in manifest['shards']}
+    for name in os.listdir(os.path.join(output_dir, SHARD_DIR)):
+        if name not in current:
+            os.remove(os.path.join(output_dir, SHARD_DIR, name))
+    return len(changed), len(manifest['shards']) - len(changed)
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else OUTPUT_DIR
+    if not os.path.exists(db_path):
+        print("Database not found. Please run crawler.py first.")
+        return 1
+
+    written, kept = export_snapshot(db_path, output_dir)
+    print(f"Offline app exported to {output_dir}: {written} shards written, {kept} unchanged")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
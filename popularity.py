@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Code Popularity
+
+Counts how often each fault code is looked up. Hits are aggregated in
+memory and flushed periodically to a small side table, so a request never
+writes to disk; at startup the most looked-up codes are read back to warm
+the caches.
+
+The table lives in its own database file next to fault_codes.db: writing
+to fault_codes.db itself would change its version token (see
+lookup_cache.database_version) and drop every cached page on each flush.
+Several processes (serve_prefork.py workers) can share the file; each
+adds its own counts.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+# Seconds between flushes of the in-memory counts
+FLUSH_INTERVAL = 60.0
+
+# Codes preloaded at startup
+WARM_CODES = 100
+
+
+def popularity_path(db_path: str) -> str:
+    """Return the side database of a fault codes database (fault_codes_popularity.db)."""
+    return os.path.splitext(db_path)[0] + "_popularity.db"
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Open the side database of db_path, creating its table if needed."""
+    conn = sqlite3.connect(popularity_path(db_path), timeout=5.0)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS code_popularity (
+            code TEXT PRIMARY KEY,
+            hits INTEGER NOT NULL DEFAULT 0,
+            last_seen REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_code_popularity_hits ON code_popularity(hits DESC)")
+    return conn
+
+
+def top_codes(db_path: str, limit: int = WARM_CODES) -> List[str]:
+    """Return the most looked-up codes, most popular first.
+
+    Returns [] if nothing has been recorded yet.
+    """
+    if not os.path.exists(popularity_path(db_path)):
+        return []
+    conn = connect(db_path)
+    try:
+        cursor = conn.execute("SELECT code FROM code_popularity ORDER BY hits DESC, code LIMIT ?", (limit,))
+        return [code for code, in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+class PopularityCounter:
+    """In-memory lookup counts, flushed to the side table of a database."""
+
+    def __init__(self, interval: float = FLUSH_INTERVAL):
+        self.interval = interval
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def hit(self, fault_code: str, amount: int = 1):
+        with self._lock:
+            self._counts[fault_code] = self._counts.get(fault_code, 0) + amount
+
+    def pending(self) -> int:
+        """Number of codes counted since the last flush."""
+        with self._lock:
+            return len(self._counts)
+
+    def flush(self, db_path: str) -> int:
+        """Add the counts gathered so far to the side table.
+
+        Returns the number of codes written. On a database error the counts
+        are kept for the next flush.
+        """
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        if not counts:
+            return 0
+
+        now = time.time()
+        try:
+            conn = connect(db_path)
+            try:
+                with conn:
+                    conn.executemany("""
+                        INSERT INTO code_popularity (code, hits, last_seen) VALUES (?, ?, ?)
+                        ON CONFLICT(code) DO UPDATE SET hits = hits + excluded.hits, last_seen = excluded.last_seen
+                    """, [(code, hits, now) for code, hits in counts.items()])
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            for code, hits in counts.items():
+                self.hit(code, hits)
+            return 0
+        return len(counts)
+
+    def start(self, db_path: Callable[[], str]):
+        """Flush every interval seconds from a daemon thread.
+
+        db_path is called on each flush, so the database path can change
+        while the server runs (tests point app_flask.DB_PATH elsewhere).
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop.wait(self.interval):
+                self.flush(db_path())
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="popularity-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self, db_path: str):
+        """Stop the flush thread and write what is left."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush(db_path)
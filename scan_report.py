@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+VCDS Autoscan Report Parser
+
+Extracts every fault code from a pasted VCDS autoscan log, grouped by the
+controller module it was reported in. The whole report is tokenized in a
+single pass of one precompiled regex, so even logs of several hundred KB
+parse in a few milliseconds.
+"""
+
+import re
+import sys
+from typing import Dict, List, Optional
+
+# One alternation per line type we care about; everything else is skipped.
+#   Address 01: Engine (J623-CJSA)       Labels:| 04E-907-309-V1.clb
+#   16486 - Mass Air Flow Sensor (G70): Signal too Low
+#             P0102 - 002 - Lower Limit Exceeded - Intermittent
+#   001162 - Air Mass Flow Sensor
+#             P0482 00 [237] - Implausible Signal
+# The leading lookahead lets the engine skip most positions with a single
+# character test before trying the alternatives.
+SCAN_TOKEN_RE = re.compile(
+    r"(?=[ \tAPBCU0-9])(?:"
+    r"^[ \t]*Address[ \t]+(?P<address>[0-9A-Fa-f]{2}):[ \t]*(?P<module>[^\r\n]*?)"
+    r"(?:[ \t]+Labels:[^\r\n]*)?[ \t]*\r?$"
+    r"|^[ \t]*(?P<vag_code>\d{4,6})[ \t]+-[ \t]+(?P<description>[^\r\n]*?)[ \t]*\r?$"
+    r"|\b(?P<dtc>[PBCU][0-9A-F]{4})\b"
+    r"(?:[ \t]+(?P<status>[0-9A-F]{2})[ \t]*\[(?P<fault_type>\d{1,3})\])?"
+    r"(?:[ \t]+-[ \t]+(?P<detail>[^\r\n]*))?)",
+    re.MULTILINE
+)
+
+
+def _new_fault(vag_code: Optional[str] = None, description: str = "") -> Dict[str, Optional[str]]:
+    """Create an empty fault record."""
+    return {
+        'vag_code': vag_code,
+        'description': description,
+        'dtc': None,
+        'status': None,
+        'fault_type': None,
+        'detail': None
+    }
+
+
+def parse_scan_report(text: str) -> List[Dict]:
+    """Parse an autoscan log into modules with their faults.
+
+    Returns a list of modules in report order, each a dict with 'address',
+    'module' and 'faults'. Faults found before the first "Address" line
+    (e.g. a bare "P1757 00 [237]" paste) go into a module with no address.
+    """
+    modules = []
+    current_module = None
+    last_fault = None
+
+    for match in SCAN_TOKEN_RE.finditer(text):
+        address, module, vag_code, description, dtc, status, fault_type, detail = match.groups()
+
+        if address is not None:
+            current_module = {'address': address.upper(), 'module': module.strip(), 'faults': []}
+            modules.append(current_module)
+            last_fault = None
+            continue
+
+        if current_module is None:
+            current_module = {'address': None, 'module': None, 'faults': []}
+            modules.append(current_module)
+
+        if vag_code is not None:
+            last_fault = _new_fault(vag_code, description)
+            current_module['faults'].append(last_fault)
+        else:
+            # An OBD code on the line after a VAG code belongs to that fault;
+            # anywhere else it is a fault of its own
+            if last_fault is None or last_fault['dtc'] is not None:
+                last_fault = _new_fault()
+                current_module['faults'].append(last_fault)
+            last_fault['dtc'] = dtc
+            last_fault['status'] = status
+            last_fault['fault_type'] = fault_type
+            last_fault['detail'] = detail.strip() or None if detail else None
+
+    return [module for module in modules if module['faults']]
+
+
+def fault_lookup_keys(fault: Dict) -> List[str]:
+    """Return the codes to resolve for a fault, most specific first."""
+    return [key for key in (fault['vag_code'], fault['dtc']) if key]
+
+
+def main():
+    """Print the faults found in an autoscan log file (or stdin)."""
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8", errors="replace") as f:
+            text = f.read()
+    else:
+        text = sys.stdin.read()
+
+    for module in parse_scan_report(text):
+        print(f"Address {module['address'] or '??'}: {module['module'] or 'Unknown module'}")
+        for fault in module['faults']:
+            print(f"  {' / '.join(fault_lookup_keys(fault))} - {fault['description'] or fault['detail'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Ross-Tech VCDS Fault Codes Web Application - Prefork Server
+
+Runs the Flask app in several worker processes that share one listening
+socket and one memory-mapped code index, so a shop server can use every
+core. The index is built here before the workers start; each worker
+maps the same file, which the kernel keeps in memory only once, and
+rebuilds it when the database changes (see FaultCodeIndex.code_index).
+
+Requires os.fork (Linux, macOS). On Termux or Windows keep using
+`python app_flask.py`, which runs the built-in single-process server.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import time
+
+from werkzeug.serving import make_server
+
+import app_flask
+from fault_index import ensure_indexes
+from shared_index import INDEX_PATH, build_shared_index
+
+# Workers that die sooner than this after starting are not restarted in a
+# tight loop; the supervisor waits this long before forking a replacement.
+RESTART_DELAY = 1.0
+
+
+def prepare_index(index_path):
+    """Bring the database indexes up to date and write the shared index."""
+    conn = sqlite3.connect(app_flask.DB_PATH)
+    try:
+        ensure_indexes(conn)
+    finally:
+        conn.close()
+    return build_shared_index(app_flask.DB_PATH, index_path)
+
+
+def run_worker(sock, host, port, index_path):
+    """Serve requests from the shared socket until terminated."""
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    app_flask.load_shared_index(index_path)
+    app_flask.start_background_tasks()
+    server = make_server(host, port, app_flask.app, threaded=True, fd=sock.fileno())
+    try:
+        server.serve_forever()
+    finally:
+        # os._exit skips atexit handlers, so flush the lookup counts here
+        app_flask.stop_background_tasks()
+        os._exit(0)
+
+
+def spawn_worker(sock, host, port, index_path):
+    """Fork a worker process. Returns its pid in the parent."""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(sock, host, port, index_path)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the fault code lookup app with N worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: one per core)")
+    parser.add_argument("--index", default=INDEX_PATH, help="path of the shared index file")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        print("Prefork mode needs os.fork; run 'python app_flask.py' instead.")
+        return 1
+    if not os.path.exists(app_flask.DB_PATH):
+        print("Database not found. Please run crawler.py first.")
+        return 1
+
+    count = prepare_index(args.index)
+    print(f"Shared index: {count} codes in {args.index}")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    workers = {}
+    for _ in range(args.workers):
+        pid = spawn_worker(sock, args.host, args.port, args.index)
+        workers[pid] = time.monotonic()
+    print(f"Serving on http://{args.host}:{args.port} with {len(workers)} workers")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = workers.pop(pid, None)
+        if stopping or started is None:
+            continue
+        if time.monotonic() - started < RESTART_DELAY:
+            time.sleep(RESTART_DELAY)
+        print(f"Worker {pid} exited; starting a replacement")
+        workers[spawn_worker(sock, args.host, args.port, args.index)] = time.monotonic()
+
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Shared Memory-Mapped Code Index
+
+A read-only, sorted index of every fault code with its row id and title,
+written once to a flat file and memory-mapped by each server process.
+The operating system shares the mapped pages between processes, so the
+memory used for the index stays the same however many workers run.
+
+File layout (little endian):
+    header   magic, format version, entry count, stamp length
+    stamp    database version the index was built from (UTF-8)
+    entries  fixed-size records sorted by code, then row id:
+             code offset, code length, title offset, title length, row id
+    blob     concatenated UTF-8 codes and titles
+"""
+
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+from typing import Iterator, List, Tuple
+
+from lookup_cache import database_version
+
+DB_PATH = "fault_codes.db"
+INDEX_PATH = "fault_codes.idx"
+
+MAGIC = b"FCIX"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sIII")
+ENTRY = struct.Struct("<IHIII")
+
+
+def version_stamp(db_path: str) -> str:
+    """Return the database version as stored in the index header."""
+    return stamp_for_version(database_version(db_path))
+
+
+def stamp_for_version(version) -> str:
+    """Return the header stamp for a lookup_cache.database_version token."""
+    return repr(version)
+
+
+def build_shared_index(db_path: str = DB_PATH, index_path: str = INDEX_PATH) -> int:
+    """Write the index file for a database. Returns the number of codes.
+
+    The file is written next to its final location and renamed into
+    place, so running workers never map a half-written index.
+    """
+    stamp = version_stamp(db_path).encode("utf-8")
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT id, code, title FROM fault_codes ORDER BY code, id").fetchall()
+    finally:
+        conn.close()
+
+    # Blob offsets are relative to the end of the entry table
+    entries = []
+    blob = bytearray()
+    for row_id, code, title in rows:
+        code_bytes = code.encode("utf-8")
+        title_bytes = (title or "").encode("utf-8")
+        entries.append((len(blob), len(code_bytes), len(blob) + len(code_bytes), len(title_bytes), row_id))
+        blob += code_bytes + title_bytes
+
+    tmp_path = f"{index_path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(entries), len(stamp)))
+        f.write(stamp)
+        for entry in entries:
+            f.write(ENTRY.pack(*entry))
+        f.write(blob)
+    os.replace(tmp_path, index_path)
+    return len(entries)
+
+
+class SharedIndex:
+    """Read-only view of an index file through a shared memory map."""
+
+    def __init__(self, index_path: str = INDEX_PATH):
+        with open(index_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.count, stamp_length = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._map.close()
+            raise ValueError(f"{index_path} is not a fault code index (format {FORMAT_VERSION})")
+
+        self.stamp = self._map[HEADER.size:HEADER.size + stamp_length].decode("utf-8")
+        self._entries = HEADER.size + stamp_length
+        self._blob = self._entries + self.count * ENTRY.size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self):
+        self._map.close()
+
+    def is_current(self, db_path: str = DB_PATH) -> bool:
+        """Check that the index was built from the database as it is now."""
+        return self.stamp == version_stamp(db_path)
+
+    def matches(self, version) -> bool:
+        """Check the index against an already computed database version."""
+        return self.stamp == stamp_for_version(version)
+
+    def _entry(self, position: int) -> Tuple[int, int, int, int, int]:
+        return ENTRY.unpack_from(self._map, self._entries + position * ENTRY.size)
+
+    def _code(self, position: int) -> bytes:
+        code_offset, code_length = self._entry(position)[:2]
+        start = self._blob + code_offset
+        return self._map[start:start + code_length]
+
+    def _record(self, position: int) -> Tuple[str, int, str]:
+        code_offset, code_length, title_offset, title_length, row_id = self._entry(position)
+        code = self._map[self._blob + code_offset:self._blob + code_offset + code_length]
+        title = self._map[self._blob + title_offset:self._blob + title_offset + title_length]
+        return code.decode("utf-8"), row_id, title.decode("utf-8")
+
+    def _lower_bound(self, key: bytes) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._code(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, code: str) -> List[Tuple[int, str]]:
+        """Return (row id, title) of every record with exactly this code, in row id order.
+
+        Wiki pages can share a code, so there may be more than one.
+        """
+        key = code.encode("utf-8")
+        position = self._lower_bound(key)
+        found = []
+        while position < self.count and self._code(position) == key:
+            _, row_id, title = self._record(position)
+            found.append((row_id, title))
+            position += 1
+        return found
+
+    def prefix(self, prefix: str, limit: int = 20) -> Iterator[Tuple[str, int, str]]:
+        """Yield (code, row id, title) for codes starting with prefix, in code order."""
+        key = prefix.encode("utf-8")
+        position = self._lower_bound(key)
+        while position < self.count and limit > 0 and self._code(position).startswith(key):
+            yield self._record(position)
+            position += 1
+            limit -= 1
+
+    def __iter__(self) -> Iterator[Tuple[str, int, str]]:
+        for position in range(self.count):
+            yield self._record(position)
+
+
+def main():
+    """Build the shared index for a database."""
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    index_path = sys.argv[2] if len(sys.argv) > 2 else INDEX_PATH
+    count = build_shared_index(db_path, index_path)
+    print(f"Wrote {count} codes to {index_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+// Offline fault code lookup.
+//
+// Keeps a copy of the fault codes database in IndexedDB and answers
+// lookups from it without a server. The copy is synced from snapshot.json
+// (see offline_snapshot.py): each shard holds the codes sharing a prefix
+// and has a content hash, so after a recrawl only changed shards are
+// downloaded again.
+(function () {
+    'use strict';
+
+    var DB_NAME = 'fault-codes';
+    var DB_VERSION = 2;
+    var MAX_RESULTS = 50;
+
+    // Record fields shown as sections, in display order
+    var SECTIONS = [
+        ['symptoms', 'Symptoms'],
+        ['causes', 'Causes'],
+        ['solutions', 'Solutions'],
+        ['special_notes', 'Bonus notes'],
+        ['full_content', 'Full information'],
+        ['technical_info', 'Technical information']
+    ];
+
+    var statusBox = document.getElementById('status');
+    var results = document.getElementById('results');
+    var input = document.getElementById('code');
+
+    function promised(request) {
+        return new Promise(function (resolve, reject) {
+            request.onsuccess = function () { resolve(request.result); };
+            request.onerror = function () { reject(request.error); };
+        });
+    }
+
+    function completed(transaction) {
+        return new Promise(function (resolve, reject) {
+            transaction.oncomplete = function () { resolve(); };
+            transaction.onerror = transaction.onabort = function () { reject(transaction.error); };
+        });
+    }
+
+    // Records are keyed by row id, as wiki pages can share a code; version
+    // 1 keyed them by code, so its copy is dropped and synced again
+    function openDatabase() {
+        var request = indexedDB.open(DB_NAME, DB_VERSION);
+        request.onupgradeneeded = function () {
+            var db = request.result;
+            Array.prototype.slice.call(db.objectStoreNames).forEach(function (name) {
+                db.deleteObjectStore(name);
+            });
+            var codes = db.createObjectStore('codes', {keyPath: 'id'});
+            codes.createIndex('prefix', 'prefix');
+            codes.createIndex('code', 'code');
+            db.createObjectStore('shards', {keyPath: 'prefix'});
+            db.createObjectStore('meta');
+        };
+        return promised(request);
+    }
+
+    function read(db, store, method, argument) {
+        var objectStore = db.transaction(store).objectStore(store);
+        return promised(argument === undefined ? objectStore[method]() : objectStore[method](argument));
+    }
+
+    function readCode(db, code) {
+        return promised(db.transaction('codes').objectStore('codes').index('code').getAll(code));
+    }
+
+    // Row ids of the records whose code contains text, in code order
+    function findCodes(db, text) {
+        return new Promise(function (resolve, reject) {
+            var found = [];
+            var request = db.transaction('codes').objectStore('codes').index('code').openKeyCursor();
+            request.onsuccess = function () {
+                var cursor = request.result;
+                if (!cursor) {
+                    resolve(found);
+                    return;
+                }
+                if (cursor.key.indexOf(text) !== -1) {
+                    found.push(cursor.primaryKey);
+                }
+                cursor.continue();
+            };
+            request.onerror = function () { reject(request.error); };
+        });
+    }
+
+    async function fetchShard(shard, fields) {
+        var response = await fetch(shard.url);
+        if (!response.ok) {
+            throw new Error('shard ' + shard.prefix + ': HTTP ' + response.status);
+        }
+        var data = await new Response(response.body.pipeThrough(new DecompressionStream('gzip'))).json();
+        return data.records.map(function (row) {
+            var record = {prefix: shard.prefix};
+            fields.forEach(function (field, i) { record[field] = row[i]; });
+            return record;
+        });
+    }
+
+    // Replace every stored record of a shard in one transaction, so a failed
+    // download never leaves a shard half updated
+    function replaceShard(db, prefix, hash, records) {
+        var transaction = db.transaction(['codes', 'shards'], 'readwrite');
+        var codes = transaction.objectStore('codes');
+        var cursorRequest = codes.index('prefix').openKeyCursor(IDBKeyRange.only(prefix));
+        cursorRequest.onsuccess = function () {
+            var cursor = cursorRequest.result;
+            if (cursor) {
+                codes.delete(cursor.primaryKey);
+                cursor.continue();
+                return;
+            }
+            records.forEach(function (record) { codes.put(record); });
+            if (hash) {
+                transaction.objectStore('shards').put({prefix: prefix, hash: hash});
+            } else {
+                transaction.objectStore('shards').delete(prefix);
+            }
+        };
+        return completed(transaction);
+    }
+
+    // Bring the local copy up to date with snapshot.json. Returns the
+    // snapshot metadata of the local copy.
+    async function sync(db) {
+        var meta = await read(db, 'meta', 'get', 'snapshot');
+        var response = await fetch('snapshot.json', {cache: 'no-cache'});
+        if (!response.ok) {
+            throw new Error('snapshot.json: HTTP ' + response.status);
+        }
+        var snapshot = await response.json();
+        if (meta && meta.version === snapshot.version && meta.revision === snapshot.revision) {
+            return meta;
+        }
+
+        var stored = {};
+        (await read(db, 'shards', 'getAll')).forEach(function (shard) { stored[shard.prefix] = shard.hash; });
+
+        var done = 0;
+        for (var shard of snapshot.shards) {
+            if (stored[shard.prefix] !== shard.hash) {
+                setStatus('UPDATING DATABASE: SHARD ' + (done + 1) + ' (' + shard.prefix + ')');
+                await replaceShard(db, shard.prefix, shard.hash, await fetchShard(shard, snapshot.fields));
+                done++;
+            }
+            delete stored[shard.prefix];
+        }
+        for (var prefix in stored) {
+            await replaceShard(db, prefix, null, []);
+        }
+
+        meta = {version: snapshot.version, revision: snapshot.revision,
+                total_codes: snapshot.total_codes, synced: new Date().toISOString()};
+        var transaction = db.transaction('meta', 'readwrite');
+        transaction.objectStore('meta').put(meta, 'snapshot');
+        await completed(transaction);
+        return meta;
+    }
+
+    // One record by row id ("@1199", the links of a code several pages
+    // share), else the exact code, then the code without pasted spaces and
+    // brackets, then the first MAX_RESULTS codes containing the query. A
+    // code on several pages lists all of them.
+    async function lookup(db, query) {
+        var code = query.trim().toUpperCase();
+        if (/^@\d+$/.test(code)) {
+            var record = await read(db, 'codes', 'get', Number(code.slice(1)));
+            return record ? {record: record} : {matches: [], total: 0};
+        }
+        var cleaned = code.replace(/[\[\]\s]+/g, '');
+        for (var key of cleaned !== code ? [code, cleaned] : [code]) {
+            var records = key ? await readCode(db, key) : [];
+            if (records.length === 1) {
+                return {record: records[0]};
+            }
+            if (records.length) {
+                return {matches: records, total: records.length, shared: true};
+            }
+        }
+
+        var ids = await findCodes(db, cleaned);
+        var matches = [];
+        for (var id of ids.slice(0, MAX_RESULTS)) {
+            matches.push(await read(db, 'codes', 'get', id));
+        }
+        return {matches: matches, total: ids.length};
+    }
+
+    function setStatus(text) {
+        statusBox.textContent = text;
+    }
+
+    function element(tag, className, text) {
+        var node = document.createElement(tag);
+        if (className) {
+            node.className = className;
+        }
+        if (text) {
+            node.textContent = text;
+        }
+        return node;
+    }
+
+    function showRecord(record) {
+        var box = element('div', 'result');
+        var title = element('h2');
+        title.appendChild(element('span', 'code-badge', record.code));
+        title.appendChild(document.createTextNode(' - ' + (record.title || 'Description not available')));
+        box.appendChild(title);
+        SECTIONS.forEach(function (section) {
+            if (record[section[0]]) {
+                var part = element('div', 'section');
+                part.appendChild(element('div', 'section-title', section[1]));
+                part.appendChild(element('div', 'section-content', record[section[0]]));
+                box.appendChild(part);
+            }
+        });
+        results.replaceChildren(box);
+    }
+
+    function showMatches(query, matches, total, shared) {
+        if (!matches.length) {
+            results.replaceChildren(element('div', 'error', "No results found for '" + query + "'."));
+            return;
+        }
+        var box = element('div', 'result');
+        var shown = total > matches.length ? ' (FIRST ' + matches.length + ')' : '';
+        box.appendChild(element('h2', null, 'FOUND ' + total + ' MATCHING CODES' + shown + ':'));
+        var list = element('ul');
+        matches.forEach(function (record) {
+            var link = element('a');
+            link.href = '#' + (shared ? '@' + record.id : encodeURIComponent(record.code));
+            link.appendChild(element('span', 'code-badge', record.code));
+            link.appendChild(document.createTextNode(' - ' + (record.title || '')));
+            var item = element('li');
+            item.appendChild(link);
+            list.appendChild(item);
+        });
+        box.appendChild(list);
+        results.replaceChildren(box);
+    }
+
+    async function search(db) {
+        var query = decodeURIComponent(location.hash.slice(1));
+        input.value = query;
+        if (!query.trim()) {
+            results.replaceChildren();
+            return;
+        }
+        var found = await lookup(db, query);
+        if (found.record) {
+            showRecord(found.record);
+        } else {
+            showMatches(query, found.matches, found.total, found.shared);
+        }
+    }
+
+    async function start() {
+        if (!('indexedDB' in window) || typeof DecompressionStream === 'undefined') {
+            setStatus('THIS BROWSER CANNOT STORE THE DATABASE OFFLINE. USE THE ONLINE LOOKUP.');
+            return;
+        }
+        if ('serviceWorker' in navigator) {
+            navigator.serviceWorker.register('sw.js').catch(function () {});
+        }
+
+        // Searches typed during the first sync run once it has finished
+        var db = null;
+        document.getElementById('search').addEventListener('submit', function (event) {
+            event.preventDefault();
+            var hash = '#' + encodeURIComponent(input.value.trim());
+            if (location.hash === hash && db) {
+                search(db);
+            }
+            location.hash = hash;
+        });
+        window.addEventListener('hashchange', function () {
+            if (db) {
+                search(db);
+            }
+        });
+
+        var database = await openDatabase();
+        var meta = await read(database, 'meta', 'get', 'snapshot');
+        try {
+            meta = await sync(database);
+        } catch (e) {
+            // Offline or the server is gone: keep using the local copy
+            if (!meta) {
+                setStatus('DATABASE NOT DOWNLOADED YET. CONNECT ONCE TO SYNC (' + e.message + ')');
+                return;
+            }
+        }
+        setStatus('DATABASE: ' + meta.total_codes + ' CODES | VERSION ' + (meta.version || '-') +
+                  ' | SYNCED ' + meta.synced.slice(0, 10));
+        db = database;
+        search(db);
+    }
+
+    start();
+})();
@@ -0,0 +1,63 @@
+// Service worker of the offline fault code lookup.
+//
+// Caches the app shell so the app starts without a network. The code
+// database itself is kept in IndexedDB by offline.js; snapshot.json and
+// the shards always go to the network so updates are noticed.
+'use strict';
+
+// Bump when a shell file changes so installed apps pick it up
+var SHELL_CACHE = 'fault-codes-shell-v2';
+var SHELL_FILES = ['./', 'offline.js', 'manifest.webmanifest', 'icon.svg'];
+
+self.addEventListener('install', function (event) {
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then(function (cache) { return cache.addAll(SHELL_FILES); })
+            .then(function () { return self.skipWaiting(); })
+    );
+});
+
+self.addEventListener('activate', function (event) {
+    event.waitUntil(
+        caches.keys()
+            .then(function (names) {
+                return Promise.all(names.filter(function (name) {
+                    return name.indexOf('fault-codes-shell-') === 0 && name !== SHELL_CACHE;
+                }).map(function (name) { return caches.delete(name); }));
+            })
+            .then(function () { return self.clients.claim(); })
+    );
+});
+
+// Shell files: answer from the cache right away and refresh it in the
+// background, so the next start gets any update
+self.addEventListener('fetch', function (event) {
+    var request = event.request;
+    var url = new URL(request.url);
+    var scope = new URL(self.registration.scope);
+    if (request.method !== 'GET' || url.origin !== scope.origin || url.pathname.indexOf(scope.pathname) !== 0) {
+        return;
+    }
+    var path = url.pathname.slice(scope.pathname.length);
+    var shellFile = path === '' || path === 'index.html' ? './' : path;
+    if (SHELL_FILES.indexOf(shellFile) === -1) {
+        return;
+    }
+
+    var cacheKey = new URL(shellFile, scope).href;
+    event.respondWith(caches.open(SHELL_CACHE).then(function (cache) {
+        return cache.match(cacheKey).then(function (cached) {
+            var refresh = fetch(request).then(function (response) {
+                if (response.ok) {
+                    cache.put(cacheKey, response.clone());
+                }
+                return response;
+            });
+            if (cached) {
+                event.waitUntil(refresh.catch(function () {}));
+                return cached;
+            }
+            return refresh;
+        });
+    }));
+});
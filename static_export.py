@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Ross-Tech VCDS Fault Codes - Static Site Export
+
+Renders every fault code record to its own HTML page, plus one listing
+page per code prefix, an index page and a compact JSON search index, so
+the whole lookup can be served by any static file server. Wiki pages can
+share a code, so each record's page is named after its wiki page.
+
+Exports are incremental: a state file in the output directory remembers
+each page's content hash, so re-running after a recrawl rewrites only the
+pages of records that changed (and removes those of deleted records).
+Code pages are rendered in parallel worker processes.
+
+    python static_export.py [--db fault_codes.db] [--output site] [--jobs N] [--full]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+
+from jinja2 import Environment
+
+from fault_index import FULL_COLUMNS, ensure_indexes, record_hash
+from offline_snapshot import shard_prefix
+
+DB_PATH = "fault_codes.db"
+OUTPUT_DIR = "site"
+STATE_FILE = ".export-state.json"
+CODES_DIR = "codes"
+LISTS_DIR = "list"
+
+# Code pages handed to a worker process at a time
+RENDER_CHUNK_SIZE = 500
+
+# Record sections in display order: (column index in FULL_COLUMNS, heading)
+SECTIONS = ((3, "Symptoms"), (4, "Causes"), (5, "Solutions"), (6, "Bonus notes"),
+            (2, "Full information"), (7, "Technical information"))
+
+PAGE_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>{{ page_title }} - VCDS Fault Code Lookup</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <meta name="theme-color" content="#4A90E2">
+    <link rel="stylesheet" href="{{ root }}style.css">
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>VCDS FAULT CODE LOOKUP</h1>
+            <p class="subtitle">VAG-COM Diagnostic System v1.0</p>
+        </div>
+"""
+
+PAGE_FOOT = """
+    </div>
+</body>
+</html>
+"""
+
+CODE_TEMPLATE = PAGE_HEAD + """
+        <div class="search-section">
+            <div class="mode-toggle">
+                <span>PREFIX <a href="../{{ lists_dir }}/{{ prefix }}.html">{{ prefix }}</a></span>
+                <a href="../index.html">&laquo; ALL CODES</a>
+            </div>
+        </div>
+        <div class="result">
+            <div class="result-header">
+                <div class="result-title">
+                    FAULT CODE: <span class="code-badge">{{ code }}</span>
+                    - {{ title if title and title.strip() else 'Description not available' }}
+                </div>
+            </div>
+            <div class="result-content">
+                {% for heading, text in sections %}
+                <div class="section">
+                    <div class="section-title">{{ heading }}</div>
+                    <div class="section-content">{{ text }}</div>
+                </div>
+                {% endfor %}
+            </div>
+            <div class="status-bar">FAULT CODE: {{ code }} | STATUS: ANALYZED</div>
+        </div>
+""" + PAGE_FOOT
+
+LIST_TEMPLATE = PAGE_HEAD + """
+        <div class="search-section">
+            <div class="mode-toggle">
+                <span>{{ codes|length }} CODES STARTING WITH {{ prefix }}</span>
+                <a href="../index.html">&laquo; ALL CODES</a>
+            </div>
+        </div>
+        <div class="multiple-results">
+            <ul>
+            {% for code, title, page in codes %}
+                <li><a class="hit-link" href="../{{ codes_dir }}/{{ page }}"><span class="code-badge">{{ code }}</span> - {{ title }}</a></li>
+            {% endfor %}
+            </ul>
+        </div>
+""" + PAGE_FOOT
+
+INDEX_TEMPLATE = PAGE_HEAD + """
+        <div class="search-section">
+            <div class="diagnostic-info">
+                <strong>DATABASE:</strong> {{ total }} FAULT CODES | <strong>EXPORTED:</strong> {{ exported }}
+            </div>
+            <form class="search-form" id="search">
+                <label class="search-label">FAULT CODE OR TITLE:</label>
+                <div class="input-group">
+                    <input type="text" id="query" placeholder="Enter fault code (e.g. 00532) or words from the title" autocomplete="off" autocorrect="off" autocapitalize="off" spellcheck="false">
+                    <button type="submit">SCAN</button>
+                </div>
+            </form>
+        </div>
+        <div class="multiple-results" id="results" hidden>
+            <h3 id="results-title"></h3>
+            <ul id="results-list"></ul>
+        </div>
+        <div class="multiple-results">
+            <h3>BROWSE BY PREFIX:</h3>
+            <ul>
+            {% for prefix, count in prefixes %}
+                <li><a class="hit-link" href="{{ lists_dir }}/{{ prefix }}.html"><span class="code-badge">{{ prefix }}</span> - {{ count }} codes</a></li>
+            {% endfor %}
+            </ul>
+        </div>
+        <script>
+            // search-index.json is a list of [code, title, page]; an exact code
+            // opens its page (or lists the pages sharing it), anything else
+            // lists codes and titles containing it
+            var MAX_RESULTS = 50;
+            var index = null;
+
+            function show(query) {
+                var upper = query.toUpperCase();
+                var lower = query.toLowerCase();
+                var matches = index.filter(function (entry) { return entry[0] === upper; });
+                if (matches.length === 1) {
+                    location.href = '{{ codes_dir }}/' + matches[0][2];
+                    return;
+                }
+                if (!matches.length) {
+                    matches = index.filter(function (entry) {
+                        return entry[0].indexOf(upper) !== -1 || entry[1].toLowerCase().indexOf(lower) !== -1;
+                    });
+                }
+                var list = document.getElementById('results-list');
+                list.replaceChildren();
+                matches.slice(0, MAX_RESULTS).forEach(function (entry) {
+                    var link = document.createElement('a');
+                    link.className = 'hit-link';
+                    link.href = '{{ codes_dir }}/' + entry[2];
+                    var badge = document.createElement('span');
+                    badge.className = 'code-badge';
+                    badge.textContent = entry[0];
+                    link.appendChild(badge);
+                    link.appendChild(document.createTextNode(' - ' + entry[1]));
+                    var item = document.createElement('li');
+                    item.appendChild(link);
+                    list.appendChild(item);
+                });
+                document.getElementById('results-title').textContent = matches.length
+                    ? 'FOUND ' + matches.length + ' MATCHING CODES' + (matches.length > MAX_RESULTS ? ' (FIRST ' + MAX_RESULTS + ')' : '') + ':'
+                    : "NO RESULTS FOR '" + query + "'";
+                document.getElementById('results').hidden = false;
+            }
+
+            document.getElementById('search').addEventListener('submit', function (event) {
+                event.preventDefault();
+                var query = document.getElementById('query').value.trim();
+                if (!query) {
+                    return;
+                }
+                if (index) {
+                    show(query);
+                    return;
+                }
+                fetch('search-index.json')
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) { index = data; show(query); });
+            });
+        </script>
+""" + PAGE_FOOT
+
+_environment = Environment(autoescape=True)
+_templates = {}
+
+
+def template(name: str):
+    """Return a compiled template (compiled once per process)."""
+    if name not in _templates:
+        source = {"code": CODE_TEMPLATE, "list": LIST_TEMPLATE, "index": INDEX_TEMPLATE}[name]
+        _templates[name] = _environment.from_string(source)
+    return _templates[name]
+
+
+def page_css() -> str:
+    """The stylesheet of the web app's page template."""
+    from app_flask import PAGE_TEMPLATE
+    css = re.search(r"<style>(.*?)</style>", PAGE_TEMPLATE, re.S).group(1)
+    return "\n".join(line[8:] if line.startswith(" " * 8) else line.strip() for line in css.strip("\n").splitlines()) + "\n"
+
+
+def page_name(name: str) -> str:
+    """File name of the page of a wiki page or code (URL-safe)."""
+    return re.sub(r"[^A-Za-z0-9_-]", "_", name) + ".html"
+
+
+def template_digest() -> str:
+    """Changes whenever the code page template does, forcing a full re-render."""
+    return hashlib.sha1(CODE_TEMPLATE.encode("utf-8")).hexdigest()[:12]
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """Write a text file unless it already has this content."""
+    data = content.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+    return True
+
+
+def render_code_pages(output_dir: str, records: Sequence[Tuple[str, tuple]]) -> int:
+    """Render and write the pages of a chunk of (file name, record) pairs (runs in a worker)."""
+    code_template = template("code")
+    codes_dir = os.path.join(output_dir, CODES_DIR)
+    for name, record in records:
+        code = record[0]
+        html = code_template.render(
+            page_title=code, root="../", code=code, title=record[1],
+            prefix=shard_prefix(code), lists_dir=LISTS_DIR,
+            sections=[(heading, record[i]) for i, heading in SECTIONS if record[i]]
+        )
+        path = os.path.join(codes_dir, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(html)
+        os.replace(path + ".tmp", path)
+    return len(records)
+
+
+def load_state(output_dir: str) -> dict:
+    try:
+        with open(os.path.join(output_dir, STATE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_pages(cursor) -> List[Tuple[int, str, str, str, str]]:
+    """Return (id, code, title, file name, content hash) for every record, in code order.
+
+    A record's page is named after its wiki page, or its code for records
+    saved before pages were recorded; a name already taken (two names
+    made URL-safe alike) gets the row id appended.
+    """
+    cursor.execute("SELECT id, code, page, title, content_hash FROM fault_codes ORDER BY code, id")
+    rows = []
+    names = set()
+    for record_id, code, page, title, content_hash in cursor.fetchall():
+        if not content_hash:
+            cursor.execute(f"SELECT {FULL_COLUMNS} FROM fault_codes WHERE id = ?", (record_id,))
+            content_hash = record_hash(cursor.fetchone())
+        name = page_name(page or code)
+        if name in names:
+            name = page_name(f"{page or code}-{record_id}")
+        names.add(name)
+        rows.append((record_id, code, title or "", name, content_hash))
+    return rows
+
+
+def fetch_records(cursor, ids: Sequence[int], chunk_size: int = 500) -> Dict[int, tuple]:
+    """Fetch the full records of the given row ids, by id."""
+    records = {}
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        placeholders = ", ".join("?" for _ in chunk)
+        cursor.execute(f"SELECT id, {FULL_COLUMNS} FROM fault_codes WHERE id IN ({placeholders})", chunk)
+        records.update((row[0], row[1:]) for row in cursor.fetchall())
+    return records
+
+
+def export_site(db_path: str, output_dir: str, jobs: int = None, full: bool = False) -> Dict[str, int]:
+    """Export (or update) the static site. Returns counts of pages rendered, kept and removed."""
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_indexes(conn)
+        cursor = conn.cursor()
+        codes = record_pages(cursor)
+
+        state = {} if full else load_state(output_dir)
+        digest = template_digest()
+        previous = state.get("pages", {}) if state.get("template") == digest else {}
+        current = {name: content_hash for _, _, _, name, content_hash in codes}
+        changed = [(record_id, name) for record_id, _, _, name, content_hash in codes
+                   if previous.get(name) != content_hash
+                   or not os.path.exists(os.path.join(output_dir, CODES_DIR, name))]
+        fetched = fetch_records(cursor, [record_id for record_id, _ in changed])
+        records = [(name, fetched[record_id]) for record_id, name in changed if record_id in fetched]
+    finally:
+        conn.close()
+
+    os.makedirs(os.path.join(output_dir, CODES_DIR), exist_ok=True)
+    os.makedirs(os.path.join(output_dir, LISTS_DIR), exist_ok=True)
+
+    chunks = [records[i:i + RENDER_CHUNK_SIZE] for i in range(0, len(records), RENDER_CHUNK_SIZE)]
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(chunks) <= 1:
+        rendered = sum(render_code_pages(output_dir, chunk) for chunk in chunks)
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(chunks))) as pool:
+            rendered = sum(pool.map(render_code_pages, [output_dir] * len(chunks), chunks))
+
+    # Pages of deleted records, and of codes exported before pages were
+    # named after their wiki page
+    removed = 0
+    for name in os.listdir(os.path.join(output_dir, CODES_DIR)):
+        if name.endswith(".html") and name not in current:
+            os.remove(os.path.join(output_dir, CODES_DIR, name))
+            removed += 1
+
+    # Listing pages, index and search index are small; they are rebuilt
+    # every time but only written when their content changed
+    by_prefix = {}
+    for _, code, title, name, _ in codes:
+        by_prefix.setdefault(shard_prefix(code), []).append((code, title, name))
+    list_template = template("list")
+    for prefix, entries in by_prefix.items():
+        write_if_changed(os.path.join(output_dir, LISTS_DIR, f"{prefix}.html"), list_template.render(
+            page_title=f"Codes {prefix}", root="../", prefix=prefix, codes=entries, codes_dir=CODES_DIR))
+    for name in os.listdir(os.path.join(output_dir, LISTS_DIR)):
+        if name.endswith(".html") and name[:-5] not in by_prefix:
+            os.remove(os.path.join(output_dir, LISTS_DIR, name))
+
+    write_if_changed(os.path.join(output_dir, "search-index.json"), json.dumps(
+        [[code, title, name] for _, code, title, name, _ in codes], ensure_ascii=False, separators=(",", ":")))
+    write_if_changed(os.path.join(output_dir, "style.css"), page_css())
+    if rendered or removed or not os.path.exists(os.path.join(output_dir, "index.html")):
+        write_if_changed(os.path.join(output_dir, "index.html"), template("index").render(
+            page_title="All codes", root="", total=len(codes), exported=time.strftime("%Y-%m-%d"),
+            prefixes=[(prefix, len(entries)) for prefix, entries in sorted(by_prefix.items())],
+            lists_dir=LISTS_DIR, codes_dir=CODES_DIR))
+
+    with open(os.path.join(output_dir, STATE_FILE), "w", encoding="utf-8") as f:
+        json.dump({"template": digest, "pages": current}, f, separators=(",", ":"))
+    return {"rendered": rendered, "kept": len(current) - rendered, "removed": removed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export every fault code as a static HTML site")
+    parser.add_argument("--db", default=DB_PATH, help="database to export")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="output directory")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--full", action="store_true", help="re-render every page")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print("Database not found. Please run crawler.py first.")
+        return 1
+
+    started = time.perf_counter()
+    counts = export_site(args.db, args.output, args.jobs, args.full)
+    print(f"Exported to {args.output} in {time.perf_counter() - started:.1f}s: "
+          f"{counts['rendered']} pages rendered, {counts['kept']} unchanged, {counts['removed']} removed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
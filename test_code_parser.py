@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the code parser: how typed and pasted input maps to the
+canonical VAG and OBD codes, the keys a lookup probes, and the keys a
+record is stored under.
+
+Run with: python -m pytest test_code_parser.py
+"""
+
+import pytest
+
+from fault_index import code_keys, lookup_keys, parse_code
+from fault_lookup import normalize_fault_code
+
+
+# input -> (obd, vag, suffix)
+PARSED = [
+    ("P1757", ("P1757", None, None)),
+    ("p1757", ("P1757", None, None)),
+    ("U0101", ("U0101", None, None)),
+    ("01757", (None, "01757", None)),
+    ("1757", (None, "01757", None)),
+    ("175", (None, "00175", None)),
+    ("17", (None, None, None)),
+    ("001073", (None, None, None)),
+    ("P1757 00 [237]", ("P1757", None, "00 [237]")),
+    ("P2BA6/01174", ("P2BA6", "01174", None)),
+    ("01174 / P2BA6", ("P2BA6", "01174", None)),
+    ("16815 - Oxygen Sensor", (None, "16815", None)),
+    ("P0420 - Catalyst Efficiency", ("P0420", None, None)),
+    ("glow plug", (None, None, None)),
+    ("", (None, None, None)),
+]
+
+# input -> (normalized code, keys probed in order)
+LOOKUPS = [
+    ("00532", "00532", ["00532"]),
+    ("532", "532", ["532", "00532"]),
+    ("0120", "0120", ["0120", "00120"]),
+    ("12", "12", ["12"]),
+    ("p0420", "P0420", ["P0420"]),
+    ("P1757 00 [237]", "P1757", ["P1757"]),
+    ("P2BA6/01174", "01174/P2BA6", ["01174/P2BA6", "01174", "P2BA6"]),
+    ("01174/P2BA6", "01174/P2BA6", ["01174/P2BA6", "01174", "P2BA6"]),
+    ("16815 - Oxygen Sensor", "16815", ["16815"]),
+]
+
+# (record code, title) -> (vag_code, obd_code)
+RECORD_KEYS = [
+    (("16815", "16815/P0431/001073"), ("16815", "P0431")),
+    (("P0431", None), (None, "P0431")),
+    (("03802", "B1487/038023"), ("03802", "B1487")),
+    (("00532", "00532"), ("00532", None)),
+    (("18010", "Power Supply Terminal 30"), ("18010", None)),
+]
+
+
+@pytest.mark.parametrize("text, parts", PARSED)
+def test_parse_code(text, parts):
+    parsed = parse_code(text)
+    assert (parsed.obd, parsed.vag, parsed.suffix) == parts
+
+
+@pytest.mark.parametrize("text, fault_code, keys", LOOKUPS)
+def test_lookup_keys(text, fault_code, keys):
+    assert normalize_fault_code(text) == (fault_code, None)
+    assert lookup_keys(fault_code) == keys
+
+
+@pytest.mark.parametrize("record, keys", RECORD_KEYS)
+def test_code_keys(record, keys):
+    assert code_keys(*record) == keys
+
+
+@pytest.mark.parametrize("text", ["", "x" * 101, "!!!"])
+def test_invalid_input(text):
+    fault_code, error = normalize_fault_code(text)
+    assert fault_code is None and error
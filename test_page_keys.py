@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Tests for records keyed by wiki page: the migration from databases keyed
+by code, lookups of a code several pages share, alias resolution and
+keyset paging across records with the same code, and the shared index
+that follows the database as records are added.
+
+Run with: python -m pytest test_page_keys.py
+"""
+
+import sqlite3
+
+import pytest
+
+import app_flask
+from fault_index import (
+    MATCH_CLEANED, MATCH_EXACT, MATCH_MULTIPLE, PAGE_SIZE, browse_codes, ensure_indexes, ensure_page_keys,
+    index_fault_code, lookup_code, partial_page, record_facets,
+)
+from fault_lookup import FaultCodeIndex
+from lookup_cache import SingleFlight
+from shared_index import SharedIndex, build_shared_index
+
+# Schema of databases from before records were keyed by page
+LEGACY_TABLE = '''
+    CREATE TABLE fault_codes(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        code TEXT NOT NULL,
+        title TEXT,
+        symptoms TEXT,
+        causes TEXT,
+        solutions TEXT,
+        full_content TEXT,
+        special_notes TEXT,
+        technical_info TEXT,
+        checked_at TEXT,
+        UNIQUE(code)
+    )
+'''
+
+# A full first page of codes, the last of which two more pages share,
+# and records found by the codes their title lists
+LEGACY_ROWS = [(f"{code:05d}", f"Code {code:05d}") for code in range(400, 400 + PAGE_SIZE)] + [
+    ("03802", "B1487/038023"),
+    ("16815", "16815/P0431/001073"),
+]
+SHARED_CODE = f"{399 + PAGE_SIZE:05d}"
+SHARED_PAGES = ["Dup page A", "Dup page B"]
+
+
+def add_page(conn, code, page, title):
+    """Save a record with its page, the way the crawler does."""
+    cursor = conn.execute(
+        "INSERT INTO fault_codes (code, page, title, full_content) VALUES (?, ?, ?, ?)",
+        (code, page, title, f"{code} - {title}")
+    )
+    index_fault_code(cursor, cursor.lastrowid, code, title, record_facets(title))
+    conn.commit()
+    return cursor.lastrowid
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """A database keyed by code, as written before pages were recorded."""
+    db_path = tmp_path / "fault_codes.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute(LEGACY_TABLE)
+    conn.executemany(
+        "INSERT INTO fault_codes (code, title, full_content, checked_at) VALUES (?, ?, ?, '2024-01-01')",
+        [(code, title, f"{code} - {title}") for code, title in LEGACY_ROWS]
+    )
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+@pytest.fixture
+def paged_db(legacy_db):
+    """The legacy database migrated, plus more pages sharing SHARED_CODE."""
+    conn = sqlite3.connect(legacy_db)
+    ensure_indexes(conn)
+    for page in SHARED_PAGES:
+        add_page(conn, SHARED_CODE, page, f"{SHARED_CODE} - {page}")
+    conn.close()
+    return legacy_db
+
+
+@pytest.fixture
+def app_db(paged_db, monkeypatch):
+    """Point the app at the paged database with empty caches."""
+    monkeypatch.setattr(app_flask, "DB_PATH", str(paged_db))
+    monkeypatch.setattr(app_flask, "page_flight", SingleFlight())
+    for cache in (app_flask.page_cache, app_flask.compressed_cache):
+        cache.clear()
+    yield paged_db
+    for cache in (app_flask.page_cache, app_flask.compressed_cache):
+        cache.clear()
+
+
+def record_ids(conn, code=None):
+    """Row ids in (code, id) order, of one code or of every record."""
+    where, params = ("WHERE code = ?", (code,)) if code else ("", ())
+    return [row[0] for row in conn.execute(f"SELECT id FROM fault_codes {where} ORDER BY code, id", params)]
+
+
+def test_ensure_page_keys_rebuilds_legacy_table(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+    before = conn.execute("SELECT id, code, title, checked_at FROM fault_codes ORDER BY id").fetchall()
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO fault_codes (code) VALUES ('00400')")
+    conn.rollback()
+
+    assert ensure_page_keys(conn)
+
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(fault_codes)")}
+    assert {"page", "checked_at"} <= columns
+    # Every row keeps its id and the columns the new table lacks
+    assert conn.execute("SELECT id, code, title, checked_at FROM fault_codes ORDER BY id").fetchall() == before
+    assert conn.execute("SELECT COUNT(*) FROM fault_codes WHERE page IS NOT NULL").fetchone() == (0,)
+
+    # Pages can now share a code, but not a page name
+    conn.execute("INSERT INTO fault_codes (code, page) VALUES ('00400', 'Another page')")
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO fault_codes (code, page) VALUES ('00401', 'Another page')")
+
+    # A second run finds the table keyed by page and leaves it alone
+    schema = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'fault_codes'").fetchone()
+    assert ensure_page_keys(conn)
+    assert conn.execute("SELECT sql FROM sqlite_master WHERE name = 'fault_codes'").fetchone() == schema
+    conn.close()
+
+
+def test_crawler_save_adopts_legacy_row(legacy_db):
+    pytest.importorskip("requests")
+    pytest.importorskip("bs4")
+    from crawler import FaultCodeCrawler
+
+    crawler = FaultCodeCrawler(str(legacy_db))
+    conn = sqlite3.connect(legacy_db)
+    ensure_indexes(conn)
+    [legacy_id] = record_ids(conn, "00410")
+
+    def save(page, title):
+        crawler.save_fault_code({
+            'code': "00410", 'page': page, 'title': title, 'full_content': f"00410 - {title}",
+            'symptoms': "", 'causes': "", 'solutions': "", 'special_notes': "", 'technical_info': "",
+        })
+
+    # The page of the legacy record replaces it instead of adding a second one
+    save("00410", "Code 00410")
+    rows = conn.execute("SELECT id, page FROM fault_codes WHERE code = '00410'").fetchall()
+    assert len(rows) == 1 and rows[0][0] != legacy_id and rows[0][1] == "00410"
+
+    # Another page with the same code is a record of its own
+    save("00410/P0410", "Secondary Air Injection System")
+    assert conn.execute("SELECT page FROM fault_codes WHERE code = '00410' ORDER BY id").fetchall() == [
+        ("00410",), ("00410/P0410",)]
+    conn.close()
+
+
+def test_duplicate_code_lookup_lists_every_page(paged_db, tmp_path):
+    conn = sqlite3.connect(paged_db)
+    ids = record_ids(conn, SHARED_CODE)
+    assert len(ids) == 1 + len(SHARED_PAGES)
+
+    match_type, rows = lookup_code(conn.cursor(), SHARED_CODE)
+    assert match_type == MATCH_MULTIPLE
+    assert [(code, page, code_id) for code, _, page, code_id in rows] == [
+        (SHARED_CODE, page, code_id) for page, code_id in zip([None] + SHARED_PAGES, ids)]
+
+    # The shared index knows every record, and only answers a code of one record by itself
+    index_path = tmp_path / "fault_codes.idx"
+    build_shared_index(str(paged_db), str(index_path))
+    code_index = SharedIndex(str(index_path))
+    try:
+        assert [row_id for row_id, _ in code_index.find(SHARED_CODE)] == ids
+        assert lookup_code(conn.cursor(), SHARED_CODE, code_index=code_index) == (match_type, rows)
+        assert lookup_code(conn.cursor(), "00410", code_index=code_index)[0] == MATCH_EXACT
+    finally:
+        code_index.close()
+    conn.close()
+
+    index = FaultCodeIndex(str(paged_db))
+    assert index.exact(SHARED_CODE) == (match_type, rows)
+    assert index.lookup(SHARED_CODE) == (match_type, rows)
+
+
+@pytest.mark.parametrize("query, match_type, code", [
+    ("16815", MATCH_EXACT, "16815"),
+    ("P0431", MATCH_CLEANED, "16815"),
+    ("001073", MATCH_CLEANED, "16815"),
+    ("B1487", MATCH_CLEANED, "03802"),
+    ("038023", MATCH_CLEANED, "03802"),
+    ("410", MATCH_CLEANED, "00410"),
+])
+def test_aliases_resolve_to_their_record(paged_db, query, match_type, code):
+    conn = sqlite3.connect(paged_db)
+    found = lookup_code(conn.cursor(), query)
+    conn.close()
+    assert (found[0], found[1][0]) == (match_type, code)
+
+    found = FaultCodeIndex(str(paged_db)).exact(query)
+    assert (found[0], found[1][0]) == (match_type, code)
+
+
+@pytest.mark.parametrize("page_size", range(1, 7))
+def test_keyset_pages_through_duplicated_code(paged_db, page_size):
+    conn = sqlite3.connect(paged_db)
+    cursor = conn.cursor()
+    # Some page size ends a page inside the run of records sharing a code
+    expected = [row[0] for row in conn.execute(
+        "SELECT id FROM fault_codes WHERE code >= '00440' ORDER BY code, id")]
+    partial_expected = [row[0] for row in conn.execute(
+        "SELECT id FROM fault_codes WHERE code LIKE '%0044%' ORDER BY code, id")]
+
+    for fetch, wanted in ((lambda after: browse_codes(cursor, "00440", None, after, page_size, "id"), expected),
+                          (lambda after: partial_page(cursor, "0044", after, page_size, "id"), partial_expected)):
+        seen = []
+        rows, after = fetch(None)
+        while True:
+            seen.extend(row_id for row_id, in rows)
+            if after is None:
+                break
+            rows, after = fetch(after)
+        assert seen == wanted
+    conn.close()
+
+
+def test_api_browse_pages_across_duplicated_code(app_db):
+    conn = sqlite3.connect(app_db)
+    shared_ids = record_ids(conn, SHARED_CODE)
+    conn.close()
+
+    with app_flask.app.test_client() as client:
+        first = client.get("/api/browse?from=00400&to=00499").get_json()
+        # The first page ends on the legacy record of the shared code
+        assert len(first['codes']) == PAGE_SIZE
+        assert first['next'] == f"{SHARED_CODE}:{shared_ids[0]}"
+
+        second = client.get(f"/api/browse?from=00400&to=00499&after={first['next']}").get_json()
+        assert [(entry['page'], entry['id']) for entry in second['codes']] == list(zip(SHARED_PAGES, shared_ids[1:]))
+        assert second['next'] is None
+
+        # A multiple match links each record to its own page
+        body = client.get(f"/?code={SHARED_CODE}").get_data(as_text=True)
+        assert f'href="/?id={shared_ids[0]}"' in body
+        assert 'href="/?page=Dup+page+A"' in body and 'href="/?page=Dup+page+B"' in body
+
+
+def test_code_page_loads_sections_of_its_own_record(app_db):
+    conn = sqlite3.connect(app_db)
+    [record_id] = record_ids(conn, "16815")
+    other_id = add_page(conn, "16815", "16815 - Another page", "Another page")
+    conn.close()
+
+    with app_flask.app.test_client() as client:
+        # P0431 is listed by one of the pages with code 16815 only
+        body = client.get("/?code=P0431").get_data(as_text=True)
+        assert f'data-record="{record_id}"' in body
+
+        response = client.get(f"/section/16815/full_content?id={record_id}")
+        assert response.status_code == 200
+        assert "/P0431/001073" in response.get_data(as_text=True)
+        response = client.get(f"/section/16815/full_content?id={other_id}")
+        assert "Another page" in response.get_data(as_text=True)
+        # By code alone the record is ambiguous
+        assert client.get("/section/16815/full_content").status_code == 404
+
+
+def test_text_search_links_each_hit_to_its_record(app_db):
+    conn = sqlite3.connect(app_db)
+    [legacy_id] = record_ids(conn, "03802")
+    conn.close()
+
+    with app_flask.app.test_client() as client:
+        # The pages share a code, so each hit links to its own page
+        body = client.get("/search?q=Dup+page").get_data(as_text=True)
+        assert 'href="/?page=Dup+page+A"' in body and 'href="/?page=Dup+page+B"' in body
+        assert f'href="/?code={SHARED_CODE}"' not in body
+
+        # A legacy record without a page is linked by its id
+        body = client.get("/search?q=B1487").get_data(as_text=True)
+        assert f'href="/?id={legacy_id}"' in body
+
+
+def test_shared_index_is_rebuilt_after_database_change(paged_db, tmp_path):
+    index_path = str(tmp_path / "fault_codes.idx")
+    build_shared_index(str(paged_db), index_path)
+    index = FaultCodeIndex(str(paged_db))
+    stale = index.load_shared_index(index_path)
+    assert index.code_index(index.version()) is stale
+
+    conn = sqlite3.connect(paged_db)
+    new_id = add_page(conn, "19999", "19999", "Code 19999")
+    conn.close()
+
+    # Lookups go to SQLite until the index of the new version is mapped
+    version = index.version()
+    assert index.code_index(version) is None
+    assert index.exact("19999")[0] == MATCH_EXACT
+    # Wait for the background rebuild, which holds the lock
+    with index._shared_index_lock:
+        pass
+    rebuilt = index.code_index(version)
+    assert rebuilt is not None and rebuilt is not stale
+    assert rebuilt.find("19999") == [(new_id, "Code 19999")]
+    rebuilt.close()
+    stale.close()
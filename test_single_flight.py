@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Tests for request coalescing: concurrent identical lookups share one
+database execution.
+
+Run with: python -m pytest test_single_flight.py
+"""
+
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import app_flask
+import fault_lookup
+from fault_index import ensure_indexes
+from lookup_cache import SingleFlight
+
+CLIENTS = 8
+WAIT_SECONDS = 5
+
+
+def wait_until(condition, timeout=WAIT_SECONDS):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for concurrent callers")
+        time.sleep(0.001)
+
+
+def run_concurrently(target, count=CLIENTS):
+    """Call target(i) from count threads started together; return the results."""
+    results = [None] * count
+    errors = []
+    start = threading.Barrier(count)
+
+    def worker(i):
+        start.wait()
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(WAIT_SECONDS * 2)
+    return results, errors
+
+
+def test_single_flight_runs_once_and_shares_result():
+    flight = SingleFlight()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        # Keep the flight open until every other caller has joined it
+        wait_until(lambda: flight.stats()['shared'] == CLIENTS - 1)
+        return "result"
+
+    results, errors = run_concurrently(lambda i: flight.do("00532", compute))
+
+    assert not errors
+    assert len(calls) == 1
+    assert results == ["result"] * CLIENTS
+    assert flight.stats() == {'in_flight': 0, 'shared': CLIENTS - 1}
+
+
+def test_single_flight_shares_exceptions():
+    flight = SingleFlight()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        wait_until(lambda: flight.stats()['shared'] == CLIENTS - 1)
+        raise ValueError("database locked")
+
+    _, errors = run_concurrently(lambda i: flight.do("00532", compute))
+
+    assert len(calls) == 1
+    assert len(errors) == CLIENTS
+    assert all(isinstance(e, ValueError) for e in errors)
+    # A failed flight is not remembered
+    assert flight.do("00532", lambda: "retried") == "retried"
+
+
+def test_single_flight_batches_compute_only_missing_keys():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    computed = []
+
+    def slow(keys):
+        computed.append(keys)
+        started.set()
+        release.wait(WAIT_SECONDS)
+        return {key: key.lower() for key in keys}
+
+    first = threading.Thread(target=flight.run, args=(["A", "B"], slow))
+    first.start()
+    started.wait(WAIT_SECONDS)
+
+    results = {}
+
+    def second():
+        results.update(flight.run(["B", "C"], lambda keys: computed.append(keys) or {k: k.lower() for k in keys}))
+
+    waiter = threading.Thread(target=second)
+    waiter.start()
+    wait_until(lambda: flight.stats()['shared'] == 1)
+    release.set()
+    first.join(WAIT_SECONDS)
+    waiter.join(WAIT_SECONDS)
+
+    assert computed == [["A", "B"], ["C"]]
+    assert results == {"B": "b", "C": "c"}
+
+
+@pytest.fixture
+def app_db(tmp_path, monkeypatch):
+    """Point the app at an indexed copy of the database with empty caches."""
+    if not os.path.exists("fault_codes.db"):
+        pytest.skip("fault_codes.db not available")
+    db_path = tmp_path / "fault_codes.db"
+    shutil.copy("fault_codes.db", db_path)
+    conn = sqlite3.connect(db_path)
+    ensure_indexes(conn)
+    conn.close()
+    # A new DB_PATH gets a FaultCodeIndex of its own, with empty caches
+    monkeypatch.setattr(app_flask, "DB_PATH", str(db_path))
+    monkeypatch.setattr(app_flask, "page_flight", SingleFlight())
+    for cache in (app_flask.page_cache, app_flask.compressed_cache):
+        cache.clear()
+    yield db_path
+    for cache in (app_flask.page_cache, app_flask.compressed_cache):
+        cache.clear()
+
+
+def count_executions(monkeypatch, ready):
+    """Wrap lookup_code so it counts calls and waits until ready() is true."""
+    calls = []
+    lookup_code = fault_lookup.lookup_code
+
+    def counting_lookup(cursor, fault_code, **options):
+        calls.append(fault_code)
+        wait_until(ready)
+        return lookup_code(cursor, fault_code, **options)
+
+    monkeypatch.setattr(fault_lookup, "lookup_code", counting_lookup)
+    return calls
+
+
+@pytest.mark.parametrize("code", ["00532", "0053", "00352"])
+def test_concurrent_lookups_query_database_once(app_db, monkeypatch, code):
+    calls = count_executions(monkeypatch, lambda: app_flask.fault_code_index().flight.stats()['shared'] == CLIENTS - 1)
+
+    results, errors = run_concurrently(lambda i: app_flask.cached_lookups([code])[code])
+
+    assert not errors
+    assert calls == [code]
+    assert all(result == results[0] for result in results)
+
+
+def test_concurrent_page_requests_query_database_once(app_db, monkeypatch):
+    # The page ETag needs the lookup, so requests meet in the lookup flight
+    calls = count_executions(monkeypatch, lambda: app_flask.fault_code_index().flight.stats()['shared'] == CLIENTS - 1)
+
+    def request_page(i):
+        with app_flask.app.test_client() as client:
+            response = client.get("/?code=00532")
+            return response.status_code, response.get_data()
+
+    results, errors = run_concurrently(request_page)
+
+    assert not errors
+    assert calls == ["00532"]
+    assert {status for status, _ in results} == {200}
+    assert len({body for _, body in results}) == 1